@@ -0,0 +1,113 @@
+import numpy as np
+
+from store import MISSING, codes, sec_to_time
+
+
+def _columns(cols):
+    path_offsets = np.frombuffer(cols.path_offsets, dtype=np.uint32).astype(np.int64)
+    path_ids = np.frombuffer(cols.path_ids, dtype=np.uint16).astype(np.int64)
+    leg_offsets = np.frombuffer(cols.leg_offsets, dtype=np.uint32).astype(np.int64)
+    leg_secs = np.frombuffer(cols.leg_secs, dtype=np.int32).astype(np.int64)
+    return path_offsets, path_ids, leg_offsets, leg_secs
+
+
+def leg_pairs(cols):
+    # Для каждого записанного перегона: (участник, откуда, куда, секунды, годен ли)
+    path_offsets, path_ids, leg_offsets, leg_secs = _columns(cols)
+    n = len(cols)
+    leg_counts = np.diff(leg_offsets)
+    runner = np.repeat(np.arange(n), leg_counts)
+    k = np.arange(len(leg_secs)) - leg_offsets[runner]
+    path_len = np.diff(path_offsets)[runner]
+    # Время k-го перегона — от path[k] до path[k+1]; перегоны сверх пути не к чему привязать
+    has_pair = k + 1 < path_len
+    pos = np.where(has_pair, path_offsets[runner] + k, 0)
+    src = path_ids[pos] if len(path_ids) else np.zeros(len(pos), dtype=np.int64)
+    dst = path_ids[np.where(has_pair, pos + 1, 0)] if len(path_ids) else src
+    valid = has_pair & (leg_secs != MISSING)
+    return runner, src, dst, leg_secs, valid
+
+
+# Статистика по перегонам группы: перегон — упорядоченная пара КП, ведь порядок у каждого свой
+def leg_stats(cols):
+    runner, src, dst, secs, valid = leg_pairs(cols)
+    total = len(secs)
+
+    leg = np.full(total, -1, dtype=np.int64)
+    loss = np.full(total, MISSING, dtype=np.int64)
+    rank = np.zeros(total, dtype=np.int64)
+    uniq = np.zeros(0, dtype=np.int64)
+
+    if valid.any():
+        keys = src * 65536 + dst
+        uniq, inverse = np.unique(keys[valid], return_inverse=True)
+        leg[valid] = inverse
+
+        order = np.lexsort((secs[valid], inverse))
+        s_leg = inverse[order]
+        s_secs = secs[valid][order]
+        counts = np.bincount(inverse, minlength=len(uniq))
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+        best = np.minimum.reduceat(s_secs, starts)
+        median = (s_secs[starts + (counts - 1) // 2] + s_secs[starts + counts // 2]) / 2
+
+        # Место с учётом равных: у одинакового времени одно место (1, 2, 2, 4)
+        is_new = np.ones(len(s_secs), dtype=bool)
+        is_new[1:] = (s_leg[1:] != s_leg[:-1]) | (s_secs[1:] != s_secs[:-1])
+        first = np.maximum.accumulate(np.where(is_new, np.arange(len(s_secs)), 0))
+        rank[np.flatnonzero(valid)[order]] = first - starts[s_leg] + 1
+        loss[valid] = secs[valid] - best[inverse]
+
+    legs = []
+    for i, key in enumerate(uniq.tolist()):
+        med = float(median[i])
+        legs.append({
+            "from": codes.code(key // 65536),
+            "to": codes.code(key % 65536),
+            "runners": int(counts[i]),
+            "best": sec_to_time(int(best[i])),
+            "best_sec": int(best[i]),
+            "median": sec_to_time(int(med + 0.5)),
+            "median_sec": med,
+        })
+
+    # Строки участников выровнены с их leg_times: индекс перегона, отставание, место (-1/0 — нет времени)
+    bounds = np.frombuffer(cols.leg_offsets, dtype=np.uint32).tolist()
+    leg_l, loss_l, rank_l = leg.tolist(), loss.tolist(), rank.tolist()
+    runners = [
+        {"leg": leg_l[a:b], "loss": loss_l[a:b], "rank": rank_l[a:b]}
+        for a, b in zip(bounds, bounds[1:])
+    ]
+    return {"group": cols.name, "legs": legs, "runners": runners}
+
+
+# Сколько участников пробежали каждый перегон: разреженная матрица в виде (ключи пар, счётчики)
+def leg_usage(cols):
+    path_offsets = np.frombuffer(cols.path_offsets, dtype=np.uint32).astype(np.int64)
+    path_ids = np.frombuffer(cols.path_ids, dtype=np.uint16).astype(np.int64)
+    if len(path_ids) < 2:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    runner = np.repeat(np.arange(len(cols)), np.diff(path_offsets))
+    same = runner[:-1] == runner[1:]
+    keys = path_ids[:-1][same] * 65536 + path_ids[1:][same]
+    # Один участник считается на перегоне один раз, даже если пробежал его дважды
+    per_runner = np.unique(runner[:-1][same] * (1 << 32) + keys)
+    return np.unique(per_runner & 0xFFFFFFFF, return_counts=True)
+
+
+def merge_usage(usages):
+    usages = list(usages)
+    if not usages:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    keys = np.concatenate([k for k, _ in usages])
+    counts = np.concatenate([c for _, c in usages])
+    uniq, inverse = np.unique(keys, return_inverse=True)
+    return uniq, np.bincount(inverse, weights=counts, minlength=len(uniq)).astype(np.int64)
+
+
+def usage_legs(usage):
+    keys, counts = usage
+    order = np.argsort(-counts, kind="stable")
+    return [(codes.code(k // 65536), codes.code(k % 65536), c)
+            for k, c in zip(keys[order].tolist(), counts[order].tolist())]
@@ -0,0 +1,214 @@
+# Синтетическое соревнование в формате SFR: splits.htm, groups.txt, coordinates.txt
+# Масштаб 1 — как настоящий протокол (32 группы, ~1400 строк), 10/100/1000 — во столько раз больше.
+# Запуск: python bench/generate_event.py --scale 10 --out bench_event/x10 [--headers h2|span] [--xml] [--entries]
+# С --xml рядом пишется тот же протокол в IOF XML 3.0 (results.xml), с --entries — заявка participants.txt.
+import argparse
+import math
+import os
+import random
+from xml.sax.saxutils import escape
+
+BASE_GROUPS = 32
+BASE_RUNNERS = 43
+BASE_CONTROLS = 60
+AGES = ["09", "10", "11", "12", "13", "14", "16", "18", "20", "21", "35", "45", "55", "65", "75", "80"]
+SURNAMES = ["БОЛДИН", "ПОВИНСК", "СИДОРОВ", "КОРОЛЁВ", "ПОЛЕНОК", "СМИРНОВ", "КУЗНЕЦОВ", "ПОПОВ", "ВАСИЛЬЕВ", "ЁЛКИН"]
+NAMES = {"Ж": ["МАРИЯ", "АНАСТАСИЯ", "ДАРЬЯ", "УСТИНИЯ", "ОЛЬГА", "АННА"],
+         "М": ["ИВАН", "АЛЕКСЕЙ", "ПЁТР", "СЕРГЕЙ", "ФЁДОР", "МАТВЕЙ"]}
+CLUBS = ["Динамо", "Спартак", "Вымпел", "Азимут", "Лесник", "Ориента", "Буревестник"]
+STYLE = """<style>
+table.rezult {border-collapse: collapse;}
+span.name  {font-family: 'Arial Narrow';font-style: italic; font-size: 10pt;font-weight: normal;color: #112255;text-align: left;}
+span.group  {font-family: 'Arial Narrow';font-size: 12pt;font-weight: bold;}
+</style>"""
+
+
+def event_shape(scale):
+    # Растут и число групп, и их размер — как у крупных стартов
+    factor = max(1, round(math.sqrt(scale)))
+    return BASE_GROUPS * factor, max(1, round(BASE_RUNNERS * scale / factor)), BASE_CONTROLS * factor
+
+
+def group_names(count):
+    names = []
+    for i in range(count):
+        sex = "ЖМ"[(i // len(AGES)) % 2]
+        suffix = "" if i < 2 * len(AGES) else f"-{i // (2 * len(AGES)) + 1}"
+        names.append(f"{sex}{AGES[i % len(AGES)]}{suffix}")
+    return names
+
+
+def control_codes(count):
+    codes = []
+    code = 31
+    while len(codes) < count:
+        if code != 240:
+            codes.append(str(code))
+        code += 1
+    return codes
+
+
+def clock(sec):
+    return f"{sec // 60}:{sec % 60:02d}"
+
+
+def make_course(rnd, controls):
+    kps = rnd.sample(controls, rnd.randint(10, 25))
+    # Начало и конец дистанции общие, середина — выбор: порядок каждый участник выбирает сам
+    fixed_head = rnd.randint(1, 3)
+    fixed_tail = rnd.randint(2, 4)
+    free = max(0, len(kps) - fixed_head - fixed_tail)
+    return {"start": rnd.choice(["С1", "С2"]), "kps": kps, "head": fixed_head, "free": free}
+
+
+def runner_row(rnd, course, place, number, name, dnf):
+    kps = course["kps"]
+    head, free = course["head"], course["free"]
+    middle = kps[head:head + free]
+    rnd.shuffle(middle)
+    order = kps[:head] + middle + kps[head + free:]
+
+    cells = []
+    splits = []
+    total = 0
+    missing = rnd.randrange(len(order)) if dnf else None
+    for i, kp in enumerate(order):
+        if i == missing:
+            cells.append("<td><nobr></td>")
+            splits.append((kp, None))
+            continue
+        leg = rnd.randint(15, 420)
+        total += leg
+        splits.append((kp, total))
+        fixed = not (head <= i < head + free)
+        mark = f"({rnd.randint(1, 40)})" if fixed else f"[{kp}]"
+        leg_mark = f"({rnd.randint(1, 40)})" if fixed else ""
+        second = "" if i == 0 else f"{clock(leg)}{leg_mark}"
+        bold = rnd.random() < 0.05
+        if bold:
+            cells.append(f"<td><b><nobr>{clock(total)}{mark}</b><br>{second}</td>")
+        else:
+            cells.append(f"<td><nobr>{clock(total)}{mark}<br>{second}</td>")
+    leg = rnd.randint(15, 90)
+    total += leg
+    cells.append(f"<td><nobr>{clock(total)}({place})<br>{clock(leg)}({place})</td>")
+
+    # Как в протоколах SFR и iof.format_result: ч:мм:сс, сошедшие — "снят"
+    result = "снят" if dnf else f"{total // 3600:02d}:{total // 60 % 60:02d}:{total % 60:02d}"
+    style = "style='background: #FFFFFF;'" if place % 2 else " class = 'yl'"
+    row = (f"<tr {style}><td><nobr>{place}</td><td><nobr>{number}</td><td class = 'cr'><nobr>{name}</td>"
+           f"<td><nobr>{result}</td><td><nobr>{'' if dnf else place}</td><td><nobr></td>{''.join(cells)}</tr>\n")
+    return row, {"name": name, "time": None if dnf else total, "splits": splits}
+
+
+def person_result_xml(record):
+    family, _, given = record["name"].partition(" ")
+    splits = "".join(
+        f'<SplitTime status="Missing"><ControlCode>{kp}</ControlCode></SplitTime>' if t is None
+        else f"<SplitTime><ControlCode>{kp}</ControlCode><Time>{t}</Time></SplitTime>"
+        for kp, t in record["splits"])
+    status = "MissingPunch" if record["time"] is None else "OK"
+    time = "" if record["time"] is None else f"<Time>{record['time']}</Time>"
+    return (f"<PersonResult><Person><Name><Family>{escape(family)}</Family><Given>{escape(given)}</Given></Name></Person>"
+            f"<Result>{time}<Status>{status}</Status>{splits}</Result></PersonResult>\n")
+
+
+def entry_line(group, start, number, record):
+    # Год и коллектив — от номера, а не из rnd: протокол с тем же seed не меняется
+    family, _, given = record["name"].partition(" ")
+    path = [start] + [kp for kp, _ in record["splits"]] + ["Ф1"]
+    return (f"{group}\t{number}\t{family}\t{given}\t{1950 + number % 60}\t"
+            f"{CLUBS[number % len(CLUBS)]}\t{' '.join(path)}\n")
+
+
+def header_row(course):
+    kps = course["kps"]
+    head, free = course["head"], course["free"]
+    cells = ["№ п/п ", "Номер ", "Фамилия, Имя ", "Результат ", "Место ", "Отставание "]
+    for i, kp in enumerate(kps):
+        fixed = not (head <= i < head + free)
+        cells.append(f"#{i + 1} ({kp}) " if fixed else f"#{i + 1} ")
+    cells.append("#F(240) ")
+    return "<tr>" + "".join(f"<th>{c}</th>" for c in cells) + "</tr>\n"
+
+
+def generate(out_dir, scale=1, seed=1, headers="h2", xml=False, entries=False):
+    rnd = random.Random(seed)
+    groups_count, runners_per_group, controls_count = event_shape(scale)
+    groups = group_names(groups_count)
+    controls = control_codes(controls_count)
+    os.makedirs(out_dir, exist_ok=True)
+
+    with open(os.path.join(out_dir, "coordinates.txt"), "w", encoding="utf-8") as f:
+        for kp in ["С1", "С2"] + controls + ["Ф1"]:
+            f.write(f"{kp}:({rnd.uniform(10, 287):.1f}, {rnd.uniform(10, 200):.1f})\n")
+
+    courses = {g: make_course(rnd, controls) for g in groups}
+    with open(os.path.join(out_dir, "groups.txt"), "w", encoding="utf-8") as f:
+        for g in groups:
+            course = courses[g]
+            f.write(f"{g}: {course['start']} {' '.join(course['kps'])} Ф1\n")
+
+    nav = "    ".join(f'<a href="#{g}">{g}</a>' for g in groups)
+    rows = 0
+    xml_file = open(os.path.join(out_dir, "results.xml"), "w", encoding="utf-8") if xml else None
+    if xml_file:
+        xml_file.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                       '<ResultList xmlns="http://www.orienteering.org/datastandard/3.0" iofVersion="3.0" status="Complete">\n'
+                       '<Event><Name>Синтетический старт</Name></Event>\n')
+    entries_file = open(os.path.join(out_dir, "participants.txt"), "w", encoding="utf-8") if entries else None
+    with open(os.path.join(out_dir, "splits.htm"), "w", encoding="utf-8") as f:
+        f.write(f"<html><head><meta charset='utf-8'>{STYLE}</head><body>\n")
+        f.write("<h1>Синтетический старт.     Промежуточные времена</h1>\n")
+        for g in groups:
+            sex = g[0]
+            count = max(1, round(runners_per_group * rnd.uniform(0.5, 1.5)))
+            if headers == "h2":
+                f.write(f"<a name=\"{g}\"></a><span class='group'>{nav}    </span><br><h2>{g}</h2>\n")
+            else:
+                f.write(f"<a name=\"{g}\"></a><span class='group'>{g} ({count})</span><br>\n")
+            f.write("<table class='rezult'>\n")
+            f.write(header_row(courses[g]))
+            if xml_file:
+                xml_file.write(f"<ClassResult><Class><Name>{g}</Name></Class>\n")
+            for place in range(1, count + 1):
+                name = f"{rnd.choice(SURNAMES)}{'А' if sex == 'Ж' else ''} {rnd.choice(NAMES[sex])}"
+                dnf = rnd.random() < 0.03
+                row, record = runner_row(rnd, courses[g], place, 3000 + rows, name, dnf)
+                f.write(row)
+                if xml_file:
+                    xml_file.write(person_result_xml(record))
+                if entries_file:
+                    entries_file.write(entry_line(g, courses[g]["start"], 3000 + rows, record))
+                rows += 1
+            f.write("</table><br>\n")
+            if xml_file:
+                xml_file.write("</ClassResult>\n")
+        f.write("</body>\n</html>\n")
+    if xml_file:
+        xml_file.write("</ResultList>\n")
+        xml_file.close()
+    if entries_file:
+        entries_file.close()
+
+    return {"groups": groups_count, "runners": rows, "controls": len(controls) + 3,
+            "splits_bytes": os.path.getsize(os.path.join(out_dir, "splits.htm"))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Генератор синтетического соревнования")
+    parser.add_argument("--scale", type=int, default=10)
+    parser.add_argument("--out", default=None)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--headers", choices=("h2", "span"), default="h2")
+    parser.add_argument("--xml", action="store_true", help="дополнительно записать results.xml (IOF XML 3.0)")
+    parser.add_argument("--entries", action="store_true", help="дополнительно записать заявку participants.txt")
+    args = parser.parse_args()
+    out_dir = args.out or os.path.join("bench_event", f"x{args.scale}")
+    info = generate(out_dir, args.scale, args.seed, args.headers, args.xml, args.entries)
+    print(f"[SUCCESS] {out_dir}: групп {info['groups']}, участников {info['runners']}, "
+          f"КП {info['controls']}, splits.htm {info['splits_bytes'] / 1e6:.1f} МБ")
+
+
+if __name__ == "__main__":
+    main()
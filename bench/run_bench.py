@@ -0,0 +1,141 @@
+# Поэтапный бенчмарк на синтетических соревнованиях: разбор, кеш, страница, JSON, PDF
+# Запуск: python bench/run_bench.py [--scales 1 10 100] [--out bench_results.json]
+# Каждый масштаб прогоняется в отдельном процессе, чтобы этапы не делили кеши и память.
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.generate_event import generate
+
+
+def timed(results, name, fn):
+    start_time = time.perf_counter()
+    value = fn()
+    results[name] = round(time.perf_counter() - start_time, 4)
+    return value
+
+
+def run_stages(event_dir):
+    os.chdir(ROOT)
+    work_dir = tempfile.mkdtemp(prefix="bench_")
+    import main
+
+    main.SPLITS_FILE = os.path.join(event_dir, "splits.htm")
+    main.GROUPS_FILE = os.path.join(event_dir, "groups.txt")
+    main.COORDS_FILE = os.path.join(event_dir, "coordinates.txt")
+    # Заявка — только своя: participants.txt из корня репозитория в замеры не попадает
+    main.PARTICIPANTS_FILE = os.path.join(event_dir, "participants.txt")
+    # И протокол XML тоже: лежащий в корне results.xml иначе подменил бы синтетический splits.htm
+    main.RESULTS_XML = os.path.join(event_dir, "results.xml")
+    main.CACHE_FILE = os.path.join(work_dir, "cache_participants.json")
+    main.CACHE_POINTS = os.path.join(work_dir, "cache_points.json")
+    main.TILES_DIR = os.path.join(work_dir, "cache_tiles")
+
+    stages = {}
+    timed(stages, "groups", main.load_group_kps)
+    timed(stages, "points_cold", main.load_all_points)
+    main.publish(points_data=None, distance_data=None)
+    timed(stages, "points_cache", main.load_all_points)
+
+    timed(stages, "parse", main.parse_splits_html)
+    timed(stages, "ingest", lambda: main.refresh_participants(force=True))
+    runners = main.current().participants.total()
+
+    main.publish(participants=None)
+    timed(stages, "cache_load", main._load_participants)
+    main.data_ready.set()
+
+    client = main.app.test_client()
+    timed(stages, "page_cold", lambda: client.get("/"))
+    timed(stages, "page_warm", lambda: client.get("/"))
+    timed(stages, "data_json_cold", lambda: client.get("/data.json", headers={"Accept-Encoding": "gzip"}))
+    timed(stages, "data_json_warm", lambda: client.get("/data.json", headers={"Accept-Encoding": "gzip"}))
+    participants = main.current().participants
+    group = max(participants, key=lambda g: len(participants[g]))
+    timed(stages, "group_shard", lambda: client.get(f"/api/groups/{group}", headers={"Accept-Encoding": "gzip"}))
+    timed(stages, "leg_stats", lambda: client.get(f"/api/groups/{group}/leg-stats"))
+
+    cols = participants[group]
+    runner = cols[0]
+    points, map_size = main.load_all_points()
+    html = timed(stages, "pdf_html", lambda: main.build_route_html(
+        runner["name"], group, runner["result"], "", runner["path"], main.current().group_kps.get(group, []), points, map_size))
+    try:
+        timed(stages, "pdf_render", lambda: main.render_pdf(html))
+    except (ImportError, OSError) as e:
+        stages["pdf_render"] = None
+        print(f"[WARNING] PDF пропущен: WeasyPrint недоступен ({e})", file=sys.stderr)
+
+    return {
+        "runners": runners,
+        "groups": len(main.current().participants),
+        "splits_bytes": os.path.getsize(main.SPLITS_FILE),
+        "stages": stages,
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк этапов обработки")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10])
+    parser.add_argument("--events-dir", default=os.path.join(ROOT, "bench_event"))
+    parser.add_argument("--out", default=None, help="куда записать JSON (по умолчанию stdout)")
+    parser.add_argument("--stages", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stages:
+        print(json.dumps(run_stages(args.stages)))
+        return
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": [],
+    }
+    for scale in args.scales:
+        event_dir = os.path.join(args.events_dir, f"x{scale}")
+        if not os.path.exists(os.path.join(event_dir, "splits.htm")):
+            print(f"[INFO] Генерация соревнования x{scale}...", file=sys.stderr)
+            generate(event_dir, scale)
+        print(f"[INFO] Замеры x{scale}...", file=sys.stderr)
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "--stages", event_dir],
+                             capture_output=True, text=True)
+        if out.returncode != 0:
+            print(out.stderr, file=sys.stderr)
+            report["results"].append({"scale": scale, "error": out.stderr.strip().splitlines()[-1:]})
+            continue
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        result["scale"] = scale
+        report["results"].append(result)
+        stages = ", ".join(f"{k} {v:.3f}" for k, v in result["stages"].items() if v is not None)
+        print(f"[SUCCESS] x{scale}: {result['runners']} участников — {stages}", file=sys.stderr)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"[INFO] Результаты сохранены: {args.out}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
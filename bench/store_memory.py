@@ -0,0 +1,80 @@
+# Сравнение памяти: исходный dict-of-lists против ParticipantStore
+# Запуск: python bench/store_memory.py [--json]
+import gc
+import json
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from store import ParticipantStore
+
+SIZES = (1_000, 10_000, 100_000)
+GROUPS = 32
+SURNAMES = ["ИВАНОВ", "ПЕТРОВА", "СИДОРОВ", "КОРОЛЁВА", "СМИРНОВ", "КУЗНЕЦОВА", "ПОПОВ", "ВАСИЛЬЕВА"]
+NAMES = ["ИВАН", "МАРИЯ", "АЛЕКСЕЙ", "ДАРЬЯ", "ПЁТР", "АННА", "СЕРГЕЙ", "ОЛЬГА"]
+
+
+def make_participants(n, seed=1):
+    # Форма как у parse_splits_html: новые строки на каждого участника, как после regex
+    rnd = random.Random(seed)
+    groups = [f"{'ЖМ'[i % 2]}{10 + i:02d}" for i in range(GROUPS)]
+    participants = {g: [] for g in groups}
+    for i in range(n):
+        g = groups[i % GROUPS]
+        legs = rnd.randint(8, 25)
+        kps = [str(rnd.randint(31, 140)) for _ in range(legs)]
+        leg_times = [f"{rnd.randint(0, 9)}:{rnd.randint(0, 59):02d}" for _ in range(legs)]
+        participants[g].append({
+            "name": f"{i // GROUPS + 1}. {rnd.choice(SURNAMES)} {rnd.choice(NAMES)}",
+            "group": g,
+            "path": ["С1"] + kps + ["Ф1"],
+            "leg_times": leg_times,
+            "result": f"00:{rnd.randint(10, 99):02d}:{rnd.randint(0, 59):02d}",
+        })
+    return participants
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    obj = build()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, size
+
+
+def run():
+    results = []
+    for n in SIZES:
+        _, dict_bytes = measure(lambda: make_participants(n))
+
+        def build_store():
+            participants = make_participants(n)
+            store = ParticipantStore.from_dict(participants)
+            del participants
+            return store
+
+        store, store_bytes = measure(build_store)
+        if n == SIZES[0]:
+            assert store.to_dict() == make_participants(n), "экспорт не совпадает с исходными данными"
+        results.append({
+            "runners": n,
+            "dict_bytes": dict_bytes,
+            "store_bytes": store_bytes,
+            "ratio": round(dict_bytes / store_bytes, 2),
+        })
+    return results
+
+
+if __name__ == "__main__":
+    results = run()
+    if "--json" in sys.argv:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'участников':>10} {'dict, МБ':>10} {'store, МБ':>10} {'выигрыш':>8}")
+        for r in results:
+            print(f"{r['runners']:>10} {r['dict_bytes'] / 2**20:>10.1f} {r['store_bytes'] / 2**20:>10.1f} {r['ratio']:>7}x")
@@ -0,0 +1,148 @@
+# Нагрузочная проверка снимков данных: читатели в потоках сверяют участников с дистанциями их групп,
+# пока писатель по кругу перезагружает два разных соревнования (groups.txt + splits.htm).
+# Запуск: python bench/stress_snapshot.py [--seconds 10] [--readers 8]
+# Разрыв — участник, чей путь не укладывается в КП своей группы: участники из одной версии, дистанции из другой.
+# Для сравнения считается то же при чтении без снимка (два обращения к последней версии подряд) —
+# там разрывы обязаны находиться, иначе проверка ничего не доказывает.
+import argparse
+import contextlib
+import gc
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.generate_event import generate
+
+
+def torn_groups(participants, group_kps, groups):
+    # Группы, где путь хотя бы одного участника выходит за КП группы
+    torn = 0
+    for g in groups:
+        cols = participants.get(g)
+        kps = group_kps.get(g)
+        if cols is None or kps is None:
+            torn += cols is not kps
+            continue
+        allowed = set(kps)
+        if any(not allowed.issuperset(cols.path_codes(i)[1:-1]) for i in range(len(cols))):
+            torn += 1
+    return torn
+
+
+class Counters:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def add(self, **values):
+        with self.lock:
+            for name, value in values.items():
+                self.values[name] = self.values.get(name, 0) + value
+
+
+def request_reader(main, groups, counters, stop):
+    # Как запрос: снимок закрепляется в before_request, чтения идут вперемешку с публикациями
+    client = main.app.test_client()
+    rnd = random.Random()
+    while not stop.is_set():
+        sample = rnd.sample(groups, 3)
+        with main.app.test_request_context("/"):
+            main.wait_for_data()
+            participants = main.load_participants()
+            time.sleep(0.001)
+            torn = torn_groups(participants, main.current().group_kps, sample)
+        status = client.get(f"/api/groups/{sample[0]}/runners?limit=50").status_code
+        counters.add(reads=1, torn=torn, http_errors=int(status != 200))
+
+
+def bare_reader(main, groups, counters, stop):
+    # Без снимка: участники и дистанции — двумя отдельными чтениями, как раньше из глобальных переменных
+    rnd = random.Random()
+    while not stop.is_set():
+        sample = rnd.sample(groups, 3)
+        participants = main.snapshots.current.participants
+        time.sleep(0.001)
+        torn = torn_groups(participants, main.snapshots.current.group_kps, sample)
+        counters.add(bare_reads=1, bare_torn=torn)
+
+
+def writer(main, sources, work_dir, counters, stop):
+    turn = 0
+    while not stop.is_set():
+        turn += 1
+        source = sources[turn % 2]
+        for name in ("groups.txt", "splits.htm"):
+            shutil.copyfile(os.path.join(source, name), os.path.join(work_dir, name + ".tmp"))
+            os.replace(os.path.join(work_dir, name + ".tmp"), os.path.join(work_dir, name))
+        main.reload_data()
+        counters.add(swaps=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Проверка атомарной замены снимков данных")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--scale", type=int, default=1)
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    tmp = tempfile.mkdtemp(prefix="stress_")
+    sources = [os.path.join(tmp, "a"), os.path.join(tmp, "b")]
+    for seed, source in enumerate(sources, 1):
+        generate(source, args.scale, seed=seed)
+    work_dir = os.path.join(tmp, "work")
+    os.makedirs(work_dir)
+    for name in ("groups.txt", "splits.htm"):
+        shutil.copyfile(os.path.join(sources[0], name), os.path.join(work_dir, name))
+
+    import main as app_main
+    app_main.SPLITS_FILE = os.path.join(work_dir, "splits.htm")
+    app_main.GROUPS_FILE = os.path.join(work_dir, "groups.txt")
+    app_main.COORDS_FILE = os.path.join(sources[0], "coordinates.txt")
+    app_main.RESULTS_XML = os.path.join(work_dir, "results.xml")
+    app_main.PARTICIPANTS_FILE = os.path.join(work_dir, "participants.txt")
+    app_main.CACHE_FILE = os.path.join(work_dir, "cache_participants.json")
+    app_main.CACHE_POINTS = os.path.join(work_dir, "cache_points.json")
+    app_main.TILES_DIR = os.path.join(work_dir, "cache_tiles")
+
+    # Журнал перезагрузок в консоль не нужен: он тормозит писателя и заслоняет итог
+    with contextlib.redirect_stdout(io.StringIO()):
+        app_main.load_data()
+        groups = list(app_main.current().participants)
+        counters = Counters()
+        stop = threading.Event()
+        threads = [threading.Thread(target=writer, args=(app_main, sources, work_dir, counters, stop))]
+        threads += [threading.Thread(target=request_reader, args=(app_main, groups, counters, stop))
+                    for _ in range(args.readers)]
+        threads.append(threading.Thread(target=bare_reader, args=(app_main, groups, counters, stop)))
+        for thread in threads:
+            thread.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+    gc.collect()
+
+    values = counters.values
+    alive = len(app_main.snapshots.alive)
+    print(f"[INFO] Перезагрузок: {values.get('swaps', 0)}, снимков в памяти после остановки: {alive}")
+    print(f"[INFO] Со снимком: чтений {values.get('reads', 0)}, разрывов {values.get('torn', 0)}, "
+          f"ошибок HTTP {values.get('http_errors', 0)}")
+    print(f"[INFO] Без снимка: чтений {values.get('bare_reads', 0)}, разрывов {values.get('bare_torn', 0)}")
+    shutil.rmtree(tmp, ignore_errors=True)
+    if values.get("torn", 0) or values.get("http_errors", 0) or alive > 1:
+        print("[ERROR] Снимки не изолируют читателей")
+        sys.exit(1)
+    print("[SUCCESS] Разрывов нет")
+
+
+if __name__ == "__main__":
+    main()
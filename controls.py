@@ -0,0 +1,64 @@
+import math
+
+# Попадание в КП считаем по кругу HIT_RADIUS * r: обычный КП рисуется радиусом 1.2r, финиш — 1.8r
+HIT_RADIUS = 1.8
+FINISH = "Ф1"
+
+
+class ControlGrid:
+    # Равномерная сетка по пиксельным координатам КП: в ячейке — КП, чей центр в неё попал.
+    # Строится один раз на версию точек; запросы смотрят только ячейки, задетые прямоугольником.
+    def __init__(self, points, map_size, cell=None):
+        width, height = map_size
+        self.map_size = (width, height)
+        self.count = len(points)
+        self.reach = HIT_RADIUS * max((p.get("r", 20) for p in points.values()), default=20)
+        # В среднем пара КП на ячейку, но не меньше области попадания — иначе «под точкой» смотрит много ячеек
+        self.cell = cell or max(2 * self.reach, 2 * math.sqrt(width * height / max(1, self.count)))
+        self.cells = {}
+        for kp, p in points.items():
+            key = (int(p["cx"] // self.cell), int(p["cy"] // self.cell))
+            self.cells.setdefault(key, []).append((kp, p["cx"], p["cy"], p.get("r", 20)))
+
+    def within(self, x0, y0, x1, y1, margin=0):
+        # КП с центром в прямоугольнике (расширенном на margin), по ячейкам
+        x0, x1 = sorted((x0, x1))
+        y0, y1 = sorted((y0, y1))
+        x0, y0, x1, y1 = x0 - margin, y0 - margin, x1 + margin, y1 + margin
+        cx0, cx1 = int(x0 // self.cell), int(x1 // self.cell)
+        cy0, cy1 = int(y0 // self.cell), int(y1 // self.cell)
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(self.cells):
+            # Прямоугольник больше, чем занятых ячеек: дешевле пройти занятые
+            keys = [k for k in self.cells if cx0 <= k[0] <= cx1 and cy0 <= k[1] <= cy1]
+        else:
+            keys = [(i, j) for i in range(cx0, cx1 + 1) for j in range(cy0, cy1 + 1) if (i, j) in self.cells]
+        found = []
+        for key in keys:
+            for item in self.cells[key]:
+                if x0 <= item[1] <= x1 and y0 <= item[2] <= y1:
+                    found.append(item)
+        return found
+
+    def at(self, x, y, tolerance=0):
+        # КП под точкой: [(расстояние, kp, cx, cy, r)], ближайшие первыми
+        hits = []
+        reach = self.reach + tolerance
+        for kp, cx, cy, r in self.within(x - reach, y - reach, x + reach, y + reach):
+            distance = math.hypot(cx - x, cy - y)
+            if distance <= HIT_RADIUS * r + tolerance:
+                hits.append((distance, kp, cx, cy, r))
+        hits.sort()
+        return hits
+
+
+def route_marks(start, kps, path, points, grid=None, bbox=None):
+    # КП на карте участника: свои (старт, КП группы, финиш) и взятые чужие -> [(kp, своя ли)].
+    # С bbox — только попавшие в область (с запасом на размер знака), выборка через сетку
+    own = set(kps)
+    own.update((start, FINISH))
+    visited = set(path)
+    if bbox is None:
+        candidates = points
+    else:
+        candidates = [item[0] for item in grid.within(*bbox, margin=grid.reach)]
+    return [(kp, kp in own) for kp in candidates if kp in own or kp in visited]
@@ -0,0 +1,111 @@
+import sys
+from array import array
+from itertools import chain
+
+from store import codes
+
+# Заявка participants.txt: дистанция, номер, фамилия, имя, год, коллектив, КП через пробел — по строке
+# на участника, поля через табуляцию. Одинаковые строки КП разбираются и проверяются один раз.
+FIELDS = 7
+FINISH = "Ф1"
+
+
+def is_start(kp):
+    return kp.startswith("С")
+
+
+class Route:
+    __slots__ = ("ids",)
+
+    def __init__(self, controls, known, unknown, line):
+        ids = list(map(known.get, controls.split()))
+        # Маршрут без части КП нарисовал бы линию мимо них и занизил дистанцию — такой не берём
+        if None in ids:
+            for kp, kp_id in zip(controls.split(), ids):
+                if kp_id is None:
+                    unknown.setdefault(kp, line)
+            self.ids = None
+        else:
+            self.ids = array("H", ids) if len(ids) >= 2 else None
+
+
+class CourseEntries:
+    # Заявленные на одну дистанцию: столбцы как в GroupColumns, пути — общие объекты Route
+    __slots__ = ("course", "names", "routes", "numbers", "years", "clubs")
+
+    def __init__(self, course):
+        self.course = course
+        self.names = []
+        self.routes = []
+        self.numbers = []
+        self.years = []
+        self.clubs = []
+
+    def extend(self, other):
+        for name in self.__slots__[1:]:
+            getattr(self, name).extend(getattr(other, name))
+
+    def controls(self):
+        # КП дистанции в порядке первого появления: при рассеивании порядок у участников разный
+        unique = {id(r): r.ids for r in self.routes}.values()
+        ids = dict.fromkeys(chain.from_iterable(unique))
+        start = None
+        kps = []
+        for kp in map(codes.code, ids):
+            if is_start(kp):
+                start = start or kp
+            elif kp != FINISH:
+                kps.append(kp)
+        return start or "С1", kps
+
+
+def _read(f, known, courses, routes, unknown, skipped):
+    intern = sys.intern
+    for n, line in enumerate(f, 1):
+        parts = line.rstrip("\r\n").split("\t")
+        if len(parts) != FIELDS:
+            if line.strip():
+                skipped.append(n)
+            continue
+        course, number, surname, name, year, club, controls = parts
+        route = routes.get(controls)
+        if route is None:
+            if n == 1 and not number.strip().isdigit():
+                # Строка заголовка
+                continue
+            route = routes[controls] = Route(controls, known, unknown, n)
+        if route.ids is None:
+            skipped.append(n)
+            continue
+        entries = courses.get(course)
+        if entries is None:
+            entries = courses[course] = CourseEntries(course)
+        entries.names.append(f"{surname.strip()} {name.strip()}")
+        entries.routes.append(route)
+        entries.numbers.append(number.strip())
+        entries.years.append(intern(year.strip()))
+        entries.clubs.append(intern(club.strip()))
+
+
+def read_entries(source, points):
+    # -> (дистанция -> CourseEntries, КП без координат -> первая строка с ним, номера пропущенных строк)
+    # Коды КП с координатами -> id в общей таблице кодов (строки там уже интернированы)
+    known = {kp: codes.id(kp) for kp in points}
+    for encoding in ("utf-8-sig", "windows-1251"):
+        courses, routes, unknown, skipped = {}, {}, {}, []
+        try:
+            with open(source, encoding=encoding) as f:
+                _read(f, known, courses, routes, unknown, skipped)
+        except UnicodeDecodeError:
+            continue
+        # Дистанции, отличающиеся только пробелами по краям, — одна и та же
+        merged = {}
+        for entries in courses.values():
+            course = sys.intern(entries.course.strip())
+            if course in merged:
+                merged[course].extend(entries)
+            else:
+                entries.course = course
+                merged[course] = entries
+        return merged, unknown, skipped
+    raise ValueError(f"{source}: неизвестная кодировка")
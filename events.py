@@ -0,0 +1,198 @@
+import importlib.util
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+EVENTS_DIR = os.environ.get("EVENTS_DIR", "events")
+EVENTS_MEMORY_MB = float(os.environ.get("EVENTS_MEMORY_MB", "512"))
+EVENTS_CHECK_INTERVAL = 5
+# Код модуля, Flask-приложение и шаблоны — примерно столько стоит соревнование без данных
+EVENT_OVERHEAD = 4 << 20
+MAIN_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+EVENT_ID_RE = re.compile(r'[A-Za-z0-9_-]+')
+
+# Печать общая на весь процесс: HTML страницы от соревнования не зависит, пул один
+SHARED_FUNCTIONS = ("get_pdf_pool", "get_pdf_service", "reserve_render", "release_render", "submit_render",
+                    "render_pdf", "render_pdf_timed", "render_pdf_many")
+
+
+class Event:
+    # Соревнование из events/<event_id>/: свой экземпляр main.py со своими данными и кешами
+    def __init__(self, event_id, path):
+        self.id = event_id
+        self.path = path
+        self.module = None
+        self.loaded_at = None
+        self.last_used = time.time()
+        self._lock = threading.Lock()
+
+    def file(self, name, default=None):
+        path = os.path.join(self.path, name)
+        return path if os.path.exists(path) or default is None else default
+
+    def load(self, base_module):
+        with self._lock:
+            if self.module is not None:
+                return self.module
+            start_time = time.time()
+            spec = importlib.util.spec_from_file_location(f"event_{self.id}", MAIN_FILE)
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[spec.name] = module
+            spec.loader.exec_module(module)
+
+            module.URL_PREFIX = f"/e/{self.id}"
+            module.SPLITS_FILE = self.file("splits.htm")
+            module.RESULTS_XML = self.file("results.xml")
+            module.PARTICIPANTS_FILE = self.file("participants.txt")
+            module.GROUPS_FILE = self.file("groups.txt")
+            module.COORDS_FILE = self.file("coordinates.txt")
+            module.MAP_IMAGE = self.file("map.png", base_module.MAP_IMAGE)
+            module.CACHE_FILE = self.file("cache_participants.json")
+            module.CACHE_POINTS = self.file("cache_points.json")
+            module.TILES_DIR = self.file("cache_tiles")
+            if base_module.PDF_SPOOL_DIR is not None:
+                module.PDF_SPOOL_DIR = os.path.join(base_module.PDF_SPOOL_DIR, self.id)
+            if base_module.METRICS_DIR is not None:
+                module.METRICS_DIR = os.path.join(base_module.METRICS_DIR, self.id)
+            for name in SHARED_FUNCTIONS:
+                setattr(module, name, getattr(base_module, name))
+
+            self.module = module
+            self.loaded_at = time.time()
+            print(f"[INFO] Соревнование {self.id} подключено за {time.time() - start_time:.2f} с")
+            return module
+
+    def unload(self):
+        with self._lock:
+            module, self.module = self.module, None
+            sys.modules.pop(f"event_{self.id}", None)
+        return module is not None
+
+    def memory(self):
+        module = self.module
+        if module is None:
+            return 0
+        try:
+            return EVENT_OVERHEAD + module.memory_estimate()
+        except Exception:
+            return EVENT_OVERHEAD
+
+    def info(self):
+        return {
+            "id": self.id,
+            "url": f"/e/{self.id}/",
+            "loaded": self.module is not None,
+            "ready": self.module is not None and self.module.data_ready.is_set(),
+            "memory_mb": round(self.memory() / (1 << 20), 1),
+            "last_used": round(self.last_used, 1),
+        }
+
+
+class EventRegistry:
+    def __init__(self, base_module, events_dir=EVENTS_DIR, memory_mb=EVENTS_MEMORY_MB):
+        self.base_module = base_module
+        self.events_dir = events_dir
+        self.budget = memory_mb * (1 << 20)
+        self.events = {}
+        self.loaded = OrderedDict()
+        self._lock = threading.Lock()
+        self._next_check = 0
+
+    def available(self):
+        try:
+            entries = sorted(os.scandir(self.events_dir), key=lambda e: e.name)
+        except OSError:
+            return []
+        return [e.name for e in entries if e.is_dir() and EVENT_ID_RE.fullmatch(e.name)]
+
+    def get(self, event_id):
+        if not EVENT_ID_RE.fullmatch(event_id):
+            return None
+        path = os.path.join(self.events_dir, event_id)
+        with self._lock:
+            event = self.events.get(event_id)
+            if event is None:
+                if not os.path.isdir(path):
+                    return None
+                event = self.events[event_id] = Event(event_id, path)
+            event.last_used = time.time()
+            self.loaded[event_id] = event
+            self.loaded.move_to_end(event_id)
+        was_loaded = event.module is not None
+        module = event.load(self.base_module)
+        if not was_loaded or time.time() >= self._next_check:
+            self.evict(keep=event_id)
+        # Возвращаем сам модуль: даже если соревнование тут же выгрузят, запрос дослужит на нём
+        return module
+
+    def evict(self, keep=None):
+        # Выгружаем давно не использованные соревнования, пока не уложимся в бюджет памяти
+        self._next_check = time.time() + EVENTS_CHECK_INTERVAL
+        with self._lock:
+            candidates = list(self.loaded.values())
+        total = sum(event.memory() for event in candidates)
+        for event in candidates:
+            if total <= self.budget:
+                break
+            if event.id == keep:
+                continue
+            size = event.memory()
+            with self._lock:
+                self.loaded.pop(event.id, None)
+            if event.unload():
+                total -= size
+                print(f"[INFO] Соревнование {event.id} выгружено ({size / (1 << 20):.1f} МБ), "
+                      f"в памяти {total / (1 << 20):.1f} из {self.budget / (1 << 20):.0f} МБ")
+
+    def modules(self):
+        with self._lock:
+            loaded = list(self.loaded.values())
+        return [event.module for event in loaded if event.module is not None]
+
+    def listing(self):
+        with self._lock:
+            known = dict(self.events)
+        return [known[i].info() if i in known else Event(i, None).info() for i in self.available()]
+
+
+class EventDispatcher:
+    # WSGI-прослойка: /e/<event_id>/... уходит в приложение соревнования, остальное — в основное
+    def __init__(self, wsgi_app, registry):
+        self.wsgi_app = wsgi_app
+        self.registry = registry
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        if path == "/events":
+            return self.respond(start_response, "200 OK", {"events": self.registry.listing()})
+        if not path.startswith("/e/"):
+            return self.wsgi_app(environ, start_response)
+
+        event_id, slash, rest = path[3:].partition("/")
+        if not slash:
+            start_response("301 Moved Permanently", [("Location", f"{environ.get('SCRIPT_NAME', '')}{path}/")])
+            return [b""]
+        module = self.registry.get(event_id)
+        if module is None:
+            return self.respond(start_response, "404 Not Found", {"error": "Соревнование не найдено"})
+
+        environ = dict(environ)
+        environ["SCRIPT_NAME"] = f"{environ.get('SCRIPT_NAME', '')}/e/{event_id}"
+        environ["PATH_INFO"] = f"/{rest}"
+        return module.app(environ, start_response)
+
+    def respond(self, start_response, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        start_response(status, [("Content-Type", "application/json"), ("Content-Length", str(len(data)))])
+        return [data]
+
+
+def install(app):
+    base_module = sys.modules[app.import_name]
+    registry = EventRegistry(base_module)
+    app.wsgi_app = EventDispatcher(app.wsgi_app, registry)
+    return registry
@@ -0,0 +1,29 @@
+import io
+import math
+
+from PIL import Image, ImageDraw
+
+
+# Прозрачный слой популярности перегонов в координатах map.png (с масштабом scale)
+def render_heatmap(legs, points, map_size, scale=0.5):
+    w, h = map_size
+    im = Image.new("RGBA", (max(1, round(w * scale)), max(1, round(h * scale))), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(im)
+    legs = [(a, b, count) for a, b, count in legs if a in points and b in points and count > 0]
+    if legs:
+        top = max(count for _, _, count in legs)
+        # Редкие перегоны снизу, популярные рисуются поверх
+        for a, b, count in sorted(legs, key=lambda leg: leg[2]):
+            # Корень растягивает середину шкалы: иначе всё гасит перегон от старта
+            t = math.sqrt(count / top)
+            color = (255, int(220 * (1 - t)), 0, int(90 + 150 * t))
+            width = max(1, round((6 + 30 * t) * scale))
+            line = [(points[a]['cx'] * scale, points[a]['cy'] * scale),
+                    (points[b]['cx'] * scale, points[b]['cy'] * scale)]
+            draw.line(line, fill=color, width=width)
+            r = width / 2
+            for x, y in line:
+                draw.ellipse((x - r, y - r, x + r, y + r), fill=color)
+    buf = io.BytesIO()
+    im.save(buf, format="PNG")
+    return buf.getvalue()
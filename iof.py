@@ -0,0 +1,143 @@
+from store import sec_to_time
+
+# Протокол IOF XML 3.0 ResultList: читаем по одному PersonResult и сразу освобождаем разобранное
+IOF_NS = "http://www.orienteering.org/datastandard/3.0"
+FINISH = "Ф1"
+# Как в протоколах SFR: сошедшие и снятые — "снят", не стартовавшие в протокол не попадают
+STATUS_TEXT = {
+    "MissingPunch": "снят",
+    "Disqualified": "снят",
+    "DidNotFinish": "снят",
+    "OverTime": "снят",
+    "SportingWithdrawal": "снят",
+    "NotCompeting": "в/к",
+}
+
+
+def _tag(name):
+    return f"{{{IOF_NS}}}{name}"
+
+
+CLASS_RESULT = _tag("ClassResult")
+CLASS = _tag("Class")
+NAME = _tag("Name")
+PERSON_RESULT = _tag("PersonResult")
+PERSON = _tag("Person")
+FAMILY = _tag("Family")
+GIVEN = _tag("Given")
+RESULT = _tag("Result")
+TIME = _tag("Time")
+STATUS = _tag("Status")
+SPLIT_TIME = _tag("SplitTime")
+CONTROL_CODE = _tag("ControlCode")
+
+
+def _text(el):
+    return el.text.strip() if el is not None and el.text else ""
+
+
+def _child(el, tag):
+    for child in el:
+        if child.tag == tag:
+            return child
+    return None
+
+
+def _seconds(text):
+    try:
+        return int(round(float(text)))
+    except (TypeError, ValueError):
+        return None
+
+
+def format_result(seconds):
+    return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def person_result(el, group, place, start_code):
+    # Дочерние элементы обходим напрямую: find() с путями в несколько раз медленнее на больших протоколах
+    person = _child(el, PERSON)
+    person_name = _child(person, NAME) if person is not None else None
+    name = ""
+    if person_name is not None:
+        name = " ".join(t for t in (_text(_child(person_name, FAMILY)), _text(_child(person_name, GIVEN))) if t)
+    result_el = _child(el, RESULT)
+    if not name or result_el is None:
+        return None
+
+    path = []
+    leg_times = []
+    previous = 0
+    status = "OK"
+    seconds = None
+    for child in result_el:
+        tag = child.tag
+        if tag == TIME:
+            seconds = _seconds(_text(child))
+            continue
+        if tag == STATUS:
+            status = _text(child) or "OK"
+            continue
+        if tag != SPLIT_TIME:
+            continue
+        split_status = child.get("status")
+        code = elapsed = None
+        for part in child:
+            if part.tag == CONTROL_CODE:
+                code = _text(part)
+            elif part.tag == TIME:
+                elapsed = _seconds(_text(part))
+        if not code or split_status == "Additional":
+            continue
+        # Время отметки — от старта; перегон считаем, только если известна и предыдущая отметка
+        if split_status == "Missing":
+            elapsed = None
+        if elapsed is None or previous is None:
+            leg_times.append("-")
+        else:
+            leg_times.append(sec_to_time(max(0, elapsed - previous)))
+        previous = elapsed
+        path.append(code)
+    if not path:
+        return None
+
+    if status == "OK" and seconds is not None:
+        result = format_result(seconds)
+    else:
+        result = STATUS_TEXT.get(status, status)
+    return {
+        "name": f"{place}. {name}",
+        "group": group,
+        "path": [start_code] + path + [FINISH],
+        "leg_times": leg_times,
+        "result": result,
+    }
+
+
+def iter_result_list(source, starts):
+    # (группа, участники) по каждому ClassResult; в памяти только текущий участник
+    from lxml import etree
+
+    group = None
+    runners = []
+    for event, el in etree.iterparse(source, events=("end",), tag=(NAME, PERSON_RESULT, CLASS_RESULT),
+                                     huge_tree=True):
+        if el.tag == NAME:
+            parent = el.getparent()
+            if parent is not None and parent.tag == CLASS and getattr(parent.getparent(), "tag", None) == CLASS_RESULT:
+                group = (el.text or "").strip()
+            continue
+        if el.tag == PERSON_RESULT:
+            if group:
+                runner = person_result(el, group, len(runners) + 1, starts.get(group, "С1"))
+                if runner is not None:
+                    runners.append(runner)
+        else:
+            if group:
+                yield group, runners
+            group = None
+            runners = []
+        el.clear()
+        # Уже разобранные соседи тоже не нужны — иначе корень копит пустые элементы
+        while el.getprevious() is not None:
+            del el.getparent()[0]
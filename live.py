@@ -0,0 +1,262 @@
+import asyncio
+import json
+import os
+import socket
+import threading
+import time
+from collections import deque
+
+LIVE_BUFFER = int(os.environ.get("LIVE_BUFFER", "256"))
+LIVE_HEARTBEAT = 15
+LIVE_RETRY_MS = 2000
+# Клиент, который не успевает читать, отключаем: переподключится и доберёт пропущенное по Last-Event-ID
+LIVE_SEND_LIMIT = 1 << 20
+REQUEST_PEEK = 4096
+REQUEST_TIMEOUT = 10
+HEADERS_LIMIT = 16384
+STREAM_HEADERS = (b"HTTP/1.1 200 OK\r\n"
+                  b"Content-Type: text/event-stream; charset=utf-8\r\n"
+                  b"Cache-Control: no-cache\r\n"
+                  b"X-Accel-Buffering: no\r\n"
+                  b"Connection: keep-alive\r\n\r\n")
+PING = b": ping\n\n"
+
+
+def sse_message(event, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    text = data if isinstance(data, str) else json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    lines.extend(f"data: {line}" for line in text.split("\n"))
+    return ("\n".join(lines) + "\n\n").encode("utf-8")
+
+
+def parse_event_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class LiveHub:
+    # Кольцевой буфер изменений данных: каждое сообщение помечено версией данных,
+    # переподключившийся клиент получает только то, что пропустил
+    def __init__(self, size=LIVE_BUFFER):
+        self.events = deque(maxlen=size)
+        self.version = 0
+        self.subscribers = 0
+        self.listeners = []
+        self.cond = threading.Condition()
+
+    def reset(self, version):
+        # Данные загружены целиком (старт, кеш): прошлые изменения к ним уже не относятся
+        with self.cond:
+            self.events.clear()
+            self.version = version
+            self.cond.notify_all()
+
+    def publish(self, version, payload):
+        message = sse_message("delta", payload, version)
+        with self.cond:
+            self.events.append((version, message))
+            self.version = version
+            self.cond.notify_all()
+            listeners = list(self.listeners)
+        for listener in listeners:
+            listener(self, message)
+
+    def backlog(self, last_id):
+        # Пропущенные сообщения после last_id; None — клиент отстал сильнее, чем помнит буфер
+        with self.cond:
+            if last_id is None or last_id >= self.version:
+                return []
+            if not self.events or self.events[0][0] > last_id + 1:
+                return None
+            return [message for version, message in self.events if version > last_id]
+
+    def reset_message(self):
+        version = self.version
+        return sse_message("reset", {"version": version}, version)
+
+    def hello(self, last_id):
+        # Первое, что получает подключившийся клиент: интервал переподключения и то, что он пропустил
+        with self.cond:
+            version = self.version
+            messages = self.backlog(last_id)
+        head = f"retry: {LIVE_RETRY_MS}\n\n".encode()
+        if last_id is None:
+            return head + sse_message("hello", {"version": version}, version), version
+        if messages is None:
+            return head + self.reset_message(), version
+        return head + b"".join(messages), version
+
+    def wait(self, last_id, timeout):
+        with self.cond:
+            self.cond.wait_for(lambda: self.version > last_id, timeout)
+            version = self.version
+            messages = self.backlog(last_id)
+        return messages, version
+
+
+class StreamClient(asyncio.Protocol):
+    def __init__(self, server, hub, last_id):
+        self.server = server
+        self.hub = hub
+        self.last_id = last_id
+        self.transport = None
+        self.buffer = b""
+        self.subscribed = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        if self.subscribed:
+            return
+        self.buffer += data
+        end = self.buffer.find(b"\r\n\r\n")
+        if end < 0:
+            if len(self.buffer) > HEADERS_LIMIT:
+                self.transport.close()
+            return
+        for line in self.buffer[:end].split(b"\r\n")[1:]:
+            name, _, value = line.partition(b":")
+            if name.strip().lower() == b"last-event-id":
+                self.last_id = parse_event_id(value.strip().decode("latin-1"))
+        hello, _ = self.hub.hello(self.last_id)
+        self.transport.write(STREAM_HEADERS + hello)
+        self.subscribed = True
+        self.server.subscribe(self.hub, self.transport)
+
+    def connection_lost(self, exc):
+        if self.subscribed:
+            self.server.unsubscribe(self.hub, self.transport)
+
+
+class StreamServer:
+    # Один поток с asyncio держит все SSE-соединения процесса; остальные запросы
+    # возвращаются обычному серверу. resolve(path) -> LiveHub или None (тогда запрос тоже уходит серверу)
+    def __init__(self, resolve):
+        self.resolve = resolve
+        self.loop = asyncio.new_event_loop()
+        self.clients = {}
+        self.thread = threading.Thread(target=self._run, name="live-stream", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_later(LIVE_HEARTBEAT, self._heartbeat)
+        self.loop.run_forever()
+
+    def dispatch(self, sock, address, fallback):
+        # Вызывается из потока accept: решение, чей это запрос, принимаем в цикле событий
+        self.loop.call_soon_threadsafe(self._peek, sock, address, fallback, time.monotonic() + REQUEST_TIMEOUT)
+
+    def _peek(self, sock, address, fallback, deadline):
+        try:
+            sock.setblocking(False)
+            data = sock.recv(REQUEST_PEEK, socket.MSG_PEEK)
+        except BlockingIOError:
+            self._wait_readable(sock, address, fallback, deadline)
+            return
+        except OSError:
+            sock.close()
+            return
+        if not data:
+            sock.close()
+            return
+        line_end = data.find(b"\r\n")
+        if line_end < 0:
+            if len(data) >= REQUEST_PEEK:
+                self._fallback(sock, address, fallback)
+            elif time.monotonic() > deadline:
+                sock.close()
+            else:
+                # Строка запроса пришла не целиком: данные из буфера не забираем, смотрим чуть позже
+                self.loop.call_later(0.05, self._peek, sock, address, fallback, deadline)
+            return
+        parts = data[:line_end].split()
+        if len(parts) == 3 and parts[0] == b"GET" and parts[1].split(b"?")[0].endswith(b"/api/stream"):
+            asyncio.ensure_future(self._serve(sock, address, fallback, parts[1].decode("latin-1")), loop=self.loop)
+        else:
+            self._fallback(sock, address, fallback)
+
+    def _wait_readable(self, sock, address, fallback, deadline):
+        def ready():
+            timer.cancel()
+            self.loop.remove_reader(sock.fileno())
+            self._peek(sock, address, fallback, deadline)
+
+        def expire():
+            # Соединение открыли и молчат — не держим его вечно
+            self.loop.remove_reader(sock.fileno())
+            sock.close()
+
+        timer = self.loop.call_later(max(0, deadline - time.monotonic()), expire)
+        self.loop.add_reader(sock.fileno(), ready)
+
+    def _fallback(self, sock, address, fallback):
+        sock.setblocking(True)
+        fallback(sock, address)
+
+    async def _serve(self, sock, address, fallback, target):
+        path, _, query = target.partition("?")
+        # Поиск соревнования может загрузить его данные — не в цикле событий
+        hub = await self.loop.run_in_executor(None, self.resolve, path)
+        if hub is None:
+            self._fallback(sock, address, fallback)
+            return
+        last_id = None
+        for pair in query.split("&"):
+            name, _, value = pair.partition("=")
+            if name == "last_event_id":
+                last_id = parse_event_id(value)
+        try:
+            await self.loop.connect_accepted_socket(lambda: StreamClient(self, hub, last_id), sock)
+        except OSError:
+            sock.close()
+
+    def subscribe(self, hub, transport):
+        clients = self.clients.get(hub)
+        if clients is None:
+            clients = self.clients[hub] = set()
+            with hub.cond:
+                hub.listeners.append(self._on_publish)
+        clients.add(transport)
+        hub.subscribers += 1
+
+    def unsubscribe(self, hub, transport):
+        clients = self.clients.get(hub)
+        if clients is not None and transport in clients:
+            clients.discard(transport)
+            hub.subscribers -= 1
+
+    def _on_publish(self, hub, message):
+        self.loop.call_soon_threadsafe(self._broadcast, hub, message)
+
+    def _broadcast(self, hub, message):
+        for transport in list(self.clients.get(hub, ())):
+            if transport.get_write_buffer_size() > LIVE_SEND_LIMIT:
+                transport.abort()
+            else:
+                transport.write(message)
+
+    def _heartbeat(self):
+        # Комментарий раз в LIVE_HEARTBEAT не даёт прокси закрыть молчащее соединение
+        for hub in list(self.clients):
+            self._broadcast(hub, PING)
+        self.loop.call_later(LIVE_HEARTBEAT, self._heartbeat)
+
+    def close(self):
+        def stop():
+            for clients in self.clients.values():
+                for transport in list(clients):
+                    transport.close()
+            self.loop.call_later(0.1, self.loop.stop)
+        if self.thread.is_alive():
+            self.loop.call_soon_threadsafe(stop)
+            self.thread.join(timeout=5)
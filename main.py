@@ -1,39 +1,143 @@
+import time
+STARTUP_T0 = time.time()
+
 import re
 import os
 import io
-import base64
-import time
-import json
 import math
+import json
+import gzip
+import uuid
+import pathlib
+import zipfile
+import collections
+import hashlib
+import threading
 import urllib.parse
-from flask import Flask, render_template_string, send_from_directory, jsonify, Response, request
-from PIL import Image
-from bs4 import BeautifulSoup
-from weasyprint import HTML, CSS
-from weasyprint.text.fonts import FontConfiguration
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from flask import Flask, render_template_string, jsonify, Response, request, stream_with_context, g, has_app_context
+from store import ParticipantStore, GroupColumns, split_place
+from metrics import Registry, MetricsSpool
+from live import LiveHub, LIVE_HEARTBEAT, parse_event_id
+from snapshot import SnapshotCell
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 app = Flask(__name__)
 
 MAP_IMAGE = "static/map.png"
 COORDS_FILE = "coordinates.txt"
 SPLITS_FILE = "splits.htm"
+# Если рядом лежит выгрузка IOF XML 3.0 ResultList, участники берутся из неё, а не из splits.htm
+RESULTS_XML = "results.xml"
+# Заявка с дистанциями участников: группы, по которым ещё нет результатов, показывают её
+PARTICIPANTS_FILE = "participants.txt"
 CACHE_FILE = "cache_participants.json"
 CACHE_POINTS = "cache_points.json"
 GROUPS_FILE = "groups.txt"
-
-points_data = None
-participants_data = None
-group_kps = {}
-group_starts = {}
-map_image_b64 = None
-
-def load_group_kps():
-    global group_kps, group_starts
-    group_kps.clear()
-    group_starts.clear()
+TILES_DIR = "cache_tiles"
+# Префикс адресов, когда приложение смонтировано как соревнование /e/<event_id> (см. events.py)
+URL_PREFIX = ""
+TILES_MEMORY = int(os.environ.get("TILES_MEMORY", "512"))
+ROUTE_IMAGES_MEMORY = int(os.environ.get("ROUTE_IMAGES_MEMORY", "64"))
+ROUTE_DEFAULT_WIDTH = 1024
+SPLITS_WATCH_INTERVAL = float(os.environ.get("SPLITS_WATCH_INTERVAL", "3"))
+# Метров на миллиметр карты (4 — масштаб 1:4000)
+SCALE_FACTOR = float(os.environ.get("MAP_SCALE_FACTOR", "4"))
+RUNNERS_PAGE = 100
+RUNNERS_PAGE_MAX = 500
+RUNNER_ROW_HEIGHT = 40
+# С этого числа КП браузер прячет знаки вне видимой области (запрос /api/controls/in)
+KP_CULL_MIN = 500
+# Запас попадания по /api/controls/at в пикселях карты — не больше этого
+CONTROL_TOLERANCE_MAX = 200
+HEATMAP_SCALE = float(os.environ.get("HEATMAP_SCALE", "0.5"))
+# Цель по времени до первого ответа после старта процесса, секунды
+STARTUP_TTFB_TARGET = float(os.environ.get("STARTUP_TTFB_TARGET", "1.0"))
+
+# Точки, матрица расстояний, дистанции групп и участники — в одном неизменяемом снимке (snapshot.py)
+snapshots = SnapshotCell()
+# Снимок, который поток-писатель собирает прямо сейчас: его же видят разборщики, вызванные из писателя
+building = threading.local()
+distances_cache = None
+map_tiles = None
+route_renderer = None
+page_cache = None
+page_lock = threading.Lock()
+group_shards = {}
+leg_stats_cache = {}
+leg_usage_cache = {}
+leg_usage_payloads = {}
+heatmap_cache = {}
+search_tokens = {}
+control_overlay = None
+control_grid = None
+overlay_payloads = {}
+search_index = None
+data_json_cache = None
+splits_signature = None
+splits_blocks = {}
+planned_groups = {}
+planned_courses = {}
+planned_signature = None
+planned_added = {}
+data_lock = threading.RLock()
+data_ready = threading.Event()
+startup_timings = {}
+live_hub = LiveHub()
+
+# Свой реестр у каждого экземпляра модуля: у каждого соревнования из events.py — свои метрики
+registry = Registry()
+# Общая папка метрик для нескольких процессов (server.py): /metrics складывает состояния всех воркеров
+METRICS_DIR = os.environ.get("METRICS_DIR") or None
+metrics_spool = None
+HTTP_REQUESTS = registry.counter("mapchoice_http_requests_total", "Запросы по маршрутам и кодам ответа",
+                                 ("route", "method", "status"))
+HTTP_LATENCY = registry.histogram("mapchoice_http_request_duration_seconds", "Время ответа по маршрутам",
+                                  ("route", "method"))
+STAGE_SECONDS = registry.histogram("mapchoice_stage_duration_seconds", "Этапы обработки: parse, points, page, pdf_render",
+                                   ("stage",))
+CACHE_REQUESTS = registry.counter("mapchoice_cache_requests_total", "Попадания и промахи кешей", ("cache", "result"))
+registry.gauge("mapchoice_pdf_jobs_inflight", "Задания PDF в очереди и в работе", fn=lambda: len(pdf_inflight))
+registry.gauge("mapchoice_data_version", "Версия данных участников", fn=lambda: current().data_version, merge=max)
+registry.gauge("mapchoice_snapshots_alive", "Снимки данных в памяти: текущий и ещё занятые запросами",
+               fn=lambda: len(snapshots.alive))
+registry.gauge("mapchoice_stream_clients", "Открытые соединения /api/stream", fn=lambda: live_hub.subscribers)
+registry.gauge("mapchoice_data_ready", "Данные загружены (1) или ещё нет (0)", fn=lambda: int(data_ready.is_set()),
+               merge=min)
+
+# Снимок для чтения: запрос берёт его один раз (wait_for_data) и до конца видит одну версию данных,
+# поток, собирающий следующую версию, — свой черновик, остальные — последний опубликованный
+def current():
+    draft = getattr(building, "snapshot", None)
+    if draft is not None:
+        return draft
+    if has_app_context():
+        pinned = g.get("snapshot")
+        if pinned is not None:
+            return pinned
+    return snapshots.current
+
+# Новая версия данных — одной заменой ссылки; писатели идут по одному под data_lock
+def publish(**changes):
+    with data_lock:
+        snapshot = snapshots.publish(**changes)
+        draft = getattr(building, "snapshot", None)
+        if draft is not None:
+            building.snapshot = draft.replace(**changes)
+    return snapshot
+
+def read_group_kps():
+    # groups.txt -> (группа -> КП, группа -> старт); каждый раз новые словари, опубликованные не трогаем
+    group_kps = {}
+    group_starts = {}
     if not os.path.exists(GROUPS_FILE):
         print("[WARNING] groups.txt не найден")
-        return
+        return group_kps, group_starts
     with open(GROUPS_FILE, "r", encoding="utf-8") as f:
         for line in f:
             line = line.strip()
@@ -53,22 +157,29 @@ def load_group_kps():
             
             group_kps[group] = kps
             group_starts[group] = start_code or "С1"
+    return group_kps, group_starts
 
-load_group_kps()
-
-def get_map_base64():
-    global map_image_b64
-    if map_image_b64 is None:
-        with open(MAP_IMAGE, "rb") as f:
-            map_image_b64 = base64.b64encode(f.read()).decode()
-    return map_image_b64
+def load_group_kps():
+    group_kps, group_starts = read_group_kps()
+    with data_lock:
+        publish(group_kps=group_kps, group_starts=group_starts, courses_version=current().courses_version + 1)
+
+def get_map_tiles():
+    global map_tiles
+    if map_tiles is None:
+        from tiles import TilePyramid
+        map_tiles = TilePyramid(MAP_IMAGE, TILES_DIR, memory_tiles=TILES_MEMORY)
+        print(f"[INFO] Тайлы карты: {map_tiles.width}x{map_tiles.height}, уровней {map_tiles.max_zoom + 1}")
+    return map_tiles
 
 def load_all_points():
-    global points_data
-    
+    points_data = current().points_data
     if points_data:
         return points_data
-    
+    with STAGE_SECONDS.time(stage="points"):
+        return _load_all_points()
+
+def _load_all_points():
     if os.path.exists(CACHE_POINTS):
         try:
             with open(CACHE_POINTS, 'r', encoding='utf-8') as f:
@@ -83,13 +194,17 @@ def load_all_points():
                 raise ValueError("Неверный формат map_size")
             
             print(f"[INFO] Координаты загружены из кеша: {len(points)} КП")
+            CACHE_REQUESTS.inc(cache="points", result="hit")
             points_data = (points, map_size)
+            publish(points_data=points_data, distance_data=build_distance_matrix(points))
             return points_data
         except Exception as e:
             print(f"[WARNING] Ошибка чтения кэша координат (будет пересоздан): {e}")
     
-    im = Image.open(MAP_IMAGE)
-    w, h = im.size
+    CACHE_REQUESTS.inc(cache="points", result="miss")
+    from PIL import Image
+    with Image.open(MAP_IMAGE) as im:
+        w, h = im.size
     px_per_mm_x = w / 297.0
     px_per_mm_y = h / 210.0
     r = 3 * max(px_per_mm_x, px_per_mm_y)
@@ -116,6 +231,7 @@ def load_all_points():
                 continue
 
     points_data = (points, (w, h))
+    publish(points_data=points_data, distance_data=build_distance_matrix(points))
     
     try:
         with open(CACHE_POINTS, 'w', encoding='utf-8') as f:
@@ -129,7 +245,264 @@ def load_all_points():
     
     return points_data
 
+# Расстояния между всеми КП в метрах — одна матрица для сервера, PDF и браузера
+def build_distance_matrix(points):
+    import numpy as np
+    kp_codes = list(points)
+    xy = np.array([(points[kp]['mm_x'], points[kp]['mm_y']) for kp in kp_codes], dtype=np.float64).reshape(-1, 2)
+    delta = xy[:, None, :] - xy[None, :, :]
+    matrix = np.rint(np.hypot(delta[..., 0], delta[..., 1]) * SCALE_FACTOR).astype(np.int32)
+    distance_data = (kp_codes, {kp: i for i, kp in enumerate(kp_codes)}, matrix)
+    print(f"[INFO] Матрица расстояний: {len(kp_codes)}x{len(kp_codes)}")
+    return distance_data
+
+def get_distance_data():
+    distance_data = current().distance_data
+    if distance_data is None:
+        load_all_points()
+        distance_data = snapshots.current.distance_data
+    return distance_data
+
+def route_distance(path):
+    _, index, matrix = get_distance_data()
+    total = 0
+    for kp1, kp2 in zip(path, path[1:]):
+        i, j = index.get(kp1), index.get(kp2)
+        if i is not None and j is not None:
+            total += int(matrix[i, j])
+    return total
+
+# Дистанции всех участников группы одним проходом по матрице
+def route_distances(paths):
+    import numpy as np
+    paths = list(paths)
+    _, index, _ = get_distance_data()
+    lengths = np.fromiter((len(p) for p in paths), dtype=np.int64, count=len(paths))
+    ids = np.fromiter((index.get(kp, -1) for p in paths for kp in p), dtype=np.int64, count=int(lengths.sum()))
+    return _summed_legs(ids, lengths)
+
+# То же для путей из id общей таблицы кодов (store.codes, массивы "H") — без обхода строк
+def code_route_distances(paths):
+    import numpy as np
+    from store import codes
+    paths = list(paths)
+    _, index, _ = get_distance_data()
+    matrix_ids = {codes.id(kp): i for kp, i in index.items()}
+    lookup = np.full(len(codes.codes), -1, dtype=np.int64)
+    lookup[list(matrix_ids)] = list(matrix_ids.values())
+    lengths = np.fromiter(map(len, paths), dtype=np.int64, count=len(paths))
+    flat = np.frombuffer(b"".join(p.tobytes() for p in paths), dtype=np.uint16)
+    return _summed_legs(lookup[flat], lengths)
+
+def _summed_legs(ids, lengths):
+    import numpy as np
+    _, _, matrix = get_distance_data()
+    if len(ids) < 2:
+        return [0] * len(lengths)
+    a, b = ids[:-1], ids[1:]
+    legs = np.where((a >= 0) & (b >= 0), matrix[np.maximum(a, 0), np.maximum(b, 0)], 0).astype(np.int64)
+    ends = np.cumsum(lengths)
+    # Перегон между последним КП одного участника и первым КП следующего не считается
+    boundary = ends[:-1] - 1
+    legs[boundary[(boundary >= 0) & (boundary < len(legs))]] = 0
+    cum = np.concatenate(([0], np.cumsum(legs)))
+    starts = ends - lengths
+    return (cum[np.maximum(ends - 1, starts)] - cum[starts]).tolist()
+
+def group_columns(group, runners):
+    runners = list(runners)
+    for runner, distance in zip(runners, route_distances(r["path"] for r in runners)):
+        runner["distance"] = distance
+    return GroupColumns.from_runners(group, runners)
+
+KP_PAREN_RE = re.compile(r'\((\d+)\)')
+KP_BRACKET_RE = re.compile(r'\[(\d+)\]')
+KP_DIGITS_RE = re.compile(r'(\d{2,3})')
+KP_WORD_RE = re.compile(r'\b(\d{2,3})\b')
+TIME_MATCH_RE = re.compile(r'(\d+:\d+(?::\d+)?)')
+GROUP_COUNT_RE = re.compile(r'\s*\(\d+\)\s*')
+REZULT_BLOCK_RE = re.compile(r"<table\b[^>]*\brezult\b[^>]*>.*?</table\s*>", re.S | re.I)
+
+def read_splits_content():
+    try:
+        with open(SPLITS_FILE, encoding='windows-1251') as f:
+            return f.read()
+    except:
+        try:
+            with open(SPLITS_FILE, encoding='utf-8') as f:
+                return f.read()
+        except Exception as e2:
+            print(f"[ERROR] Ошибка с кодировкой: {e2}")
+            return None
+
+def _resolve_group(last_h2, last_span):
+    group_kps = current().group_kps
+    if last_h2 is not None and last_h2 in group_kps:
+        return last_h2
+    if last_span is not None:
+        text = GROUP_COUNT_RE.sub('', last_span)
+        if text in group_kps:
+            return text
+    return None
+
+def _rezult_runners(group_name, header_cells, rows):
+    # Ячейки заданы списками непустых строк — как get_text(strip=True) в BeautifulSoup
+    kp_by_col = {}
+    leg_start_idx = None
+
+    for idx, frags in enumerate(header_cells):
+        text = "".join(frags)
+        if text.startswith("#"):
+            m = KP_PAREN_RE.search(text) or KP_BRACKET_RE.search(text)
+            if m:
+                kp_by_col[idx] = m.group(1)
+                if leg_start_idx is None:
+                    leg_start_idx = idx
+
+    if leg_start_idx is None:
+        for idx, frags in enumerate(header_cells):
+            text = "".join(frags)
+            m = KP_DIGITS_RE.search(text)
+            if m and not text.startswith('#'):
+                kp = m.group(1)
+                if kp not in ['240', 'F', 'Ф']:
+                    kp_by_col[idx] = kp
+                    if leg_start_idx is None:
+                        leg_start_idx = idx
+
+    if leg_start_idx is None:
+        return []
+
+    start_code = current().group_starts.get(group_name, "С1")
+    runners = []
+    for cells in rows:
+        if len(cells) < 4:
+            continue
+
+        place_cell = "".join(cells[0])
+        place = place_cell.replace(".", "") if "." in place_cell else place_cell
+
+        name = "".join(cells[2])
+        if not name or "Фамилия" in name or "Имя" in name or name.isdigit():
+            continue
+
+        result = "".join(cells[3])
+
+        path = []
+        leg_times = []
+
+        for col_idx in range(leg_start_idx, len(cells)):
+            frags = cells[col_idx]
+            kp = kp_by_col.get(col_idx)
+            if not kp:
+                cell_text = "".join(frags)
+                m = KP_BRACKET_RE.search(cell_text) or KP_WORD_RE.search(cell_text)
+                if m:
+                    kp = m.group(1)
+
+            if not kp or kp in ["240", "F", "Ф"]:
+                continue
+
+            cell_lines = [l.strip() for l in "\n".join(frags).split('\n') if l.strip()]
+
+            time_str = "-"
+            if len(cell_lines) > 1:
+                time_match = TIME_MATCH_RE.match(cell_lines[1])
+                if time_match:
+                    time_str = time_match.group(1)
+            elif cell_lines:
+                time_match = TIME_MATCH_RE.search(cell_lines[0])
+                if time_match:
+                    time_str = time_match.group(1)
+
+            path.append(kp)
+            leg_times.append(time_str)
+
+        if path:
+            runners.append({
+                "name": f"{place}. {name}",
+                "group": group_name,
+                "path": [start_code] + path + ["Ф1"],
+                "leg_times": leg_times,
+                "result": result
+            })
+    return runners
+
+def _cell_strings(cell):
+    return [s.strip() for s in cell.itertext() if s.strip()]
+
+# Один проход по документу: (группа, участники) для каждой table.rezult,
+# текущий заголовок группы отслеживается по ходу чтения в header
+def iter_rezult_tables(content, header=None, chunk_size=1 << 16):
+    from lxml import etree
+
+    if header is None:
+        header = {"h2": None, "span": None}
+    parser = etree.HTMLPullParser(events=("start", "end"))
+    table_depth = 0
+
+    def handle(events):
+        nonlocal table_depth
+        for event, el in events:
+            tag = el.tag
+            if event == "start":
+                if tag == "table":
+                    table_depth += 1
+                continue
+            if tag == "h2":
+                header["h2"] = "".join(_cell_strings(el))
+            elif tag == "span" and "group" in (el.get("class") or "").split():
+                header["span"] = "".join(_cell_strings(el))
+            elif tag == "table":
+                table_depth -= 1
+                if "rezult" in (el.get("class") or "").split():
+                    group_name = _resolve_group(header["h2"], header["span"])
+                    rows = list(el.iter("tr"))
+                    if group_name and rows:
+                        head = [_cell_strings(c) for c in rows[0].iter("th", "td")]
+                        body = [[_cell_strings(c) for c in row.iter("td")] for row in rows[1:]]
+                        yield group_name, _rezult_runners(group_name, head, body)
+                if table_depth == 0:
+                    # Разобранное больше не нужно — держим в памяти только текущую таблицу
+                    el.clear()
+                    parent = el.getparent()
+                    if parent is not None:
+                        while el.getprevious() is not None:
+                            del parent[0]
+
+    for pos in range(0, len(content), chunk_size):
+        parser.feed(content[pos:pos + chunk_size])
+        yield from handle(parser.read_events())
+    parser.close()
+    yield from handle(parser.read_events())
+
 def parse_splits_html():
+    participants = {g: [] for g in current().group_kps.keys()}
+
+    if not os.path.exists(SPLITS_FILE):
+        print(f"[ERROR] Файл {SPLITS_FILE} не найден")
+        return participants
+
+    content = read_splits_content()
+    if content is None:
+        return participants
+
+    try:
+        for group_name, runners in iter_rezult_tables(content):
+            participants[group_name].extend(runners)
+    except Exception as e:
+        print(f"[WARNING] Потоковый парсер не справился ({e}), используется BeautifulSoup")
+        return parse_splits_html_soup()
+
+    total = sum(len(v) for v in participants.values())
+    print(f"[SUCCESS] Загружено {total} участников")
+
+    return participants
+
+def parse_splits_html_soup():
+    from bs4 import BeautifulSoup
+    snapshot = current()
+    group_kps, group_starts = snapshot.group_kps, snapshot.group_starts
     participants = {g: [] for g in group_kps.keys()}
     
     if not os.path.exists(SPLITS_FILE):
@@ -277,94 +650,534 @@ def parse_splits_html():
     
     return participants
 
+def split_rezult_blocks(content):
+    # Документ режется на куски «всё после предыдущей таблицы + очередная table.rezult»
+    blocks = []
+    pos = 0
+    for m in REZULT_BLOCK_RE.finditer(content):
+        if "<table" in m.group(0)[6:].lower():
+            return None
+        blocks.append(content[pos:m.end()])
+        pos = m.end()
+    return blocks
+
+def participants_source():
+    return RESULTS_XML if RESULTS_XML and os.path.exists(RESULTS_XML) else SPLITS_FILE
+
+def _file_signature(path):
+    try:
+        st = os.stat(path)
+    except (OSError, TypeError):
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def _splits_signature():
+    source = participants_source()
+    timing = _file_signature(source)
+    entries = _file_signature(PARTICIPANTS_FILE)
+    if timing is None and entries is None:
+        return None
+    return (source, *(timing or (None, None)), entries)
+
+def parse_results_xml():
+    from iof import iter_result_list
+    snapshot = current()
+    participants = {g: [] for g in snapshot.group_kps.keys()}
+    for group_name, runners in iter_result_list(RESULTS_XML, snapshot.group_starts):
+        participants.setdefault(group_name, []).extend(runners)
+    total = sum(len(v) for v in participants.values())
+    print(f"[SUCCESS] Загружено {total} участников из {RESULTS_XML}")
+    return participants
+
+def _full_changes(parsed, old):
+    changed = set()
+    for g, runners in parsed.items():
+        before = old.get(g)
+        if before is None:
+            changed.add(g)
+        elif planned_groups.get(g) is before:
+            # Была заявка: пустую группу ею же и закроем, а пришедшие результаты её сменят
+            if runners:
+                changed.add(g)
+        elif runners != before.to_list():
+            changed.add(g)
+    return {g: group_columns(g, runners) for g, runners in parsed.items()}, changed
+
+def load_planned():
+    global planned_groups, planned_courses, planned_signature
+    signature = _file_signature(PARTICIPANTS_FILE)
+    if signature == planned_signature:
+        return planned_groups
+    if signature is None:
+        planned_groups, planned_courses, planned_signature = {}, {}, None
+        return planned_groups
+
+    from entries import read_entries
+    start_time = time.perf_counter()
+    points, _ = load_all_points()
+    try:
+        courses, unknown, skipped = read_entries(PARTICIPANTS_FILE, points)
+    except (OSError, ValueError) as e:
+        print(f"[WARNING] {PARTICIPANTS_FILE} не прочитан ({e})")
+        return planned_groups
+    groups = {}
+    for course, entries in courses.items():
+        # Дистанция считается один раз на маршрут, а не на участника
+        routes = list({id(r): r for r in entries.routes}.values())
+        lengths = dict(zip(map(id, routes), code_route_distances(r.ids for r in routes)))
+        groups[course] = GroupColumns.from_paths(course, entries.names, (r.ids for r in entries.routes), {
+            "distance": [lengths[id(r)] for r in entries.routes],
+            "number": entries.numbers,
+            "year": entries.years,
+            "club": entries.clubs,
+        })
+    planned_groups = groups
+    planned_courses = {course: entries.controls() for course, entries in courses.items()}
+    planned_signature = signature
+    elapsed = time.perf_counter() - start_time
+    STAGE_SECONDS.observe(elapsed, stage="entries")
+    total = sum(len(cols) for cols in groups.values())
+    print(f"[SUCCESS] Заявка {PARTICIPANTS_FILE}: {total} участников, дистанций {len(groups)} за {elapsed:.2f} с")
+    if unknown:
+        listed = ", ".join(f"{kp} (строка {line})" for kp, line in sorted(unknown.items(), key=lambda x: x[1])[:10])
+        print(f"[WARNING] Маршруты с КП без координат отклонены: {listed}{' …' if len(unknown) > 10 else ''}")
+    if skipped:
+        print(f"[WARNING] Пропущено строк заявки: {len(skipped)} (первая — {skipped[0]})")
+    return planned_groups
+
+# Группы без результатов показывают заявленные дистанции. Новые дистанции из заявки попадают в group_kps,
+# только пока нет файла результатов: с ним список групп задаёт groups.txt, и добавленные ранее уходят.
+# -> (participants, изменения снимка): дистанции — новыми словарями, опубликованные не меняются
+def merge_planned(participants, changed, old):
+    global planned_added
+    previous = planned_groups
+    planned = load_planned()
+    snapshot = current()
+    timing = _file_signature(participants_source()) is not None
+    # Добавлена заявкой та дистанция, чей список КП — тот самый объект; из groups.txt приходят новые списки
+    ours = {c for c, kps in planned_added.items() if snapshot.group_kps.get(c) is kps}
+    removed = ours if timing else set()
+    for g in removed:
+        participants.pop(g, None)
+        changed.add(g)
+    for g, cols in planned.items():
+        if (not timing or g in participants) and not len(participants.get(g) or ()):
+            participants[g] = cols
+    for g, cols in participants.items():
+        before = old.get(g)
+        if before is not cols and (planned.get(g) is cols or (before is not None and previous.get(g) is before)):
+            changed.add(g)
+    added = [] if timing else [course for course in planned_courses if course not in snapshot.group_kps]
+    if not added and not removed:
+        return participants, {}
+    group_kps = dict(snapshot.group_kps)
+    group_starts = dict(snapshot.group_starts)
+    for course in removed:
+        del group_kps[course]
+        group_starts.pop(course, None)
+    for course in added:
+        group_starts[course], group_kps[course] = planned_courses[course]
+    planned_added = {c: group_kps[c] for c in ours - removed}
+    planned_added.update((c, group_kps[c]) for c in added)
+    return participants, {"group_kps": group_kps, "group_starts": group_starts,
+                          "courses_version": snapshot.courses_version + 1}
+
+def save_participants_cache(participants):
+    tmp = CACHE_FILE + ".tmp"
+    try:
+        # Заявка в кеш не идёт: из participants.txt она читается быстрее, чем из JSON
+        timing = {g: cols.to_list() for g, cols in participants.items() if planned_groups.get(g) is not cols}
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(timing, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp, CACHE_FILE)
+        print(f"[INFO] Кеш сохранен: {CACHE_FILE}")
+    except Exception as e:
+        print(f"[ERROR] Ошибка сохранения кеша: {e}")
+
+def _parse_changed_blocks(segments, old_blocks):
+    parts = {g: [] for g in current().group_kps.keys()}
+    blocks = {}
+    changed = set()
+    header = {"h2": None, "span": None}
+    for segment in segments:
+        key = hashlib.sha1(f"{header['h2']}\0{header['span']}\0{segment}".encode("utf-8")).hexdigest()
+        block = old_blocks.get(key)
+        if block is None:
+            tables = [(g, group_columns(g, runners))
+                      for g, runners in iter_rezult_tables(segment, header)]
+            block = (tables, dict(header))
+            changed.update(g for g, _ in tables)
+        else:
+            header = dict(block[1])
+        blocks[key] = block
+        for group_name, cols in block[0]:
+            parts[group_name].append(cols)
+
+    for key, (tables, _) in old_blocks.items():
+        if key not in blocks:
+            changed.update(g for g, _ in tables)
+
+    participants = {}
+    for g, cols in parts.items():
+        if len(cols) == 1:
+            participants[g] = cols[0]
+        else:
+            participants[g] = GroupColumns.from_runners(g, (r for c in cols for r in c))
+    return participants, blocks, changed
+
+# Следующая версия собирается в черновике снимка и публикуется целиком: запросы видят либо старые
+# участники с их дистанциями, либо новые. courses — (group_kps, group_starts) из read_group_kps()
+def refresh_participants(force=False, courses=None):
+    with data_lock:
+        outer = getattr(building, "snapshot", None)
+        base = outer or snapshots.current
+        changes = {}
+        if courses is not None:
+            changes = {"group_kps": courses[0], "group_starts": courses[1],
+                       "courses_version": base.courses_version + 1}
+        building.snapshot = base.replace(**changes)
+        # Таблица относится к группе по её названию, а старт входит в пути участников
+        regroup = courses is not None and courses[1] != base.group_starts
+        try:
+            return _refresh_participants(force, changes, regroup)
+        finally:
+            building.snapshot = outer
+
+def _refresh_participants(force, changes, regroup=False):
+    global splits_signature, splits_blocks
+
+    snapshot = current()
+    signature = _splits_signature()
+    if signature is None:
+        if snapshot.participants is None:
+            changes["participants"] = ParticipantStore({g: group_columns(g, runners)
+                                                        for g, runners in parse_splits_html().items()})
+        if changes:
+            publish(**changes)
+        return set()
+    if signature == splits_signature and not force and not changes:
+        return set()
+
+    old = snapshot.participants or {}
+    parse_start = time.perf_counter()
+    blocks = {}
+    if signature[1] is None:
+        # Результатов ещё нет — только заявка
+        participants = {g: group_columns(g, []) for g in snapshot.group_kps}
+        changed = {g for g in participants if g not in old}
+    elif signature[0] == RESULTS_XML:
+        try:
+            parsed = parse_results_xml()
+        except Exception as e:
+            print(f"[WARNING] {RESULTS_XML} не прочитан ({e}), повторим на следующем проходе")
+            return _publish_pending(changes)
+        if _splits_signature() != signature:
+            return _publish_pending(changes)
+        participants, changed = _full_changes(parsed, old)
+    else:
+        content = read_splits_content()
+        if content is None or _splits_signature() != signature:
+            # Файл ещё дописывается — заберём его на следующем проходе
+            return _publish_pending(changes)
+
+        segments = split_rezult_blocks(content)
+        # Таблицы, разобранные по старому списку групп и стартов, не переиспользуем
+        old_blocks = {} if regroup else splits_blocks
+        try:
+            if segments is None:
+                raise ValueError("вложенные таблицы")
+            participants, blocks, changed = _parse_changed_blocks(segments, old_blocks)
+            reparsed = sum(1 for key in blocks if key not in old_blocks)
+            print(f"[INFO] Перечитано таблиц: {reparsed} из {len(segments)}")
+        except Exception as e:
+            print(f"[WARNING] Поблочный разбор невозможен ({e}), полный парсинг")
+            participants, changed = _full_changes(parse_splits_html(), old)
+
+    participants, planned_changes = merge_planned(participants, changed, old)
+    changes.update(planned_changes)
+    for g in participants:
+        if g not in changed and g in old:
+            participants[g] = old[g]
+    participants = ParticipantStore(participants)
+    STAGE_SECONDS.observe(time.perf_counter() - parse_start, stage="parse")
+
+    splits_signature = signature
+    splits_blocks = blocks
+    if not changed and snapshot.participants is not None:
+        return _publish_pending(changes)
+
+    version = snapshot.data_version + 1
+    group_versions = dict(snapshot.group_versions)
+    for g in changed:
+        group_versions[g] = version
+    publish(participants=participants, data_version=version, group_versions=group_versions, **changes)
+    update_search_index(participants)
+    print(f"[INFO] Данные обновлены (версия {version}), группы: {', '.join(sorted(changed)) or '—'}")
+    if old:
+        live_hub.publish(version, live_delta(old, participants, changed, version))
+    else:
+        live_hub.reset(version)
+
+    save_participants_cache(participants)
+    return changed
+
+def _publish_pending(changes):
+    # Участники не поменялись, а дистанции (перечитанный groups.txt, новые из заявки) — да
+    if changes:
+        publish(**changes)
+    return set()
+
+# Для /api/stream: только изменившиеся записи участников и новые размеры групп
+def live_delta(old, participants, changed, version):
+    groups = {}
+    for g in sorted(changed):
+        cols = participants.get(g)
+        if cols is None:
+            groups[g] = None
+            continue
+        before = old[g].to_list() if g in old else []
+        runners = [[i, runner] for i, runner in enumerate(cols.to_list())
+                   if i >= len(before) or before[i] != runner]
+        groups[g] = {"total": len(cols), "runners": runners}
+    return {"version": version, "groups": groups}
+
+# Для server.py: что изменилось в опубликованном снимке после old. Группы — списками участников:
+# id КП в GroupColumns у каждого процесса свои
+def export_update(old):
+    snapshot = snapshots.current
+    before = old.participants or {}
+    after = snapshot.participants or {}
+    update = {
+        "order": list(after),
+        "groups": {g: after[g].to_list() if g in after else None
+                   for g in before.keys() | after.keys() if before.get(g) is not after.get(g)},
+        "data_version": snapshot.data_version,
+        "group_versions": snapshot.group_versions,
+    }
+    if snapshot.courses_version != old.courses_version:
+        update.update(group_kps=snapshot.group_kps, group_starts=snapshot.group_starts,
+                      courses_version=snapshot.courses_version)
+    return update
+
+# Воркер server.py применяет export_update родителя: протокол он не читает, неизменные группы остаются свои
+def apply_update(update):
+    groups = update.pop("groups")
+    with data_lock:
+        snapshot = snapshots.current
+        old = snapshot.participants or {}
+        participants = ParticipantStore({g: GroupColumns.from_runners(g, groups[g]) if g in groups else old[g]
+                                         for g in update.pop("order")})
+        publish(participants=participants, **update)
+    version = update["data_version"]
+    if version == snapshot.data_version:
+        return
+    update_search_index(participants)
+    if old:
+        live_hub.publish(version, live_delta(old, participants, set(groups), version))
+    else:
+        live_hub.reset(version)
+
+def watch_splits(interval=SPLITS_WATCH_INTERVAL):
+    print(f"[INFO] Слежение за {participants_source()} каждые {interval} с")
+    ensure_data()
+    while True:
+        time.sleep(interval)
+        try:
+            refresh_participants()
+        except Exception as e:
+            print(f"[ERROR] Ошибка обновления участников: {e}")
+
+def start_splits_watcher():
+    thread = threading.Thread(target=watch_splits, name="splits-watcher", daemon=True)
+    thread.start()
+    return thread
+
+def _cache_is_fresh():
+    try:
+        return os.path.getmtime(CACHE_FILE) >= os.path.getmtime(participants_source())
+    except OSError:
+        return os.path.exists(CACHE_FILE)
+
 def load_participants():
-    global participants_data
+    participants = current().participants
+    if participants is None:
+        ensure_data()
+        participants = current().participants
+    return participants
+
+def _load_participants():
+    global splits_signature
     
-    if participants_data is not None:
-        return participants_data
+    participants = current().participants
+    if participants is not None:
+        return participants
     
-    if os.path.exists(CACHE_FILE):
+    if _cache_is_fresh():
         try:
             print("[INFO] Загрузка участников из кеша...")
             with open(CACHE_FILE, 'r', encoding='utf-8') as f:
-                participants_data = json.load(f)
-            total = sum(len(v) for v in participants_data.values())
+                cached = ParticipantStore.from_dict(json.load(f))
+            groups, changes = merge_planned(dict(cached.groups), set(), {})
+            participants = ParticipantStore(groups)
+            publish(participants=participants, **changes)
+            splits_signature = _splits_signature()
+            total = participants.total()
+            CACHE_REQUESTS.inc(cache="participants", result="hit")
             print(f"[SUCCESS] Загружено {total} участников из кеша")
-            return participants_data
+            return participants
         except Exception as e:
             print(f"[WARNING] Ошибка загрузки кеша: {e}")
-            participants_data = None
     
-    print("[INFO] Парсинг splits.htm...")
+    CACHE_REQUESTS.inc(cache="participants", result="miss")
+    print(f"[INFO] Парсинг {participants_source()}...")
     start_time = time.time()
     
-    participants_data = parse_splits_html()
+    refresh_participants(force=True)
     
     elapsed = time.time() - start_time
     print(f"[SUCCESS] Парсинг завершен за {elapsed:.2f} секунд")
     
-    try:
-        with open(CACHE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(participants_data, f, ensure_ascii=False, indent=2)
-        print(f"[INFO] Кеш сохранен: {CACHE_FILE}")
-    except Exception as e:
-        print(f"[ERROR] Ошибка сохранения кеша: {e}")
-    
-    return participants_data
+    return current().participants
 
-print("[INFO] Инициализация кеша...")
-load_participants()
-print("[INFO] Инициализация завершена")
+# Перезагрузка groups.txt вместе с участниками — одной публикацией
+def reload_data():
+    with data_lock:
+        return refresh_participants(force=True, courses=read_group_kps())
 
-@app.route("/")
-def index():
-    points, (_, _) = load_all_points()
+def timed_stage(name, fn):
+    start_time = time.time()
+    result = fn()
+    startup_timings[name] = round(time.time() - start_time, 3)
+    return result
+
+# Данные грузятся не при импорте, а здесь: в фоне после старта сервера или при первом запросе
+def load_data():
+    with data_lock:
+        if data_ready.is_set():
+            return
+        print("[INFO] Инициализация кеша...")
+        timed_stage("groups", load_group_kps)
+        timed_stage("points", load_all_points)
+        timed_stage("participants", _load_participants)
+        timed_stage("search", lambda: update_search_index(current().participants))
+        with app.app_context():
+            timed_stage("page", get_index_page)
+        startup_timings["ready"] = round(time.time() - STARTUP_T0, 3)
+        data_ready.set()
+    stages = ", ".join(f"{k} {startup_timings[k]:.2f} с" for k in ("groups", "points", "participants", "search", "page"))
+    print(f"[SUCCESS] Данные готовы через {startup_timings['ready']:.2f} с после старта ({stages})")
+
+def ensure_data():
+    if not data_ready.is_set():
+        load_data()
+
+def start_background_load():
+    def run():
+        try:
+            load_data()
+        except Exception as e:
+            print(f"[ERROR] Ошибка фоновой загрузки данных: {e}")
+    thread = threading.Thread(target=run, name="data-loader", daemon=True)
+    thread.start()
+    return thread
+
+# Пробы и статика не ждут данных, остальные запросы дожидаются окончания загрузки
+NO_DATA_ENDPOINTS = {"healthz", "readyz", "static", "metrics"}
+
+# Замер стартует до ожидания данных: в задержку входит всё, что видит клиент
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.get("request_start")
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        HTTP_LATENCY.observe(time.perf_counter() - start, route=route, method=request.method)
+        HTTP_REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+    return response
+
+def get_metrics_spool():
+    global metrics_spool
+    if metrics_spool is None and METRICS_DIR is not None:
+        metrics_spool = MetricsSpool(registry, METRICS_DIR)
+    return metrics_spool
+
+# Воркер server.py периодически сбрасывает свои метрики в общую папку — их увидит /metrics любого воркера.
+# Родитель пишет только счётчики: соединений и заданий у него нет
+def flush_metrics(gauges=True):
+    spool = get_metrics_spool()
+    if spool is not None:
+        spool.write(gauges)
+
+@app.route('/metrics')
+def metrics():
+    spool = get_metrics_spool()
+    body = registry.render() if spool is None else registry.render(spool.collect())
+    return Response(body, content_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.before_request
+def wait_for_data():
+    if request.endpoint not in NO_DATA_ENDPOINTS:
+        ensure_data()
+        # Весь запрос читает один снимок: перезагрузка в это время публикует следующий, а этот
+        # освободится, когда запрос закончится
+        g.snapshot = snapshots.current
+
+@app.after_request
+def report_first_byte(response):
+    if "first_byte" not in startup_timings:
+        ttfb = round(time.time() - STARTUP_T0, 3)
+        startup_timings["first_byte"] = ttfb
+        status = "в пределах цели" if ttfb <= STARTUP_TTFB_TARGET else "ВЫШЕ цели"
+        level = "INFO" if ttfb <= STARTUP_TTFB_TARGET else "WARNING"
+        print(f"[{level}] Первый ответ через {ttfb:.2f} с после старта ({request.path}), "
+              f"{status} {STARTUP_TTFB_TARGET:.2f} с")
+    return response
+
+@app.route('/healthz')
+def healthz():
+    return jsonify({"status": "ok"})
+
+@app.route('/readyz')
+def readyz():
+    if not data_ready.is_set():
+        response = jsonify({"ready": False, "timings": startup_timings})
+        response.status_code = 503
+        response.headers["Retry-After"] = "1"
+        return response
+    return jsonify({"ready": True, "data_version": current().data_version, "timings": startup_timings})
+
+def page_fingerprint():
+    # Всё, из чего собрана страница (точки, дистанции, состав групп), — в одном снимке; его версии
+    # и версии тайлов достаточно. Тело при пересборке то же, пока не поменялся состав, — ETag по телу не сменится
+    load_participants()
+    return (current().version, get_map_tiles().version)
+
+def build_index_page():
+    points, (map_w, map_h) = load_all_points()
     participants = load_participants()
+    snapshot = current()
 
-    map_b64 = get_map_base64()
-
-    svg = []
-    for kp, p in points.items():
-        if kp == "Ф1":
-            svg.append(f'''
-                <g id="kp_{kp}" class="kp">
-                    <circle cx="{p["cx"]}" cy="{p["cy"]}" r="{p["r"]*1.3}" fill="none" stroke="#ff0000" stroke-width="6"/>
-                    <circle cx="{p["cx"]}" cy="{p["cy"]}" r="{p["r"]*0.7}" fill="none" stroke="#ff0000" stroke-width="6"/>
-                    <text x="{p["cx"] + p["r"]*1.3 + 8}" y="{p["cy"] + p["r"]*1.3 + 8}" font-size="32" font-weight="900" text-anchor="start" dominant-baseline="hanging" fill="#ff0000" stroke="#fff" stroke-width="1.5">Ф1</text>
-                </g>
-            ''')
-        elif kp == "С1" or kp == "С2":
-            triangle_size = p["r"] * 1.2
-            points_str = f'{p["cx"]},{p["cy"] - triangle_size} {p["cx"] - triangle_size},{p["cy"] + triangle_size} {p["cx"] + triangle_size},{p["cy"] + triangle_size}'
-            svg.append(f'''
-                <g id="kp_{kp}" class="kp">
-                    <polygon points="{points_str}" fill="none" stroke="#ff0000" stroke-width="6"/>
-                    <text x="{p["cx"] + triangle_size + 8}" y="{p["cy"] + triangle_size + 8}" font-size="32" font-weight="900" text-anchor="start" dominant-baseline="hanging" fill="#ff0000" stroke="#fff" stroke-width="1.5">{kp}</text>
-                </g>
-            ''')
-        else:
-            svg.append(f'''
-                <g id="kp_{kp}" class="kp">
-                    <circle cx="{p["cx"]}" cy="{p["cy"]}" r="{p["r"]}" fill="none" stroke="#ff0000" stroke-width="4"/>
-                    <text x="{p["cx"] + p["r"] + 8}" y="{p["cy"] + p["r"] + 8}" font-size="40" font-weight="900" text-anchor="start" dominant-baseline="hanging" fill="#ff0000" stroke="#fff" stroke-width="1.5">{kp}</text>
-                </g>
-            ''')
-
-    acc = ""
+    tiles_meta = get_map_tiles().meta()
+
+    overlay = get_control_overlay()
+
+    acc = []
     sorted_groups = list(participants.keys())
     first = sorted_groups[0] if sorted_groups else None
 
+    # Участников в странице нет: список группы подгружается страницами и рисуется только видимая часть
     for g in sorted_groups:
-        runners = participants.get(g, [])
+        total = len(participants.get(g, []))
         open_class = "open" if g == first else ""
-        items = ""
-        for i, r in enumerate(runners):
-            items += f'<div class="person" data-id="{i}" data-group="{g}" onclick="selectRunner(this, event)">{r["name"]}</div>'
-        
-        if not runners:
+        if total:
+            items = f'<div class="rows" style="height:{total * RUNNER_ROW_HEIGHT}px"></div>'
+        else:
             items = '<div class="person" style="color:#888;font-style:italic;">Нет участников</div>'
-            
-        acc += f'<div class="group"><div class="group-header {open_class}" onclick="toggleGroup(this,\'{g}\')">{g} ({len(runners)})</div><div class="person-list {open_class}">{items}</div></div>'
+        acc.append(f'<div class="group"><div class="group-header {open_class}" onclick="toggleGroup(this,\'{g}\')">{g} ({total})</div>'
+                   f'<div class="person-list {open_class}" data-group="{g}" data-total="{total}" onscroll="scheduleRunnerList(this)">{items}</div></div>')
 
     html = f'''<!DOCTYPE html>
 <html lang="ru"><head><meta charset="utf-8"><title>Снежная тропа</title>
@@ -376,6 +1189,10 @@ body,html{{margin:0;height:100%;overflow:hidden;background:#111;color:#fff;font-
 #left.collapsed{{width:0;overflow:hidden}}
 #right.collapsed{{width:0;overflow:hidden}}
 #left-content, #right-content {{height: calc(100% - 80px); overflow-y: auto; padding: 20px; box-sizing: border-box;}}
+#map {{position: relative}}
+#tiles {{position: absolute; top: 0; left: 0; width: 100%; height: 100%; z-index: 0; overflow: hidden}}
+#tiles img {{position: absolute; user-select: none; -webkit-user-drag: none}}
+#heatmap {{position: absolute; top: 0; left: 0; width: 100%; height: 100%; display: none; pointer-events: none}}
 #map-container {{margin: 0 450px 80px 340px; height: calc(100% - 80px); display: flex; justify-content: center; align-items: center; background: #000; transition: .4s;}}
 body.collapsed-left #map-container {{margin-left:0}}
 body.collapsed-right #map-container {{margin-right:0}}
@@ -388,7 +1205,10 @@ body.collapsed-right #right-toggle{{right:0;transform:rotate(180deg)}}
 .group-header{{background:#333;padding:12px;border-radius:8px;cursor:pointer;font-weight:bold}}
 .group-header.open{{background:#a00}}
 .person-list{{max-height:0;overflow:hidden;transition:max-height 0.6s cubic-bezier(0.4, 0, 0.2, 1);background:#2a2a2a;margin-top:5px;border-radius:6px}}
-.person-list.open{{max-height:8000px;padding:8px 0}}
+.person-list.open{{max-height:60vh;overflow-y:auto;padding:8px 0}}
+.rows{{position:relative}}
+.rows .person{{position:absolute;left:0;right:0;height:{RUNNER_ROW_HEIGHT}px;box-sizing:border-box;white-space:nowrap;overflow:hidden;text-overflow:ellipsis}}
+.person small{{color:#aaa;margin-left:8px}}
 .person{{padding:10px 20px;cursor:pointer;border-bottom:1px solid #333}}
 .person:hover{{background:#900}}.person.active{{background:#c40000;font-weight:bold}}
 .kp circle,.kp polygon{{display:none}}
@@ -398,6 +1218,7 @@ body.collapsed-right #right-toggle{{right:0;transform:rotate(180deg)}}
 .kp.alien circle,.kp.alien polygon{{stroke:#0088ff;stroke-width:10}}
 .kp.highlighted circle{{stroke:yellow;stroke-width:16;filter:drop-shadow(0 0 12px yellow)}}
 .kp.highlighted polygon{{stroke:yellow;stroke-width:16;filter:drop-shadow(0 0 12px yellow)}}
+.kp.offscreen{{display:none}}
 #print-btn{{position:fixed;bottom:90px;left:50%;transform:translateX(-50%);z-index:20;background:#c40000;border:none;color:white;padding:12px 24px;border-radius:6px;cursor:pointer;font-size:16px;font-weight:bold}}
 #print-btn:hover {{background: #a00;}}
 .footer {{position: fixed; bottom: 0; left: 0; right: 0; height: 80px; background: rgba(20,20,20,0.95); border-top: 2px solid #c40000; padding: 12px 20px; display: flex; align-items: center; z-index: 100; box-sizing: border-box;}}
@@ -417,8 +1238,10 @@ body.collapsed-right #right-toggle{{right:0;transform:rotate(180deg)}}
 .splits-table .split-row.active td {{background: #c40000 !important; color: white !important; font-weight: bold;}}
 .distance-summary {{margin-top: 15px; font-size: 16px; color: #ffdd88; text-align: center; font-weight: bold;}}
 #legend {{margin:15px 0; padding:10px; background:#333; border-radius:8px;}}
+#search {{width:100%; box-sizing:border-box; padding:10px; margin-bottom:10px; border:none; border-radius:8px; background:#333; color:#fff; font-size:15px}}
+#search-results {{background:#2a2a2a; border-radius:6px; margin-bottom:10px}}
 </style></head><body>
-<div id="left"><div id="left-content"><div class="panel-header" onclick="togglePanel('left')">Участники</div><div id="accordion">{acc}</div></div></div>
+<div id="left"><div id="left-content"><div class="panel-header" onclick="togglePanel('left')">Участники</div><input id="search" type="search" placeholder="Поиск: фамилия, имя, клуб" autocomplete="off" oninput="scheduleSearch()"><div id="search-results"></div><div id="accordion">{"".join(acc)}</div></div></div>
 <button id="left-toggle" class="panel-toggle" onclick="togglePanel('left')">◀</button>
 <div id="right"><div id="right-content">
     <div class="panel-header" onclick="togglePanel('right')">Сплиты</div>
@@ -426,15 +1249,16 @@ body.collapsed-right #right-toggle{{right:0;transform:rotate(180deg)}}
     <div id="splits-info">Выберите участника<br><small style="color:#aaa;">(Ctrl/Cmd + клик — множественный выбор)</small></div>
     <div style="text-align:center;margin-top:20px;">
         <button onclick="clearMap()" style="background:#900;padding:8px 16px;border:none;color:white;border-radius:6px;cursor:pointer;font-size:14px;">Очистить выбор</button>
+        <button id="heatmap-btn" onclick="toggleHeatmap()" style="background:#555;padding:8px 16px;border:none;color:white;border-radius:6px;cursor:pointer;font-size:14px;">Популярные пути</button>
     </div>
 </div></div>
 <button id="right-toggle" class="panel-toggle" onclick="togglePanel('right')">▶</button>
-<div id="map-container"><div id="map"><img src="data:image/png;base64,{map_b64}" id="mapimg">
-<svg style="position:absolute;top:0;left:0;width:100%;height:100%;pointer-events:none">{"".join(svg)}</svg></div></div>
+<div id="map-container"><div id="map" style="width:{map_w}px;height:{map_h}px"><div id="tiles"></div><img id="heatmap" alt="">
+<svg style="position:absolute;top:0;left:0;width:100%;height:100%;pointer-events:none"></svg></div></div>
 <button id="print-btn" onclick="exportToPDF()">🖨️ Печать карты</button>
 <div class="footer">
     <div class="footer-logo">
-        <img src="/static/logo.png" alt="Логотип Импульс">
+        <img src="{URL_PREFIX}/static/logo.png" alt="Логотип Импульс">
         <div style="color:#fff;font-size:16px;font-weight:bold;">Импульс</div>
     </div>
     <div class="footer-text">
@@ -444,23 +1268,124 @@ body.collapsed-right #right-toggle{{right:0;transform:rotate(180deg)}}
 </div>
 <script>
 const points = {json.dumps(points, ensure_ascii=False)};
-const groupKps = {json.dumps(group_kps, ensure_ascii=False)};
-const groupStarts = {json.dumps(group_starts, ensure_ascii=False)};
-let participants = null;
+const groupKps = {json.dumps(snapshot.group_kps, ensure_ascii=False)};
+const groupStarts = {json.dumps(snapshot.group_starts, ensure_ascii=False)};
+const mapMeta = {json.dumps(tiles_meta)};
+const urlPrefix = {json.dumps(URL_PREFIX)};
+const scaleFactor = {json.dumps(SCALE_FACTOR)};
+const overlayUrl = {json.dumps(f"{URL_PREFIX}/overlay/controls.svg?v={overlay.version}")};
+const rowHeight = {RUNNER_ROW_HEIGHT};
+const runnersPage = {RUNNERS_PAGE};
+const kpCullMin = {KP_CULL_MIN};
+let distanceIndex = null;
+let distanceMatrix = null;
+const participants = {{}};
+const groupLoads = {{}};
+const runnerPages = {{}};
 const mapDiv = document.getElementById('map');
-const img = document.getElementById('mapimg');
+const tilesDiv = document.getElementById('tiles');
+const loadedTiles = new Map();
+let tilesFrame = null;
 const svg = document.querySelector('svg');
 const splitsDiv = document.getElementById('splits-info');
 const legendDiv = document.getElementById('legend');
 let scale = 1, posX = 0, posY = 0;
 let selectedRunners = [];
 let activeRunnerForSplits = null;
+let openGroup = null;
+let heatmapOn = false;
+let searchTimer = null;
+let searchSeq = 0;
+// Знаки КП по коду; kpShown — что показано сейчас (Map код -> роль, null — все, undefined — ещё ничего)
+const kpEls = new Map();
+let kpShown;
+let kpHighlighted = null;
+let kpView = null;
+let kpViewTimer = null;
+let kpViewSeq = 0;
+let dragMoved = false, downX = 0, downY = 0;
 const routeColors = ['#ff3366','#33ff66','#3366ff','#ffcc33','#cc33ff','#ff6633','#66ffcc','#ffff33'];
 
-fetch('data.json').then(r => r.json()).then(d => participants = d);
+// Участники группы подгружаются отдельным шардом при раскрытии группы
+function loadGroup(group) {{
+    if (!groupLoads[group]) {{
+        groupLoads[group] = fetch(`${{urlPrefix}}/api/groups/${{encodeURIComponent(group)}}`)
+            .then(r => {{ if (!r.ok) throw new Error(r.status); return r.json(); }})
+            .then(d => {{ participants[group] = d; return d; }})
+            .catch(err => {{ delete groupLoads[group]; throw err; }});
+    }}
+    return groupLoads[group];
+}}
+
+// Слой КП — отдельный SVG с версией в URL: браузер держит его в кеше, страница его только встраивает
+function loadOverlay() {{
+    return fetch(overlayUrl)
+        .then(r => {{ if (!r.ok) throw new Error(r.status); return r.text(); }})
+        .then(text => {{
+            const doc = new DOMParser().parseFromString(text, 'image/svg+xml');
+            const layer = document.importNode(doc.documentElement, true);
+            layer.setAttribute('width', '100%');
+            layer.setAttribute('height', '100%');
+            svg.prepend(layer);
+            layer.querySelectorAll('.kp').forEach(g => kpEls.set(g.id.slice(3), g));
+            // Группу могли открыть до загрузки слоя — применяем то, что уже выбрано
+            const shown = kpShown;
+            kpShown = undefined;
+            setShownKps(shown === undefined ? null : shown);
+            updateKpView();
+        }});
+}}
+
+// Видимость и роль знаков: shown — Map код -> 'own' | 'alien' | '', null — показать все.
+// Трогаем только знаки, у которых что-то могло поменяться, а не весь слой
+function setShownKps(shown) {{
+    const prev = kpShown;
+    kpShown = shown;
+    const ids = new Set(prev && shown ? prev.keys() : kpEls.keys());
+    if (shown) shown.forEach((_, id) => ids.add(id));
+    ids.forEach(id => {{
+        const g = kpEls.get(id);
+        if (!g) return;
+        const role = shown ? shown.get(id) : '';
+        g.classList.toggle('visible', !shown || shown.has(id));
+        g.classList.toggle('own', role === 'own');
+        g.classList.toggle('alien', role === 'alien');
+    }});
+}}
 
 function showAllKPs() {{
-    document.querySelectorAll('.kp').forEach(g => g.classList.add('visible'));
+    setShownKps(null);
+}}
+
+// На больших картах знаки вне видимой области (с запасом в полэкрана) прячем — какие КП в ней, отвечает сервер
+function scheduleKpView() {{
+    if (kpEls.size < kpCullMin) return;
+    clearTimeout(kpViewTimer);
+    kpViewTimer = setTimeout(updateKpView, 150);
+}}
+
+function updateKpView() {{
+    if (kpEls.size < kpCullMin) return;
+    const rect = mapDiv.getBoundingClientRect();
+    const w = innerWidth / scale, h = innerHeight / scale;
+    const x0 = -rect.left / scale - w / 2, y0 = -rect.top / scale - h / 2;
+    const bbox = [x0, y0, x0 + 2 * w, y0 + 2 * h].map(v => v.toFixed(0)).join(',');
+    const seq = ++kpViewSeq;
+    fetch(`${{urlPrefix}}/api/controls/in?bbox=${{bbox}}`)
+        .then(r => {{ if (!r.ok) throw new Error(r.status); return r.json(); }})
+        .then(d => {{
+            if (seq !== kpViewSeq) return;
+            const inView = new Set(d.controls.map(c => c[0]));
+            const prev = kpView;
+            kpView = inView;
+            (prev ? [...prev] : [...kpEls.keys()]).forEach(id => {{
+                if (!inView.has(id) && kpEls.has(id)) kpEls.get(id).classList.add('offscreen');
+            }});
+            inView.forEach(id => {{
+                if ((!prev || !prev.has(id)) && kpEls.has(id)) kpEls.get(id).classList.remove('offscreen');
+            }});
+        }})
+        .catch(() => {{}});
 }}
 
 function fitMap() {{
@@ -468,19 +1393,73 @@ function fitMap() {{
     const rightCollapsed = document.getElementById('right').classList.contains('collapsed');
     const l = leftCollapsed ? 0 : 340;
     const r = rightCollapsed ? 0 : 450;
-    scale = Math.min((innerWidth-l-r)/img.naturalWidth, (innerHeight-80)/img.naturalHeight)*0.94;
+    scale = Math.min((innerWidth-l-r)/mapMeta.width, (innerHeight-80)/mapMeta.height)*0.94;
     posX = posY = 0; 
     update();
 }}
-function update() {{ mapDiv.style.transform = `translate(${{posX}}px,${{posY}}px) scale(${{scale}})`; }}
+function update() {{ mapDiv.style.transform = `translate(${{posX}}px,${{posY}}px) scale(${{scale}})`; scheduleTiles(); scheduleKpView(); }}
+
+// Тайлы: уровень 0 — подложка целиком, поверх — тайлы текущего масштаба в видимой области
+function addTile(z, x, y) {{
+    const key = `${{z}}/${{x}}/${{y}}`;
+    if (loadedTiles.has(key)) return key;
+    const size = mapMeta.tile_size * Math.pow(2, mapMeta.max_zoom - z);
+    const t = document.createElement('img');
+    t.draggable = false;
+    t.src = `${{urlPrefix}}/tiles/${{key}}.png?v=${{mapMeta.version}}`;
+    t.style.left = x * size + 'px';
+    t.style.top = y * size + 'px';
+    t.style.width = t.style.height = size + 'px';
+    t.style.zIndex = z;
+    tilesDiv.appendChild(t);
+    loadedTiles.set(key, t);
+    return key;
+}}
+
+function updateTiles() {{
+    tilesFrame = null;
+    const zoom = mapMeta.max_zoom + Math.ceil(Math.log2(scale * (window.devicePixelRatio || 1)));
+    const z = Math.max(0, Math.min(mapMeta.max_zoom, zoom));
+    const size = mapMeta.tile_size * Math.pow(2, mapMeta.max_zoom - z);
+    const rect = mapDiv.getBoundingClientRect();
+    const x0 = Math.max(0, -rect.left / scale), y0 = Math.max(0, -rect.top / scale);
+    const x1 = Math.min(mapMeta.width, (innerWidth - rect.left) / scale);
+    const y1 = Math.min(mapMeta.height, (innerHeight - rect.top) / scale);
+    const keep = new Set([addTile(0, 0, 0)]);
+    if (x1 > x0 && y1 > y0) {{
+        for (let x = Math.floor(x0 / size); x <= Math.floor((x1 - 1) / size); x++) {{
+            for (let y = Math.floor(y0 / size); y <= Math.floor((y1 - 1) / size); y++) {{
+                keep.add(addTile(z, x, y));
+            }}
+        }}
+    }}
+    loadedTiles.forEach((t, key) => {{
+        if (!keep.has(key)) {{ t.remove(); loadedTiles.delete(key); }}
+    }});
+}}
+function scheduleTiles() {{ if (!tilesFrame) tilesFrame = requestAnimationFrame(updateTiles); }}
 
 mapDiv.addEventListener('wheel', e => {{ e.preventDefault(); scale *= e.deltaY > 0 ? 0.9 : 1.11; scale = Math.max(0.3, Math.min(20, scale)); update(); }});
 
 let dragging = false, sx, sy;
-mapDiv.addEventListener('mousedown', e => {{ if(e.button===0){{ dragging=true; sx=e.clientX-posX; sy=e.clientY-posY; mapDiv.style.cursor='grabbing'; }} }});
-document.addEventListener('mousemove', e => {{ if(dragging){{ posX=e.clientX-sx; posY=e.clientY-sy; update(); }} }});
+mapDiv.addEventListener('mousedown', e => {{ if(e.button===0){{ dragging=true; dragMoved=false; downX=e.clientX; downY=e.clientY; sx=e.clientX-posX; sy=e.clientY-posY; mapDiv.style.cursor='grabbing'; }} }});
+document.addEventListener('mousemove', e => {{ if(dragging){{ if(Math.abs(e.clientX-downX)+Math.abs(e.clientY-downY)>4) dragMoved=true; posX=e.clientX-sx; posY=e.clientY-sy; update(); }} }});
 document.addEventListener('mouseup', () => {{ dragging = false; mapDiv.style.cursor = 'grab'; }});
 
+// Клик по карте (не перетаскивание): КП под курсором ищет сетка на сервере, запас — несколько пикселей экрана
+mapDiv.addEventListener('click', e => {{
+    if (dragMoved) return;
+    const rect = mapDiv.getBoundingClientRect();
+    const x = (e.clientX - rect.left) / scale, y = (e.clientY - rect.top) / scale;
+    fetch(`${{urlPrefix}}/api/controls/at?x=${{x.toFixed(1)}}&y=${{y.toFixed(1)}}&tolerance=${{(6 / scale).toFixed(1)}}`)
+        .then(r => {{ if (!r.ok) throw new Error(r.status); return r.json(); }})
+        .then(d => {{
+            const hit = d.controls.find(c => !kpShown || kpShown.has(c[0]));
+            highlightKP(hit ? hit[0] : null);
+        }})
+        .catch(() => {{}});
+}});
+
 function togglePanel(side) {{
     const panel = document.getElementById(side);
     const toggleBtn = document.getElementById(side + '-toggle');
@@ -497,7 +1476,7 @@ function togglePanel(side) {{
 }}
 
 function clearMap() {{
-    document.querySelectorAll('.kp').forEach(g => g.classList.remove('visible','own','alien','highlighted'));
+    highlightKP(null);
     document.querySelectorAll('.runner-path').forEach(p => p.remove());
     splitsDiv.innerHTML = 'Выберите участника<br><small style="color:#aaa;">(Ctrl/Cmd + клик — множественный выбор)</small>';
     document.querySelectorAll('.person').forEach(p => p.classList.remove('active'));
@@ -507,28 +1486,191 @@ function clearMap() {{
     showAllKPs();
 }}
 
+// Слой популярности перегонов: по открытой группе или по всему соревнованию
+function updateHeatmap() {{
+    const img = document.getElementById('heatmap');
+    document.getElementById('heatmap-btn').style.background = heatmapOn ? '#c40000' : '#555';
+    if (!heatmapOn) {{
+        img.style.display = 'none';
+        return;
+    }}
+    const src = openGroup ? `${{urlPrefix}}/api/groups/${{encodeURIComponent(openGroup)}}/heatmap.png` : `${{urlPrefix}}/api/heatmap.png`;
+    if (img.getAttribute('src') !== src) img.src = src;
+    img.style.display = 'block';
+}}
+
+function toggleHeatmap() {{
+    heatmapOn = !heatmapOn;
+    updateHeatmap();
+}}
+
 function toggleGroup(h, group) {{
     const o = h.classList.contains('open');
     document.querySelectorAll('.group-header,.person-list').forEach(x => x.classList.remove('open'));
+    document.querySelectorAll('.rows').forEach(r => r.replaceChildren());
     clearMap();
+    openGroup = o ? null : group;
+    updateHeatmap();
     if (!o) {{
         h.classList.add('open');
         h.nextElementSibling.classList.add('open');
-        const startCode = groupStarts[group] || 'С1';
-        document.querySelectorAll('.kp').forEach(g => {{
-            const id = g.id.replace('kp_', '');
-            if (id === startCode || id === 'Ф1' || (groupKps[group] && groupKps[group].includes(id))) {{
-                g.classList.add('visible');
-            }} else {{
-                g.classList.remove('visible');
-            }}
-        }});
+        renderRunnerList(h.nextElementSibling);
+        loadGroup(group).catch(() => {{}});
+        const shown = new Map([[groupStarts[group] || 'С1', ''], ['Ф1', '']]);
+        (groupKps[group] || []).forEach(k => shown.set(k, ''));
+        setShownKps(shown);
     }} else {{
         showAllKPs();
     }}
 }}
 
+// Страница строк списка группы: номер, имя, место, результат
+function loadRunnerPage(group, page) {{
+    const pages = runnerPages[group] = runnerPages[group] || {{}};
+    if (!pages[page]) {{
+        pages[page] = fetch(`${{urlPrefix}}/api/groups/${{encodeURIComponent(group)}}/runners?start=${{page * runnersPage}}&limit=${{runnersPage}}`)
+            .then(r => {{ if (!r.ok) throw new Error(r.status); return r.json(); }})
+            .then(d => {{ pages[page].rows = d.rows; return d; }})
+            .catch(err => {{ delete pages[page]; throw err; }});
+    }}
+    return pages[page];
+}}
+
+function runnerRow(group, row) {{
+    const [id, name, place, result] = row;
+    const el = document.createElement('div');
+    el.className = 'person';
+    el.dataset.group = group;
+    el.dataset.id = id;
+    el.style.top = `${{id * rowHeight}}px`;
+    el.textContent = place ? `${{place}}. ${{name}}` : name;
+    const info = document.createElement('small');
+    info.textContent = result;
+    el.appendChild(info);
+    el.onclick = event => selectRunner(el, event);
+    if (selectedRunners.some(r => r.group === group && r.id === id)) el.classList.add('active');
+    return el;
+}}
+
+// В DOM только строки, попадающие в окно списка, плюс небольшой запас сверху и снизу
+function renderRunnerList(list) {{
+    const group = list.dataset.group;
+    const total = parseInt(list.dataset.total);
+    const rowsDiv = list.querySelector('.rows');
+    if (!rowsDiv || !list.classList.contains('open')) return;
+    const height = Math.max(list.clientHeight, window.innerHeight * 0.6);
+    const first = Math.max(0, Math.floor(list.scrollTop / rowHeight) - 10);
+    const last = Math.min(total, Math.ceil((list.scrollTop + height) / rowHeight) + 10);
+    const nodes = [];
+    for (let page = Math.floor(first / runnersPage); page * runnersPage < last; page++) {{
+        const loaded = loadRunnerPage(group, page);
+        if (!loaded.rows) {{
+            loaded.then(() => scheduleRunnerList(list)).catch(() => {{}});
+            continue;
+        }}
+        loaded.rows.forEach(row => {{
+            if (row[0] >= first && row[0] < last) nodes.push(runnerRow(group, row));
+        }});
+    }}
+    rowsDiv.replaceChildren(...nodes);
+}}
+
+function scheduleRunnerList(list) {{
+    if (list.renderFrame) return;
+    list.renderFrame = requestAnimationFrame(() => {{ list.renderFrame = null; renderRunnerList(list); }});
+}}
+
+// Живые обновления: сервер присылает только изменившихся участников и размеры групп
+function connectStream() {{
+    if (!window.EventSource) return;
+    const source = new EventSource(`${{urlPrefix}}/api/stream`);
+    source.addEventListener('delta', e => applyDelta(JSON.parse(e.data)));
+    // Пропустили больше, чем помнит сервер, — проще перечитать страницу
+    source.addEventListener('reset', () => location.reload());
+}}
+
+function applyDelta(delta) {{
+    let redraw = false;
+    Object.entries(delta.groups).forEach(([group, change]) => {{
+        delete runnerPages[group];
+        if (!change) return;
+        const list = document.querySelector(`.person-list[data-group="${{CSS.escape(group)}}"]`);
+        if (list) {{
+            list.dataset.total = change.total;
+            list.previousElementSibling.textContent = `${{group}} (${{change.total}})`;
+            if (!list.querySelector('.rows')) list.innerHTML = '<div class="rows"></div>';
+            list.querySelector('.rows').style.height = `${{change.total * rowHeight}}px`;
+            renderRunnerList(list);
+        }}
+        const runners = participants[group];
+        if (!runners) return;
+        change.runners.forEach(([id, runner]) => {{ runners[id] = runner; }});
+        runners.length = change.total;
+        selectedRunners.forEach(sr => {{
+            if (sr.group === group && runners[sr.id] && runners[sr.id] !== sr.data) {{
+                if (activeRunnerForSplits === sr.data) activeRunnerForSplits = runners[sr.id];
+                sr.data = runners[sr.id];
+                redraw = true;
+            }}
+        }});
+    }});
+    if (redraw) {{
+        splitsDiv.innerHTML = buildSplitsTable(activeRunnerForSplits);
+        drawAllPaths();
+        showKPsForSelected();
+        updateLegend();
+    }}
+}}
+
+// Поиск по всем группам: запрос уходит, когда пользователь перестал печатать
+function scheduleSearch() {{
+    clearTimeout(searchTimer);
+    searchTimer = setTimeout(runSearch, 150);
+}}
+
+function runSearch() {{
+    const q = document.getElementById('search').value.trim();
+    const box = document.getElementById('search-results');
+    const seq = ++searchSeq;
+    if (!q) {{ box.innerHTML = ''; return; }}
+    fetch(`${{urlPrefix}}/api/search?q=${{encodeURIComponent(q)}}`)
+        .then(r => r.json())
+        .then(data => {{
+            if (seq !== searchSeq) return;
+            box.innerHTML = '';
+            data.results.forEach(item => {{
+                const el = document.createElement('div');
+                el.className = 'person';
+                el.dataset.group = item.group;
+                el.dataset.id = item.id;
+                el.textContent = item.name;
+                const info = document.createElement('small');
+                info.textContent = item.club ? `${{item.group}}, ${{item.club}}` : item.group;
+                el.appendChild(info);
+                el.onclick = event => selectRunner(el, event);
+                box.appendChild(el);
+            }});
+            if (!data.results.length) box.innerHTML = '<div class="person" style="color:#888;font-style:italic;">Никого не нашли</div>';
+        }})
+        .catch(() => {{}});
+}}
+
+function loadDistances() {{
+    fetch(`${{urlPrefix}}/api/distances`)
+        .then(r => r.json())
+        .then(data => {{
+            distanceIndex = {{}};
+            data.codes.forEach((kp, i) => {{ distanceIndex[kp] = i; }});
+            distanceMatrix = data.matrix;
+        }})
+        .catch(err => console.error('Ошибка загрузки расстояний:', err));
+}}
+
 function calculateDistance(kp1, kp2) {{
+    if (distanceMatrix) {{
+        const i = distanceIndex[kp1], j = distanceIndex[kp2];
+        return (i === undefined || j === undefined) ? 0 : distanceMatrix[i][j];
+    }}
     if (!points[kp1] || !points[kp2]) return 0;
     const x1 = points[kp1].mm_x || 0;
     const y1 = points[kp1].mm_y || 0;
@@ -537,7 +1679,6 @@ function calculateDistance(kp1, kp2) {{
     const dx = x2 - x1;
     const dy = y2 - y1;
     const distanceMm = Math.sqrt(dx*dx + dy*dy);
-    const scaleFactor = 4;
     const distanceMeters = Math.round(distanceMm * scaleFactor);
     return distanceMeters;
 }}
@@ -594,21 +1735,12 @@ function showKPsForSelected() {{
         }});
     }});
 
-    document.querySelectorAll('.kp').forEach(g => {{
-        const id = g.id.replace('kp_', '');
-        g.classList.remove('visible', 'own', 'alien');
-
-        // Показываем: старты выбранных групп, финиш, свои и взятые КП
-        if (allStarts.has(id) || id === 'Ф1' || allOwn.has(id) || allTaken.has(id)) {{
-            g.classList.add('visible');
-
-            if (allTaken.has(id) && !allOwn.has(id)) {{
-                g.classList.add('alien');
-            }} else if (allOwn.has(id)) {{
-                g.classList.add('own');
-            }}
-        }}
+    // Показываем: старты выбранных групп, финиш, свои и взятые КП
+    const shown = new Map();
+    [...allStarts, 'Ф1', ...allOwn, ...allTaken].forEach(id => {{
+        shown.set(id, allOwn.has(id) ? 'own' : allTaken.has(id) ? 'alien' : '');
     }});
+    setShownKps(shown);
 }}
 
 function buildSplitsTable(runner) {{
@@ -666,19 +1798,21 @@ function buildSplitsTable(runner) {{
         <td><strong>${{finishLeg}}</strong></td><td><strong style="color:#ff4444;">${{result}}</strong></td>
         <td><strong>${{finishDist}}</strong></td><td><strong style="color:#ff4444;">${{cumDist}}</strong></td>
     </tr></tbody></table>
-    <div class="distance-summary">Примерная дистанция: <strong>${{cumDist}} м</strong> (масштаб ≈ 1:4000)</div>`;
+    <div class="distance-summary">Примерная дистанция: <strong>${{cumDist}} м</strong> (масштаб ≈ 1:${{Math.round(1000 * scaleFactor)}})</div>`;
 
     return tbl;
 }}
 
 function selectRunner(el, event) {{
-    if (!participants) return;
-
     const group = el.dataset.group;
+    if (!participants[group]) {{
+        loadGroup(group).then(() => selectRunner(el, event)).catch(err => alert('Ошибка загрузки группы: ' + err.message));
+        return;
+    }}
     const id = parseInt(el.dataset.id);
     const runnerData = participants[group][id];
 
-    const existingIndex = selectedRunners.findIndex(r => r.el === el);
+    const existingIndex = selectedRunners.findIndex(r => r.group === group && r.id === id);
 
     if (event.ctrlKey || event.metaKey) {{
         // Множественный выбор
@@ -687,13 +1821,13 @@ function selectRunner(el, event) {{
             el.classList.remove('active');
         }} else {{
             const colorIndex = selectedRunners.length;
-            selectedRunners.push({{el, data: runnerData, colorIndex}});
+            selectedRunners.push({{group, id, data: runnerData, colorIndex}});
             el.classList.add('active');
         }}
     }} else {{
         // Обычный клик — заменяем выбор
         clearMap();
-        selectedRunners = [{{el, data: runnerData, colorIndex: 0}}];
+        selectedRunners = [{{group, id, data: runnerData, colorIndex: 0}}];
         el.classList.add('active');
     }}
 
@@ -720,12 +1854,11 @@ function updateLegend() {{
 }}
 
 function highlightKP(id) {{
-    document.querySelectorAll('.kp').forEach(g => g.classList.remove('highlighted'));
-    document.querySelectorAll('.split-row').forEach(r => r.classList.remove('active'));
-    const kpEl = document.getElementById('kp_' + id);
-    if (kpEl) kpEl.classList.add('highlighted');
+    if (kpHighlighted) kpHighlighted.classList.remove('highlighted');
+    kpHighlighted = id ? kpEls.get(id) || null : null;
+    if (kpHighlighted) kpHighlighted.classList.add('highlighted');
     document.querySelectorAll('.split-row').forEach(r => {{
-        if (r.cells[1] && r.cells[1].textContent.trim() === id) r.classList.add('active');
+        r.classList.toggle('active', !!id && !!r.cells[1] && r.cells[1].textContent.trim() === id);
     }});
 }}
 
@@ -752,16 +1885,31 @@ function exportToPDF() {{
         path: activeRunnerForSplits.path,
         result: activeRunnerForSplits.result,
         leg_times: activeRunnerForSplits.leg_times,
-        timestamp: new Date().toLocaleString('ru-RU'),
-        points: points,
         runnerGroupKps: groupKps[activeRunnerForSplits.group] || []
     }};
+    const fileName = `маршрут_${{activeRunnerForSplits.name.replace(/[^a-z0-9а-яё]/gi, '_')}}.pdf`;
+    const printBtn = document.getElementById('print-btn');
+    printBtn.disabled = true;
+
+    // Печать асинхронная: ставим задание и опрашиваем его, пока PDF не будет готов
+    const waitJob = job => fetch(job.status_url).then(r => r.json()).then(st => {{
+        if (st.status === 'done') return job;
+        if (st.status === 'error' || st.status === 'expired') throw new Error(st.error || 'Ошибка сервера');
+        return new Promise(resolve => setTimeout(resolve, 500)).then(() => waitJob(job));
+    }});
 
-    fetch('/export-pdf', {{
+    fetch(`${{urlPrefix}}/export-pdf`, {{
         method: 'POST',
         headers: {{ 'Content-Type': 'application/json' }},
         body: JSON.stringify(exportData)
     }})
+    .then(response => {{
+        if (response.status === 503) throw new Error('Очередь печати заполнена, попробуйте через несколько секунд');
+        if (!response.ok) throw new Error('Ошибка сервера');
+        return response.json();
+    }})
+    .then(waitJob)
+    .then(job => fetch(job.download_url))
     .then(response => {{
         if (!response.ok) throw new Error('Ошибка сервера');
         return response.blob();
@@ -770,170 +1918,1093 @@ function exportToPDF() {{
         const url = window.URL.createObjectURL(blob);
         const a = document.createElement('a');
         a.href = url;
-        a.download = `маршрут_${{activeRunnerForSplits.name.replace(/[^a-z0-9а-яё]/gi, '_')}}.pdf`;
+        a.download = fileName;
         document.body.appendChild(a);
         a.click();
         window.URL.revokeObjectURL(url);
         document.body.removeChild(a);
     }})
-    .catch(err => alert('Ошибка создания PDF: ' + err.message));
+    .catch(err => alert('Ошибка создания PDF: ' + err.message))
+    .finally(() => {{ printBtn.disabled = false; }});
 }}
 
-window.onload = () => {{ fitMap(); window.onresize = fitMap; setTimeout(showAllKPs, 100); }};
+window.onload = () => {{
+    fitMap(); window.onresize = fitMap; loadDistances(); connectStream();
+    loadOverlay().catch(() => {{}});
+    document.querySelectorAll('.person-list.open').forEach(renderRunnerList);
+}};
 </script></body></html>'''
 
-    with open("static/data.json", "w", encoding="utf-8") as f:
-        json.dump(participants_data, f, ensure_ascii=False)
-
     return render_template_string(html)
 
-@app.route('/export-pdf', methods=['POST'])
-def export_pdf():
-    # (оставлен без изменений — печатает последнего выбранного участника)
-    try:
-        data = request.get_json()
-        map_b64 = get_map_base64()
-        runner = data['name']
-        group = data['group']
-        result = data['result']
-        timestamp = data['timestamp']
-        path = data['path']
-        points = data['points']
-        runner_group_kps = data['runnerGroupKps']
-
-        points_all, map_size = load_all_points()
-        map_width, map_height = map_size
-
-        SCALE_FACTOR = 4
-
-        distances = []
-        total_distance = 0
-        for i in range(len(path) - 1):
-            kp1 = path[i]
-            kp2 = path[i + 1]
-            if kp1 in points and kp2 in points:
-                dx = points[kp2]['mm_x'] - points[kp1]['mm_x']
-                dy = points[kp2]['mm_y'] - points[kp1]['mm_y']
-                dist_mm = math.sqrt(dx*dx + dy*dy)
-                dist_m = round(dist_mm * SCALE_FACTOR)
-                distances.append(dist_m)
-                total_distance += dist_m
-            else:
-                distances.append(0)
-
-        svg_parts = []
-        for kp_id, p in points.items():
-            cx, cy, r = p['cx'], p['cy'], p.get('r', 20)
+# Страница собирается один раз на версию данных, повторные запросы — из памяти или 304
+def get_index_page():
+    global page_cache
+    key = page_fingerprint()
+    cached = page_cache
+    if cached is None or cached[0] != key:
+        with page_lock:
+            cached = page_cache
+            if cached is None or cached[0] != key:
+                CACHE_REQUESTS.inc(cache="page", result="miss")
+                start_time = time.time()
+                with STAGE_SECONDS.time(stage="page"):
+                    body = build_index_page().encode("utf-8")
+                cached = (key, body, hashlib.sha1(body).hexdigest())
+                page_cache = cached
+                print(f"[INFO] Страница пересобрана за {time.time() - start_time:.2f} секунд")
+                return cached
+    CACHE_REQUESTS.inc(cache="page", result="hit")
+    return cached
 
-            if kp_id not in path and kp_id not in ('С1', 'С2', 'Ф1') and kp_id not in runner_group_kps:
-                continue
-
-            if kp_id == path[0]:
-                size = r * 1.5
-                polygon = f"{cx},{cy-size} {cx-size},{cy+size} {cx+size},{cy+size}"
-                svg_parts.append(f'''
-                    <polygon points="{polygon}" fill="none" stroke="#ff0000" stroke-width="10"/>
-                    <text x="{cx + size + 15}" y="{cy + size + 15}" font-size="48" fill="#ff0000" font-weight="bold">{kp_id}</text>
-                ''')
-            elif kp_id == 'Ф1':
-                svg_parts.append(f'''
-                    <circle cx="{cx}" cy="{cy}" r="{r*1.8}" fill="none" stroke="#ff0000" stroke-width="10"/>
-                    <circle cx="{cx}" cy="{cy}" r="{r*1.0}" fill="none" stroke="#ff0000" stroke-width="10"/>
-                    <text x="{cx + r*1.8 + 15}" y="{cy + r*1.8 + 15}" font-size="48" fill="#ff0000" font-weight="bold">Ф1</text>
-                ''')
-            else:
-                color = "#ff0000" if kp_id in runner_group_kps else "#0066ff"
-                if kp_id in path and kp_id not in runner_group_kps:
-                    color = "#0066ff"
-                svg_parts.append(f'''
-                    <circle cx="{cx}" cy="{cy}" r="{r*1.2}" fill="none" stroke="{color}" stroke-width="8"/>
-                    <text x="{cx + r*1.2 + 12}" y="{cy + r*1.2 + 12}" font-size="42" fill="{color}" font-weight="bold">{kp_id}</text>
-                ''')
-
-        path_d = ""
-        prev = None
-        for kp in path:
-            if kp not in points:
-                continue
-            x, y = points[kp]['cx'], points[kp]['cy']
-            if prev is None:
-                path_d = f"M {x},{y}"
-            else:
-                path_d += f" L {x},{y}"
-            prev = (x, y)
+@app.route("/")
+def index():
+    _, body, etag = get_index_page()
+    response = Response(body, mimetype="text/html")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
+# Документы слоя КП строятся один раз на версию точек и groups.txt
+def get_control_overlay():
+    global control_overlay
+    from overlay import ControlOverlay
+    points, map_size = load_all_points()
+    snapshot = current()
+    cached = control_overlay
+    if cached is None or cached[0] is not points or cached[1] != snapshot.courses_version:
+        start_time = time.time()
+        with STAGE_SECONDS.time(stage="overlay"):
+            overlay = ControlOverlay(points, map_size, snapshot.group_kps, snapshot.group_starts)
+        cached = control_overlay = (points, snapshot.courses_version, overlay)
+        print(f"[INFO] Слой КП {overlay.version}: {len(overlay.groups)} групп за {time.time() - start_time:.2f} с")
+    return cached[2]
+
+# Сетка КП для попаданий и выборки по области — одна на версию точек
+def get_control_grid():
+    global control_grid
+    from controls import ControlGrid
+    points, map_size = load_all_points()
+    cached = control_grid
+    if cached is None or cached[0] is not points:
+        start_time = time.time()
+        with STAGE_SECONDS.time(stage="grid"):
+            grid = ControlGrid(points, map_size)
+        cached = control_grid = (points, grid)
+        print(f"[INFO] Сетка КП: {grid.count} КП в {len(grid.cells)} ячейках по {grid.cell:.0f} px "
+              f"за {time.time() - start_time:.3f} с")
+    return cached[1]
+
+def parse_bbox(value):
+    try:
+        bbox = tuple(float(v) for v in (value or "").split(","))
+    except ValueError:
+        return None
+    if len(bbox) != 4 or not all(math.isfinite(v) for v in bbox):
+        return None
+    return bbox
+
+def overlay_response(name, doc):
+    overlay = get_control_overlay()
+    cached = overlay_payloads.get(name)
+    CACHE_REQUESTS.inc(cache="overlay", result="hit" if cached is not None and cached[0] is overlay else "miss")
+    if cached is None or cached[0] is not overlay:
+        cached = overlay_payloads[name] = (overlay, *compress_payload(doc.encode("utf-8")))
+    _, payload, etag = cached
+    response = send_compressed(payload, etag, mimetype="image/svg+xml")
+    # По URL с текущей версией слой не меняется никогда, без версии — проверяется каждый раз
+    if request.args.get("v") == overlay.version:
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+@app.route('/overlay/controls.svg')
+def overlay_controls():
+    return overlay_response(None, get_control_overlay().controls)
+
+@app.route('/overlay/groups/<group>.svg')
+def overlay_group(group):
+    doc = get_control_overlay().groups.get(group)
+    if doc is None:
+        return jsonify({"error": "Группа не найдена"}), 404
+    return overlay_response(group, doc)
+
+@app.route('/tiles/<int:z>/<int:x>/<int:y>.png')
+def map_tile(z, x, y):
+    data = get_map_tiles().tile(z, x, y)
+    if data is None:
+        return jsonify({"error": "Тайл не найден"}), 404
+    response = Response(data, mimetype="image/png")
+    # В URL тайла стоит версия карты, поэтому его можно кешировать навсегда
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+PDF_WORKERS = int(os.environ.get("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_QUEUE_LIMIT = int(os.environ.get("PDF_QUEUE_LIMIT", "16"))
+PDF_CACHE_SIZE = int(os.environ.get("PDF_CACHE_SIZE", "64"))
+PDF_JOB_TTL = 600
+PDF_MAX_JOBS = 1000
+# Шрифт из системного пакета (fonts-dejavu-core в Dockerfile); без файла WeasyPrint ищет local('DejaVu Sans')
+FONT_FILES = ["/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"]
+
+pdf_pool = None
+pdf_pool_lock = threading.Lock()
+# (адрес, ключ) общего сервиса печати из pdf_service.py — его поднимает server.py; без него пул у процесса свой
+PDF_SERVICE = None
+pdf_service = None
+pdf_lock = threading.Lock()
+pdf_jobs = collections.OrderedDict()
+pdf_inflight = {}
+pdf_results = collections.OrderedDict()
+pdf_layers = {}
+
+def file_url(path):
+    return pathlib.Path(os.path.abspath(path)).as_uri()
+
+# Слой КП группы берётся готовым из ControlOverlay; если старт или КП не совпали с groups.txt,
+# слой собирается под участника и запоминается
+def pdf_control_layer(group, start, runner_group_kps, points, map_size):
+    from overlay import svg_document, course_marks
+    overlay = get_control_overlay()
+    snapshot = current()
+    if (group in overlay.groups and start == snapshot.group_starts.get(group)
+            and list(runner_group_kps) == snapshot.group_kps.get(group)):
+        return overlay.groups[group]
+    key = (start, tuple(runner_group_kps), id(points))
+    layer = pdf_layers.get(key)
+    if layer is None:
+        layer = pdf_layers[key] = svg_document(course_marks(start, runner_group_kps, points), map_size)
+    return layer
+
+def pdf_route_page(runner, group, result, timestamp, path, runner_group_kps, points, map_size):
+    from overlay import control_mark, ALIEN_COLOR
+    from controls import route_marks
+    map_width, map_height = map_size
+
+    total_distance = route_distance(path)
+
+    # Чужие КП, взятые участником, — поверх общего слоя группы; лист печатается целиком, без области
+    alien = "".join(control_mark(kp, points[kp], ALIEN_COLOR)
+                    for kp, own in route_marks(path[0], runner_group_kps, path, points) if not own)
+
+    path_d = ""
+    prev = None
+    for kp in path:
+        if kp not in points:
+            continue
+        x, y = points[kp]['cx'], points[kp]['cy']
+        if prev is None:
+            path_d = f"M {x},{y}"
+        else:
+            path_d += f" L {x},{y}"
+        prev = (x, y)
 
-        logo_path = os.path.abspath('static/logo.png')
-        logo_url = f"file://{logo_path.replace(os.sep, '/')}"
+    return f"""
+    <div class="page"><div class="container">
+        <img src="{file_url(MAP_IMAGE)}" class="map">
+        <div class="info">
+            <strong>{runner}</strong><br>
+            Группа: {group}<br>
+            Результат: {result}<br>
+            Дистанция: ≈ {total_distance} м (масштаб 1:{int(1000 * SCALE_FACTOR)})
+        </div>
+        {f'<div class="timestamp">Распечатано: {timestamp}</div>' if timestamp else ''}
+        <svg viewBox="0 0 {map_width} {map_height}">
+            {pdf_control_layer(group, path[0], runner_group_kps, points, map_size)}
+            {alien}
+            <path d="{path_d}" fill="none" stroke="#ff3366" stroke-width="16" stroke-linecap="round" opacity="0.9"/>
+        </svg>
+    </div></div>"""
 
-        html_content = f"""<!DOCTYPE html>
+def pdf_document(title, pages, map_size):
+    map_width, map_height = map_size
+    return f"""<!DOCTYPE html>
 <html lang="ru">
 <head>
     <meta charset="utf-8">
-    <title>Маршрут {runner}</title>
+    <title>{title}</title>
     <style>
         @page {{ size: A4 landscape; margin: 10mm; }}
-        body {{ margin: 0; padding: 0; font-family: 'DejaVu Sans', Arial, sans-serif; background: white; height: 100vh; display: flex; align-items: center; justify-content: center; }}
+        body {{ margin: 0; padding: 0; font-family: 'DejaVu Sans', Arial, sans-serif; background: white; }}
+        .page {{ height: 190mm; display: flex; align-items: center; justify-content: center; break-after: page; }}
+        .page:last-child {{ break-after: auto; }}
         .container {{ position: relative; width: 100%; max-width: 277mm; height: auto; aspect-ratio: {map_width} / {map_height}; max-height: 190mm; margin: auto; box-shadow: 0 0 10px rgba(0,0,0,0.2); }}
         .map {{ width: 100%; height: 100%; object-fit: contain; }}
         .info {{ position: absolute; top: 10px; right: 20px; font-size: 26px; color: #000; background: rgba(255,255,255,0.9); padding: 12px 16px; border-radius: 8px; z-index: 10; text-align: right; max-width: 45%; }}
         .timestamp {{ position: absolute; top: 140px; right: 20px; font-size: 18px; color: #555; background: rgba(255,255,255,0.8); padding: 8px 12px; border-radius: 6px; z-index: 10; }}
-        .footer {{ position: absolute; bottom: 20px; left: 20px; right: 20px; display: flex; align-items: center; justify-content: space-between; z-index: 10; background: rgba(255,255,255,0.8); padding: 10px; border-radius: 8px; }}
-        .footer-logo {{ display: flex; align-items: center; gap: 15px; }}
-        .footer-logo img {{ height: 60px; }}
-        .footer-text {{ font-size: 18px; color: #333; font-style: italic; }}
         svg {{ position: absolute; top: 0; left: 0; width: 100%; height: 100%; z-index: 5; pointer-events: none; }}
     </style>
 </head>
-<body>
-    <div class="container">
-        <img src="data:image/png;base64,{map_b64}" class="map">
-        <div class="info">
-            <strong>{runner}</strong><br>
-            Группа: {group}<br>
-            Результат: {result}<br>
-            Дистанция: ≈ {total_distance} м (масштаб 1:{int(1000 * SCALE_FACTOR)})
-        </div>
-        <div class="timestamp">Распечатано: {timestamp}</div>
-        <svg viewBox="0 0 {map_width} {map_height}">
-            {"".join(svg_parts)}
-            <path d="{path_d}" fill="none" stroke="#ff3366" stroke-width="16" stroke-linecap="round" opacity="0.9"/>
-        </svg>
-    </div>
+<body>{"".join(pages)}
 </body>
 </html>"""
 
-        font_config = FontConfiguration()
-        html_obj = HTML(string=html_content, base_url=os.path.dirname(os.path.abspath(__file__)))
-        css = CSS(string="""
-            @font-face {
-                font-family: 'DejaVu Sans';
-                src: url('https://github.com/dejavu-fonts/dejavu-fonts.github.io/raw/master/dejavu-fonts-ttf-2.37/ttf/DejaVuSans.ttf');
-            }
-            body { font-family: 'DejaVu Sans', sans-serif; }
-        """, font_config=font_config)
-
-        buffer = io.BytesIO()
-        html_obj.write_pdf(buffer, stylesheets=[css], font_config=font_config)
-        buffer.seek(0)
-
-        safe_name = "".join(c if c.isalnum() or c in " _-()" else "_" for c in runner).strip()
-        filename = f"маршрут_{safe_name}.pdf"
-        encoded_name = urllib.parse.quote(filename)
-
-        return Response(
-            buffer.getvalue(),
-            mimetype="application/pdf",
-            headers={'Content-Disposition': f"attachment; filename*=UTF-8''{encoded_name}"}
-        )
+def build_route_html(runner, group, result, timestamp, path, runner_group_kps, points, map_size):
+    page = pdf_route_page(runner, group, result, timestamp, path, runner_group_kps, points, map_size)
+    return pdf_document(f"Маршрут {runner}", [page], map_size)
+
+# Процессы-рендереры: WeasyPrint, шрифты и кеш картинок поднимаются один раз на процесс
+_pdf_renderer = None
+
+def _pdf_worker_init():
+    global _pdf_renderer
+    from weasyprint import CSS
+    from weasyprint.text.fonts import FontConfiguration
+    font_file = next((f for f in FONT_FILES if os.path.exists(f)), None)
+    src = "local('DejaVu Sans')"
+    if font_file:
+        src += f", url('{file_url(font_file)}')"
+    font_config = FontConfiguration()
+    css = CSS(string=f"""
+        @font-face {{
+            font-family: 'DejaVu Sans';
+            src: {src};
+        }}
+        body {{ font-family: 'DejaVu Sans', sans-serif; }}
+    """, font_config=font_config)
+    _pdf_renderer = (font_config, css, {})
+
+def _pdf_warmup():
+    return os.getpid()
+
+def render_pdf(html_content):
+    if _pdf_renderer is None:
+        _pdf_worker_init()
+    from weasyprint import HTML
+    font_config, css, image_cache = _pdf_renderer
+    html_obj = HTML(string=html_content, base_url=os.path.dirname(os.path.abspath(__file__)))
+    return html_obj.write_pdf(stylesheets=[css], font_config=font_config, cache=image_cache)
+
+# Задание печати меряет сам рендеринг в процессе-рендерере — ожидание в очереди в pdf_render не входит
+def render_pdf_timed(html_content):
+    start = time.perf_counter()
+    pdf = render_pdf(html_content)
+    return pdf, time.perf_counter() - start
+
+def get_pdf_pool():
+    global pdf_pool
+    if pdf_pool is None:
+        with pdf_pool_lock:
+            if pdf_pool is None:
+                pdf_pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, initializer=_pdf_worker_init)
+                for _ in range(PDF_WORKERS):
+                    pdf_pool.submit(_pdf_warmup)
+                print(f"[INFO] Пул рендеринга PDF: {PDF_WORKERS} процессов")
+    return pdf_pool
+
+def get_pdf_service():
+    global pdf_service
+    if pdf_service is None:
+        with pdf_pool_lock:
+            if pdf_service is None:
+                from pdf_service import RenderClient
+                address, authkey = PDF_SERVICE
+                # Поток на задание в очереди и на пачки одной массовой выгрузки
+                pdf_service = RenderClient(address, authkey, PDF_QUEUE_LIMIT + PDF_WORKERS * 2)
+    return pdf_service
+
+# Место в очереди печати: у сервиса оно общее для всех воркеров, без него — по заданиям этого процесса
+def reserve_render(inflight):
+    if PDF_SERVICE is None:
+        return len(inflight) < PDF_QUEUE_LIMIT
+    return get_pdf_service().reserve()
+
+def release_render():
+    if PDF_SERVICE is not None:
+        get_pdf_service().release()
+
+def submit_render(fn, *args, reserved=False):
+    global pdf_pool
+    if PDF_SERVICE is not None:
+        return get_pdf_service().submit(fn, args, reserved)
+    pool = get_pdf_pool()
+    try:
+        return pool.submit(fn, *args)
+    except BrokenProcessPool:
+        # Упавший процесс ломает весь пул — пересоздаём его и пробуем ещё раз
+        print("[WARNING] Пул рендеринга PDF сломан, пересоздаётся")
+        with pdf_pool_lock:
+            if pdf_pool is pool:
+                pdf_pool = None
+        pool.shutdown(wait=False)
+        return get_pdf_pool().submit(fn, *args)
+
+def pdf_filename(runner):
+    safe_name = "".join(c if c.isalnum() or c in " _-()" else "_" for c in runner).strip()
+    return f"маршрут_{safe_name}.pdf"
+
+# Общая папка заданий печати для нескольких процессов сервера: статус и PDF видны любому из них
+PDF_SPOOL_DIR = os.environ.get("PDF_SPOOL_DIR") or None
+JOB_ID_RE = re.compile(r'[0-9a-f]{32}')
+
+def spool_path(name):
+    return os.path.join(PDF_SPOOL_DIR, name)
+
+def spool_write(name, data):
+    path = spool_path(name)
+    try:
+        os.makedirs(PDF_SPOOL_DIR, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"[WARNING] Не удалось записать {path}: {e}")
+
+def spool_read(name):
+    try:
+        with open(spool_path(name), "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+def spooled_job(job_id):
+    if PDF_SPOOL_DIR is None or not JOB_ID_RE.fullmatch(job_id):
+        return None
+    raw = spool_read(f"{job_id}.job")
+    if raw is None:
+        return None
+    job = json.loads(raw)
+    if job["created"] < time.time() - PDF_JOB_TTL:
+        return None
+    job["future"] = None
+    return job
+
+def sweep_pdf_spool():
+    if PDF_SPOOL_DIR is None or not os.path.isdir(PDF_SPOOL_DIR):
+        return
+    deadline = time.time() - PDF_JOB_TTL
+    for entry in os.scandir(PDF_SPOOL_DIR):
+        try:
+            if entry.stat().st_mtime < deadline:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+def _pdf_done(key, future):
+    failed = future.cancelled() or future.exception() is not None
+    if not failed:
+        pdf, seconds = future.result()
+        STAGE_SECONDS.observe(seconds, stage="pdf_render")
+    if PDF_SPOOL_DIR is not None and not future.cancelled():
+        if failed:
+            spool_write(f"{key}.err", str(future.exception()).encode("utf-8"))
+        else:
+            spool_write(f"{key}.pdf", pdf)
+    with pdf_lock:
+        pdf_inflight.pop(key, None)
+        if failed:
+            return
+        pdf_results[key] = pdf
+        pdf_results.move_to_end(key)
+        while len(pdf_results) > PDF_CACHE_SIZE:
+            pdf_results.popitem(last=False)
+
+def _expire_pdf_jobs():
+    deadline = time.time() - PDF_JOB_TTL
+    while pdf_jobs:
+        job = next(iter(pdf_jobs.values()))
+        if job["created"] > deadline and len(pdf_jobs) < PDF_MAX_JOBS:
+            break
+        pdf_jobs.popitem(last=False)
+
+def submit_pdf_job(data):
+    points, map_size = load_all_points()
+    runner = data['name']
+    group = data['group']
+    result = data['result']
+    path = data['path']
+    runner_group_kps = data.get('runnerGroupKps') or current().group_kps.get(group, [])
+
+    # Одинаковый участник, путь и КП группы дают один и тот же PDF. Метки «Распечатано» в нём нет:
+    # время печати сделало бы каждый запрос уникальным и кеш бесполезным
+    key = hashlib.sha1(json.dumps(
+        [runner, group, result, path, runner_group_kps, points, map_size], ensure_ascii=False, sort_keys=True
+    ).encode("utf-8")).hexdigest()
+
+    created = None
+    with pdf_lock:
+        _expire_pdf_jobs()
+        future = None
+        if key in pdf_results:
+            pdf_results.move_to_end(key)
+        elif PDF_SPOOL_DIR is not None and os.path.exists(spool_path(f"{key}.pdf")):
+            pass
+        elif key in pdf_inflight:
+            future = pdf_inflight[key]
+        else:
+            if not reserve_render(pdf_inflight):
+                return None
+            CACHE_REQUESTS.inc(cache="pdf", result="miss")
+            try:
+                html_content = build_route_html(runner, group, result, None, path,
+                                                runner_group_kps, points, map_size)
+                future = created = pdf_inflight[key] = submit_render(render_pdf_timed, html_content, reserved=True)
+            except Exception:
+                release_render()
+                raise
+        if created is None:
+            CACHE_REQUESTS.inc(cache="pdf", result="hit")
+        job_id = uuid.uuid4().hex
+        # ready — PDF уже был готов: если его потом вытеснят из кеша, ждать задания больше нечего
+        pdf_jobs[job_id] = {"key": key, "filename": pdf_filename(runner), "created": time.time(),
+                            "ready": future is None, "future": future}
+
+    if PDF_SPOOL_DIR is not None:
+        job = pdf_jobs[job_id]
+        spool_write(f"{job_id}.job", json.dumps(
+            {"key": key, "filename": job["filename"], "created": job["created"], "ready": job["ready"]},
+            ensure_ascii=False).encode("utf-8"))
+
+    if created is not None:
+        created.add_done_callback(lambda f: _pdf_done(key, f))
+    return job_id
+
+def pdf_job_status(job):
+    if job["key"] in pdf_results:
+        return "done", None
+    if PDF_SPOOL_DIR is not None:
+        if os.path.exists(spool_path(f"{job['key']}.pdf")):
+            return "done", None
+        error = spool_read(f"{job['key']}.err")
+        if error is not None:
+            return "error", error.decode("utf-8")
+    future = job["future"]
+    if future is None:
+        # Без future задание либо рендерит другой процесс, либо его PDF уже вытеснен из кеша
+        if job.get("ready"):
+            return "expired", "PDF больше не хранится, повторите печать"
+        return "queued", None
+    if not future.done():
+        return "queued", None
+    if future.exception() is not None:
+        return "error", str(future.exception())
+    return "done", None
 
+@app.route('/export-pdf', methods=['POST'])
+def export_pdf():
+    try:
+        data = request.get_json()
+        job_id = submit_pdf_job(data)
     except Exception as e:
         import traceback
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
+    if job_id is None:
+        response = jsonify({"error": "Очередь печати заполнена, повторите позже"})
+        response.status_code = 503
+        response.headers["Retry-After"] = "5"
+        return response
+
+    return jsonify({
+        "job_id": job_id,
+        "status_url": f"{URL_PREFIX}/export-pdf/{job_id}",
+        "download_url": f"{URL_PREFIX}/export-pdf/{job_id}/download",
+    }), 202
+
+@app.route('/export-pdf/<job_id>')
+def export_pdf_status(job_id):
+    job = pdf_jobs.get(job_id) or spooled_job(job_id)
+    if job is None:
+        return jsonify({"error": "Задание не найдено"}), 404
+    status, error = pdf_job_status(job)
+    body = {"job_id": job_id, "status": status}
+    if error:
+        body["error"] = error
+    return jsonify(body), 410 if status == "expired" else 200
+
+@app.route('/export-pdf/<job_id>/download')
+def export_pdf_download(job_id):
+    job = pdf_jobs.get(job_id) or spooled_job(job_id)
+    if job is None:
+        return jsonify({"error": "Задание не найдено"}), 404
+    status, error = pdf_job_status(job)
+    if status != "done":
+        return jsonify({"status": status, "error": error}), {"queued": 409, "expired": 410}.get(status, 500)
+
+    pdf = pdf_results.get(job["key"])
+    if pdf is None and PDF_SPOOL_DIR is not None:
+        pdf = spool_read(f"{job['key']}.pdf")
+    if pdf is None:
+        # Между проверкой статуса и чтением PDF мог вытеснить другой запрос
+        if job["future"] is None:
+            return jsonify({"status": "expired", "error": "PDF больше не хранится, повторите печать"}), 410
+        pdf, _ = job["future"].result()
+    return Response(pdf, mimetype="application/pdf", headers=attachment_headers(job["filename"]))
+
+# Массовая печать: страницы строятся здесь, рендерятся пачками в пуле и отдаются по мере готовности
+PDF_BULK_CHUNK = int(os.environ.get("PDF_BULK_CHUNK", "8"))
+
+def render_pdf_many(html_documents):
+    return [render_pdf(html) for html in html_documents]
+
+def ordered_renders(fn, tasks):
+    # Не больше двух пачек на процесс в работе — память не растёт с размером выгрузки
+    pending = collections.deque()
+    try:
+        for meta, arg in tasks:
+            pending.append((meta, submit_render(fn, arg)))
+            if len(pending) >= PDF_WORKERS * 2:
+                meta, future = pending.popleft()
+                yield meta, future.result()
+        while pending:
+            meta, future = pending.popleft()
+            yield meta, future.result()
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+def chunked(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def print_timestamp():
+    return time.strftime("%d.%m.%Y, %H:%M:%S")
+
+def group_route_pages(group, runners, points, map_size, timestamp):
+    kps = current().group_kps.get(group, [])
+    for runner in runners:
+        page = pdf_route_page(runner["name"], group, runner["result"], timestamp, runner["path"], kps, points, map_size)
+        yield runner, page
+
+def attachment_headers(filename):
+    return {'Content-Disposition': f"attachment; filename*=UTF-8''{urllib.parse.quote(filename)}"}
+
+class ZipStream(io.RawIOBase):
+    # Несидируемый поток для zipfile: всё записанное забирается через drain()
+    def __init__(self):
+        self.chunks = []
+        self.offset = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.offset
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+class PdfStream:
+    # Один PDF из многих, записываемый по мере готовности: объекты каждого документа сразу уходят
+    # клиенту с новыми номерами, в памяти — только смещения объектов и номера страниц.
+    # Каталог (1) и дерево страниц (2) пишутся в конце — ссылки вперёд PDF допускает
+    def __init__(self):
+        self.offset = 0
+        self.offsets = {}
+        self.pages = []
+        self.next_number = 3
+
+    def _emit(self, data):
+        self.offset += len(data)
+        return data
+
+    def _object(self, out, number, write):
+        self.offsets[number] = self.offset + out.tell()
+        out.write(f"{number} 0 obj\n".encode())
+        write(out)
+        out.write(b"\nendobj\n")
+
+    def header(self):
+        return self._emit(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+
+    def append(self, pdf):
+        from pypdf import PdfReader
+        from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject
+
+        reader = PdfReader(io.BytesIO(pdf))
+        numbers = {}
+        queue = []
+
+        def renumber(ref):
+            key = (ref.idnum, ref.generation)
+            if key not in numbers:
+                numbers[key] = self.next_number
+                self.next_number += 1
+                queue.append(ref)
+            return numbers[key]
+
+        def remap(obj):
+            if isinstance(obj, IndirectObject):
+                return IndirectObject(renumber(obj), 0, None)
+            if isinstance(obj, DictionaryObject):
+                for name, value in list(obj.items()):
+                    obj[name] = remap(value)
+            elif isinstance(obj, ArrayObject):
+                for i, value in enumerate(obj):
+                    obj[i] = remap(value)
+            return obj
+
+        # Страницы берутся из reader.pages: в них уже унаследованные от дерева Resources и MediaBox
+        pages = {}
+        for page in reader.pages:
+            ref = page.indirect_reference
+            pages[(ref.idnum, ref.generation)] = page
+            self.pages.append(renumber(ref))
+
+        out = io.BytesIO()
+        while queue:
+            ref = queue.pop()
+            key = (ref.idnum, ref.generation)
+            obj = pages.get(key)
+            if obj is None:
+                obj = ref.get_object()
+            else:
+                # Старое дерево страниц за собой не тянем
+                obj.pop("/Parent", None)
+            obj = remap(obj)
+            if key in pages:
+                obj[NameObject("/Parent")] = IndirectObject(2, 0, None)
+            self._object(out, numbers[key], obj.write_to_stream)
+        return self._emit(out.getvalue())
+
+    def close(self):
+        out = io.BytesIO()
+        kids = " ".join(f"{number} 0 R" for number in self.pages)
+        self._object(out, 2, lambda f: f.write(f"<< /Type /Pages /Kids [{kids}] /Count {len(self.pages)} >>".encode()))
+        self._object(out, 1, lambda f: f.write(b"<< /Type /Catalog /Pages 2 0 R >>"))
+        xref = self.offset + out.tell()
+        out.write(f"xref\n0 {self.next_number}\n0000000000 65535 f \n".encode())
+        for number in range(1, self.next_number):
+            out.write(f"{self.offsets[number]:010d} 00000 n \n".encode())
+        out.write(f"trailer\n<< /Size {self.next_number} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+        return self._emit(out.getvalue())
+
+@app.route('/export/group/<group>.pdf')
+def export_group_pdf(group):
+    runners = load_participants().get(group)
+    if not runners:
+        return jsonify({"error": "Группа не найдена или пуста"}), 404
+    points, map_size = load_all_points()
+    timestamp = print_timestamp()
+
+    def documents():
+        pages = group_route_pages(group, runners, points, map_size, timestamp)
+        for chunk in chunked(pages, PDF_BULK_CHUNK):
+            yield len(chunk), pdf_document(f"Маршруты {group}", [page for _, page in chunk], map_size)
+
+    def generate():
+        start_time = time.time()
+        stream = PdfStream()
+        yield stream.header()
+        for _, pdf in ordered_renders(render_pdf, documents()):
+            yield stream.append(pdf)
+        yield stream.close()
+        elapsed = time.time() - start_time
+        print(f"[INFO] Печать группы {group}: {len(runners)} участников за {elapsed:.1f} с "
+              f"({len(runners) / max(elapsed, 1e-6):.1f} в секунду)")
+
+    return Response(stream_with_context(generate()), mimetype="application/pdf",
+                    headers=attachment_headers(f"маршруты_{group}.pdf"))
+
+@app.route('/export/event.zip')
+def export_event_zip():
+    participants = load_participants()
+    points, map_size = load_all_points()
+    timestamp = print_timestamp()
+
+    def documents():
+        for group, runners in participants.items():
+            pages = group_route_pages(group, runners, points, map_size, timestamp)
+            for chunk in chunked(pages, PDF_BULK_CHUNK):
+                names = [f"{group}/{pdf_filename(runner['name'])}" for runner, _ in chunk]
+                htmls = [pdf_document(f"Маршрут {runner['name']}", [page], map_size) for runner, page in chunk]
+                yield names, htmls
+
+    def generate():
+        start_time = time.time()
+        count = 0
+        stream = ZipStream()
+        with zipfile.ZipFile(stream, "w", compression=zipfile.ZIP_STORED) as zf:
+            for names, pdfs in ordered_renders(render_pdf_many, documents()):
+                for name, pdf in zip(names, pdfs):
+                    zf.writestr(zipfile.ZipInfo(name, time.localtime()[:6]), pdf)
+                count += len(pdfs)
+                yield stream.drain()
+        yield stream.drain()
+        elapsed = time.time() - start_time
+        print(f"[INFO] Печать соревнования: {count} участников за {elapsed:.1f} с "
+              f"({count / max(elapsed, 1e-6):.1f} в секунду)")
+
+    return Response(stream_with_context(generate()), mimetype="application/zip",
+                    headers=attachment_headers("маршруты.zip"))
+
+# Максимальное сжатие дорого на больших ответах: brotli 11 для /data.json x10 — 15 с против 0.7 с у уровня 9
+COMPRESS_MAX_BYTES = 256 * 1024
+
+def compress_payload(raw):
+    big = len(raw) > COMPRESS_MAX_BYTES
+    payload = {"identity": raw, "gzip": gzip.compress(raw, 6 if big else 9)}
+    if brotli is not None:
+        payload["br"] = brotli.compress(raw, quality=9 if big else 11)
+    return payload, hashlib.sha1(raw).hexdigest()
+
+def send_compressed(payload, etag, mimetype="application/json"):
+    encoding = "identity"
+    for candidate in ("br", "gzip"):
+        if candidate in payload and request.accept_encodings[candidate]:
+            encoding = candidate
+            break
+    response = Response(payload[encoding], mimetype=mimetype)
+    if encoding != "identity":
+        response.headers["Content-Encoding"] = encoding
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = "no-cache"
+    response.set_etag(f"{etag}-{encoding}")
+    return response.make_conditional(request)
+
+# Шард группы сериализуется и сжимается один раз, пока её данные не поменялись
+def get_group_shard(group):
+    participants = load_participants()
+    cols = participants.get(group)
+    if cols is None:
+        return None
+    shard = group_shards.get(group)
+    CACHE_REQUESTS.inc(cache="group_shard", result="hit" if shard is not None and shard[0] is cols else "miss")
+    if shard is None or shard[0] is not cols:
+        raw = json.dumps(cols.to_list(), ensure_ascii=False, separators=(',', ':')).encode("utf-8")
+        payload, etag = compress_payload(raw)
+        shard = (cols, payload, etag)
+        group_shards[group] = shard
+    return shard
+
+@app.route('/api/groups/<group>')
+def api_group(group):
+    shard = get_group_shard(group)
+    if shard is None:
+        return jsonify({"error": "Группа не найдена"}), 404
+    _, payload, etag = shard
+    return send_compressed(payload, etag)
+
+# Запасной вариант для app.run: поток на клиента. server.py отдаёт эти соединения asyncio-потоку из live.py
+@app.route('/api/stream')
+def api_stream():
+    last_id = parse_event_id(request.headers.get("Last-Event-ID", request.args.get("last_event_id")))
+
+    def generate():
+        hello, version = live_hub.hello(last_id)
+        yield hello
+        while True:
+            messages, latest = live_hub.wait(version, LIVE_HEARTBEAT)
+            if messages is None:
+                yield live_hub.reset_message()
+            elif messages:
+                yield b"".join(messages)
+            else:
+                yield b": ping\n\n"
+            version = latest
+
+    response = Response(stream_with_context(generate()), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+# Курсор — версия группы и смещение: если группа перечитана, старый курсор недействителен
+def runners_cursor(group, offset):
+    return f"{current().group_versions.get(group, 0)}-{offset}"
+
+@app.route('/api/groups/<group>/runners')
+def api_group_runners(group):
+    cols = load_participants().get(group)
+    if cols is None:
+        return jsonify({"error": "Группа не найдена"}), 404
+    version = current().group_versions.get(group, 0)
+    limit = min(max(request.args.get("limit", RUNNERS_PAGE, type=int), 1), RUNNERS_PAGE_MAX)
+    cursor = request.args.get("cursor")
+    if cursor:
+        cursor_version, _, offset = cursor.partition("-")
+        if cursor_version != str(version) or not offset.isdigit():
+            return jsonify({"error": "Курсор устарел, список группы изменился"}), 410
+        start = int(offset)
+    else:
+        start = max(request.args.get("start", 0, type=int), 0)
+    end = min(start + limit, len(cols))
+    rows = []
+    for i in range(start, end):
+        place, name = split_place(cols.names[i])
+        rows.append([i, name, place, cols.results[i]])
+    return jsonify({
+        "group": group,
+        "total": len(cols),
+        "version": version,
+        "rows": rows,
+        "next": runners_cursor(group, end) if end < len(cols) else None,
+    })
+
+# Статистика перегонов пересчитывается только для групп, чьи данные поменялись
+def get_leg_stats(group):
+    from analytics import leg_stats
+    participants = load_participants()
+    cols = participants.get(group)
+    if cols is None:
+        return None
+    cached = leg_stats_cache.get(group)
+    if cached is None or cached[0] is not cols:
+        start_time = time.time()
+        raw = json.dumps(leg_stats(cols), ensure_ascii=False, separators=(',', ':')).encode("utf-8")
+        cached = (cols, *compress_payload(raw))
+        leg_stats_cache[group] = cached
+        print(f"[INFO] Статистика перегонов {group}: {len(cols)} участников за {time.time() - start_time:.3f} с")
+    return cached
+
+@app.route('/api/groups/<group>/leg-stats')
+def api_group_leg_stats(group):
+    cached = get_leg_stats(group)
+    if cached is None:
+        return jsonify({"error": "Группа не найдена"}), 404
+    _, payload, etag = cached
+    return send_compressed(payload, etag)
+
+# Использование перегонов: по группе — пока жив её GroupColumns, по соревнованию — пока жив store
+def get_leg_usage(group=None):
+    from analytics import leg_usage, merge_usage
+    participants = load_participants()
+    source = participants if group is None else participants.get(group)
+    if source is None:
+        return None
+    cached = leg_usage_cache.get(group)
+    if cached is None or cached[0] is not source:
+        if group is None:
+            usage = merge_usage(get_leg_usage(g)[1] for g in participants)
+        else:
+            usage = leg_usage(source)
+        cached = (source, usage)
+        leg_usage_cache[group] = cached
+    return cached
+
+def leg_usage_response(group=None):
+    from analytics import usage_legs
+    cached = get_leg_usage(group)
+    if cached is None:
+        return jsonify({"error": "Группа не найдена"}), 404
+    source, usage = cached
+    # Сжатый ответ — как у тепловой карты: пока жив источник использования
+    payload = leg_usage_payloads.get(group)
+    if payload is None or payload[0] is not source:
+        raw = json.dumps({"group": group, "legs": usage_legs(usage)},
+                         ensure_ascii=False, separators=(',', ':')).encode("utf-8")
+        payload = (source, *compress_payload(raw))
+        leg_usage_payloads[group] = payload
+    _, body, etag = payload
+    return send_compressed(body, etag)
+
+def heatmap_response(group=None):
+    from analytics import usage_legs
+    from heatmap import render_heatmap
+    cached = get_leg_usage(group)
+    if cached is None:
+        return jsonify({"error": "Группа не найдена"}), 404
+    source, usage = cached
+    layer = heatmap_cache.get(group)
+    if layer is None or layer[0] is not source:
+        start_time = time.time()
+        points, map_size = load_all_points()
+        png = render_heatmap(usage_legs(usage), points, map_size, HEATMAP_SCALE)
+        layer = (source, png, hashlib.sha1(png).hexdigest())
+        heatmap_cache[group] = layer
+        print(f"[INFO] Тепловая карта {group or 'соревнования'} построена за {time.time() - start_time:.2f} с")
+    _, png, etag = layer
+    response = Response(png, mimetype="image/png")
+    response.headers["Cache-Control"] = "no-cache"
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+@app.route('/api/leg-usage')
+def api_event_leg_usage():
+    return leg_usage_response()
+
+@app.route('/api/groups/<group>/leg-usage')
+def api_group_leg_usage(group):
+    return leg_usage_response(group)
+
+@app.route('/api/heatmap.png')
+def api_event_heatmap():
+    return heatmap_response()
+
+@app.route('/api/groups/<group>/heatmap.png')
+def api_group_heatmap(group):
+    return heatmap_response(group)
+
+# Поисковый индекс строится при загрузке данных; токены пересчитываются только у изменившихся групп
+def update_search_index(participants):
+    global search_index
+    from search import GroupTokens, SearchIndex
+    cached = search_index
+    if participants is None or (cached is not None and cached[0] is participants):
+        return cached
+    start_time = time.time()
+    for group in list(search_tokens):
+        if group not in participants:
+            search_tokens.pop(group, None)
+    for group in participants:
+        cols = participants[group]
+        tokens = search_tokens.get(group)
+        if tokens is None or tokens[0] is not cols:
+            search_tokens[group] = (cols, GroupTokens(group, cols))
+    cached = (participants, SearchIndex(search_tokens[g][1] for g in participants))
+    search_index = cached
+    print(f"[INFO] Поисковый индекс: {len(cached[1].tokens)} слов за {time.time() - start_time:.2f} с")
+    return cached
+
+@app.route('/api/search')
+def api_search():
+    query = request.args.get("q", "").strip()
+    limit = min(max(request.args.get("limit", 20, type=int), 1), 100)
+    participants, index = update_search_index(load_participants())
+    results = []
+    for score, group, i in index.search(query, limit):
+        cols = participants[group]
+        item = {"group": group, "id": i, "name": cols.names[i], "result": cols.results[i], "score": score}
+        clubs = cols.extras.get("club")
+        if clubs is not None:
+            item["club"] = clubs[i]
+        results.append(item)
+    return jsonify({"query": query, "results": results})
+
+def get_route_renderer():
+    global route_renderer
+    if route_renderer is None:
+        from route_image import RouteRenderer
+        font_file = next((f for f in FONT_FILES if os.path.exists(f)), None)
+        route_renderer = RouteRenderer(MAP_IMAGE, font_file, memory_images=ROUTE_IMAGES_MEMORY)
+    return route_renderer
+
+# Превью маршрута для мессенджеров и табло: карта нужной ширины, КП группы и путь участника
+@app.route('/route/<group>/<int:runner_id>.png')
+def route_png(group, runner_id):
+    from route_image import snap_width
+    from controls import route_marks
+    cols = load_participants().get(group)
+    if cols is None or not 0 <= runner_id < len(cols):
+        return jsonify({"error": "Участник не найден"}), 404
+    points, map_size = load_all_points()
+    renderer = get_route_renderer()
+    width = snap_width(request.args.get("w", ROUTE_DEFAULT_WIDTH, type=int), renderer.width)
+    bbox = None
+    if request.args.get("bbox"):
+        # Область карты (видимая часть) в пикселях исходника, обрезается по краям карты
+        bbox = parse_bbox(request.args["bbox"])
+        if bbox is not None:
+            (x0, x1), (y0, y1) = sorted(bbox[0::2]), sorted(bbox[1::2])
+            x0, y0 = round(max(0.0, x0)), round(max(0.0, y0))
+            x1, y1 = round(min(map_size[0], x1)), round(min(map_size[1], y1))
+            bbox = (x0, y0, x1, y1) if x1 > x0 and y1 > y0 else None
+        if bbox is None:
+            return jsonify({"error": "bbox задаётся как x0,y0,x1,y1 внутри карты"}), 400
+    path = cols.path_codes(runner_id)
+    if not path:
+        return jsonify({"error": "У участника нет отметок"}), 404
+    snapshot = current()
+    start = path[0] if path[0].startswith("С") else snapshot.group_starts.get(group, "С1")
+    version = get_control_overlay().version
+    key = (group, runner_id, tuple(path), width, bbox, version)
+    etag = hashlib.sha1(json.dumps(key, ensure_ascii=False).encode("utf-8")).hexdigest()
+    if request.if_none_match.contains(etag):
+        CACHE_REQUESTS.inc(cache="route_image", result="hit")
+        response = Response(status=304)
+    else:
+        with STAGE_SECONDS.time(stage="route_image"):
+            marks = route_marks(start, snapshot.group_kps.get(group, []), path, points,
+                                get_control_grid() if bbox else None, bbox)
+            png, hit = renderer.route(key, width, path, marks, points, bbox)
+        CACHE_REQUESTS.inc(cache="route_image", result="hit" if hit else "miss")
+        response = Response(png, mimetype="image/png")
+    response.headers["Cache-Control"] = "no-cache"
+    response.set_etag(etag)
+    return response
+
+@app.route('/api/controls/at')
+def api_controls_at():
+    x = request.args.get("x", type=float)
+    y = request.args.get("y", type=float)
+    if x is None or y is None or not math.isfinite(x) or not math.isfinite(y):
+        return jsonify({"error": "Нужны координаты x и y в пикселях карты"}), 400
+    tolerance = request.args.get("tolerance", 0, type=float)
+    tolerance = min(max(tolerance, 0), CONTROL_TOLERANCE_MAX) if math.isfinite(tolerance) else 0
+    hits = get_control_grid().at(x, y, tolerance)
+    return jsonify({"controls": [[kp, round(cx, 1), round(cy, 1), round(distance, 1)]
+                                 for distance, kp, cx, cy, _ in hits]})
+
+@app.route('/api/controls/in')
+def api_controls_in():
+    bbox = parse_bbox(request.args.get("bbox"))
+    if bbox is None:
+        return jsonify({"error": "bbox задаётся как x0,y0,x1,y1 в пикселях карты"}), 400
+    found = get_control_grid().within(*bbox)
+    return jsonify({"count": len(found), "controls": [[kp, round(cx, 1), round(cy, 1)] for kp, cx, cy, _ in found]})
+
+@app.route('/api/distances')
+def api_distances():
+    global distances_cache
+    data = get_distance_data()
+    cached = distances_cache
+    if cached is None or cached[0] is not data:
+        kp_codes, _, matrix = data
+        raw = json.dumps({"scale_factor": SCALE_FACTOR, "codes": kp_codes, "matrix": matrix.tolist()},
+                         ensure_ascii=False, separators=(',', ':')).encode("utf-8")
+        cached = (data, *compress_payload(raw))
+        distances_cache = cached
+    _, payload, etag = cached
+    return send_compressed(payload, etag)
+
+# Приблизительный объём данных и кешей соревнования — по нему events.py выбирает, кого выгрузить
+def memory_estimate():
+    snapshot = snapshots.current
+    size = snapshot.participants.nbytes() if snapshot.participants is not None else 0
+    if snapshot.distance_data is not None:
+        size += snapshot.distance_data[2].nbytes
+    if map_tiles is not None:
+        size += map_tiles.nbytes()
+    if page_cache is not None:
+        size += len(page_cache[1])
+    payloads = [c[1] for c in list(group_shards.values()) + list(leg_stats_cache.values())
+                + list(leg_usage_payloads.values())]
+    payloads += [c[1] for c in (data_json_cache, distances_cache) if c is not None]
+    size += sum(len(data) for payload in payloads for data in payload.values())
+    size += sum(len(c[1]) for c in list(heatmap_cache.values()))
+    size += sum(len(pdf) for pdf in list(pdf_results.values()))
+    size += sum(len(layer) for layer in list(pdf_layers.values()))
+    if control_overlay is not None:
+        size += control_overlay[2].nbytes()
+    if route_renderer is not None:
+        size += route_renderer.nbytes()
+    size += sum(len(data) for c in list(overlay_payloads.values()) for data in c[1].values())
+    return size
+
 @app.route('/data.json')
 def data_json():
-    return send_from_directory('static', 'data.json')
+    global data_json_cache
+    participants = load_participants()
+    cached = data_json_cache
+    if cached is None or cached[0] is not participants:
+        raw = json.dumps(participants.to_dict(), ensure_ascii=False).encode("utf-8")
+        cached = (participants, *compress_payload(raw))
+        data_json_cache = cached
+    _, payload, etag = cached
+    return send_compressed(payload, etag)
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    debug = os.environ.get("APP_DEBUG", "1") == "1"
+    startup_timings["imports"] = round(time.time() - STARTUP_T0, 3)
+    # При debug=True код запускается дважды — фоновые службы поднимаем только в рабочем процессе
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        get_pdf_pool()
+        start_background_load()
+        if os.environ.get("SPLITS_WATCH") == "1":
+            start_splits_watcher()
+    from events import install
+    install(app)
+    app.run(host="0.0.0.0", port=5000, debug=debug)
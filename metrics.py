@@ -0,0 +1,294 @@
+import bisect
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# Границы гистограмм задержек, секунды
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _add(a, b):
+    if isinstance(a, list):
+        return [_add(x, y) for x, y in zip(a, b)]
+    return a + b
+
+
+def _fold_into(values, state):
+    for key, value in state:
+        key = tuple(key)
+        values[key] = value if key not in values else _add(values[key], value)
+    return values
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.label_names)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def state(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def merged(self, states):
+        # Значения этой метрики из нескольких процессов: счётчики и гистограммы складываются
+        values = {}
+        for state in states:
+            _fold_into(values, state)
+        return values
+
+    def samples(self, values=None):
+        if values is None:
+            with self._lock:
+                values = dict(self._values)
+        items = sorted(values.items())
+        return [f"{self.name}{_labels(self.label_names, key)} {_number(value)}" for key, value in items]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labels=(), fn=None, merge=sum):
+        super().__init__(name, help_text, labels)
+        # Значение без меток можно не хранить, а снимать в момент выгрузки
+        self.fn = fn
+        # Как сводить значения нескольких процессов: sum (соединения, задания), max (версия), min (готовность)
+        self.merge = merge
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def state(self):
+        if self.fn is not None:
+            return [[[], self.fn()]]
+        return super().state()
+
+    def merged(self, states):
+        values = {}
+        for state in states:
+            for key, value in state:
+                values.setdefault(tuple(key), []).append(value)
+        return {key: self.merge(found) for key, found in values.items()}
+
+    def samples(self, values=None):
+        if values is None and self.fn is not None:
+            return [f"{self.name} {_number(self.fn())}"]
+        return super().samples(values)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # Счётчики по корзинам (последняя — +Inf), сумма, количество
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def state(self):
+        with self._lock:
+            return [[list(key), [list(s[0]), s[1], s[2]]] for key, s in self._values.items()]
+
+    def samples(self, values=None):
+        if values is None:
+            with self._lock:
+                values = {key: (list(s[0]), s[1], s[2]) for key, s in self._values.items()}
+        items = sorted(values.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, ('le', _number(bound)))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self.register(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=(), fn=None, merge=sum):
+        return self.register(Gauge(name, help_text, labels, fn, merge))
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def state(self, gauges=True):
+        return {metric.name: {"kind": metric.kind, "values": metric.state()}
+                for metric in self.metrics if gauges or metric.kind != "gauge"}
+
+    def reset(self):
+        # Для процесса после fork: унаследованное от родителя он учитывает сам, в своём файле
+        for metric in self.metrics:
+            with metric._lock:
+                metric._values.clear()
+
+    def render(self, states=None):
+        # states — состояния всех процессов (MetricsSpool.collect); без них — только свой процесс
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.header())
+            if states is None:
+                lines.extend(metric.samples())
+            else:
+                own = [state[metric.name]["values"] for state in states if metric.name in state]
+                lines.extend(metric.samples(metric.merged(own)))
+        return "\n".join(lines) + "\n"
+
+
+RETIRED = "retired.json"
+RETIRED_NAMES = 1000
+
+
+def _read_json(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, data):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp, path)
+
+
+class MetricsSpool:
+    # Метрики нескольких процессов server.py: каждый пишет своё состояние в <pid>-<метка>.json общей папки,
+    # /metrics любого воркера складывает все файлы. Счётчики и гистограммы завершившихся процессов
+    # родитель переносит в retired.json (retire_process) — сумма не уменьшается при смене воркеров
+    def __init__(self, registry, directory):
+        self.registry = registry
+        self.directory = directory
+        # Метка отличает процесс с тем же pid и новый экземпляр модуля соревнования в том же процессе
+        self.name = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+    def write(self, gauges=True):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            _write_json(os.path.join(self.directory, f"{self.name}.json"), self.registry.state(gauges))
+        except OSError as e:
+            print(f"[WARNING] Не удалось записать метрики в {self.directory}: {e}")
+
+    def collect(self):
+        self.write()
+        # Сначала файлы процессов, потом retired.json: родитель удаляет файл только после записи retired.json,
+        # так что процесс, чей файл уже не нашёлся, в прочитанном retired.json точно есть
+        states = {}
+        for entry in os.scandir(self.directory):
+            name, ext = os.path.splitext(entry.name)
+            if ext == ".json" and entry.name != RETIRED:
+                state = _read_json(entry.path)
+                if state is not None:
+                    states[name] = state
+        retired = _read_json(os.path.join(self.directory, RETIRED)) or {"names": [], "state": {}}
+        for name in retired["names"]:
+            states.pop(name, None)
+        return [retired["state"]] + list(states.values())
+
+
+def retire_process(directory, pid):
+    # Вызывает родитель, когда воркер завершился: его счётчики — в retired.json, измерители — в никуда.
+    # Соревнования пишут метрики в подпапки — их тоже
+    if not os.path.isdir(directory):
+        return
+    folders = [directory] + [e.path for e in os.scandir(directory) if e.is_dir()]
+    for folder in folders:
+        for entry in os.scandir(folder):
+            name, ext = os.path.splitext(entry.name)
+            if ext != ".json" or not name.startswith(f"{pid}-"):
+                continue
+            state = _read_json(entry.path)
+            if state is not None:
+                _retire_state(folder, name, state)
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+
+def _retire_state(folder, name, state):
+    path = os.path.join(folder, RETIRED)
+    retired = _read_json(path) or {"names": [], "state": {}}
+    for metric_name, metric in state.items():
+        if metric["kind"] == "gauge":
+            continue
+        folded = retired["state"].setdefault(metric_name, {"kind": metric["kind"], "values": []})
+        values = _fold_into({tuple(key): value for key, value in folded["values"]}, metric["values"])
+        folded["values"] = [[list(key), value] for key, value in values.items()]
+    # Свёрнутые файлы помним, пока их могут читать: файл удаляется уже после этой записи
+    retired["names"] = retired["names"][-RETIRED_NAMES + 1:] + [name]
+    _write_json(path, retired)
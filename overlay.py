@@ -0,0 +1,59 @@
+import hashlib
+import json
+
+# Слой КП в печатном стиле: старты — треугольники, КП — круги, финиш — двойной круг, подписи рядом.
+# Один и тот же SVG встраивается в страницу (классы kp_* управляют видимостью) и в PDF как есть.
+OWN_COLOR = "#ff0000"
+ALIEN_COLOR = "#0066ff"
+FINISH = "Ф1"
+
+
+def is_start(kp):
+    return kp.startswith("С")
+
+
+def control_mark(kp, p, color=OWN_COLOR):
+    cx, cy, r = p["cx"], p["cy"], p.get("r", 20)
+    if is_start(kp):
+        size = r * 1.5
+        shape = (f'<polygon points="{cx},{cy - size} {cx - size},{cy + size} {cx + size},{cy + size}" '
+                 f'fill="none" stroke="{color}" stroke-width="10"/>')
+        label = (cx + size + 15, cy + size + 15, 48)
+    elif kp == FINISH:
+        shape = (f'<circle cx="{cx}" cy="{cy}" r="{r * 1.8}" fill="none" stroke="{color}" stroke-width="10"/>'
+                 f'<circle cx="{cx}" cy="{cy}" r="{r * 1.0}" fill="none" stroke="{color}" stroke-width="10"/>')
+        label = (cx + r * 1.8 + 15, cy + r * 1.8 + 15, 48)
+    else:
+        shape = f'<circle cx="{cx}" cy="{cy}" r="{r * 1.2}" fill="none" stroke="{color}" stroke-width="8"/>'
+        label = (cx + r * 1.2 + 12, cy + r * 1.2 + 12, 42)
+    x, y, font_size = label
+    return (f'<g id="kp_{kp}" class="kp">{shape}'
+            f'<text x="{x}" y="{y}" font-size="{font_size}" fill="{color}" font-weight="bold">{kp}</text></g>')
+
+
+def svg_document(marks, map_size):
+    width, height = map_size
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {width} {height}" '
+            f'width="{width}" height="{height}">{"".join(marks)}</svg>')
+
+
+def course_marks(start, kps, points):
+    # Старт группы, её КП и финиш — в порядке точек, как рисовалось раньше
+    wanted = set(kps)
+    wanted.update((start, FINISH))
+    return [control_mark(kp, p) for kp, p in points.items() if kp in wanted]
+
+
+class ControlOverlay:
+    # Все документы слоя строятся разом на версию точек и дистанций; версия идёт в URL
+    def __init__(self, points, map_size, courses, starts):
+        self.version = hashlib.sha1(json.dumps(
+            [points, map_size, courses, starts], ensure_ascii=False, sort_keys=True
+        ).encode("utf-8")).hexdigest()[:12]
+        self.map_size = tuple(map_size)
+        self.controls = svg_document([control_mark(kp, p) for kp, p in points.items()], map_size)
+        self.groups = {g: svg_document(course_marks(starts.get(g, "С1"), kps, points), map_size)
+                       for g, kps in courses.items()}
+
+    def nbytes(self):
+        return len(self.controls) + sum(len(doc) for doc in self.groups.values())
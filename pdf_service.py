@@ -0,0 +1,103 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import get_context
+from multiprocessing.managers import BaseManager
+
+
+class RenderService:
+    # Живёт в отдельном процессе, который server.py запускает до fork воркеров: пул рендереров
+    # и очередь печати одни на все воркеры и не пересоздаются вместе с их поколением.
+    # renderer — модуль main: его пул (get_pdf_pool/submit_render) и PDF_QUEUE_LIMIT
+    def __init__(self, renderer):
+        self._renderer = renderer
+        self._inflight = 0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        with self._lock:
+            if self._inflight >= self._renderer.PDF_QUEUE_LIMIT:
+                return False
+            self._inflight += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._inflight -= 1
+
+    def render(self, fn, args, reserved=False):
+        try:
+            return self._renderer.submit_render(fn, *args).result()
+        finally:
+            if reserved:
+                self.release()
+
+    def close(self):
+        # Процесс менеджера завершается через os._exit, сам пул за собой рендереры не уберёт
+        pool = self._renderer.pdf_pool
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+class RenderManager(BaseManager):
+    pass
+
+
+_service = None
+
+
+def _get_service():
+    return _service
+
+
+# Родитель убит, не успев остановить сервис (SIGKILL, SIGTERM во время прогрева) — сиротой не остаёмся
+def _watch_parent(parent):
+    while os.getppid() == parent:
+        time.sleep(1)
+    _service.close()
+    os._exit(0)
+
+
+def _init_service(renderer):
+    global _service
+    _service = RenderService(renderer)
+    renderer.get_pdf_pool()
+    threading.Thread(target=_watch_parent, args=(os.getppid(),), name="parent-watch", daemon=True).start()
+
+
+RenderManager.register("service", callable=_get_service, exposed=("reserve", "release", "render", "close"))
+
+
+# -> (manager, адрес для воркеров). fork, а не spawn: функции рендеринга уже импортированы родителем
+def start_service(renderer):
+    authkey = os.urandom(32)
+    manager = RenderManager(authkey=authkey, ctx=get_context("fork"))
+    manager.start(_init_service, (renderer,))
+    return manager, (manager.address, authkey)
+
+
+def stop_service(manager):
+    manager.service().close()
+    manager.shutdown()
+
+
+class RenderClient:
+    # Сторона воркера: вызов сервиса держит поток до готового PDF, поэтому наружу — Future из своих потоков
+    def __init__(self, address, authkey, threads):
+        manager = RenderManager(address=address, authkey=authkey)
+        manager.connect()
+        self._service = manager.service()
+        self._threads = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="pdf-client")
+
+    def reserve(self):
+        return self._service.reserve()
+
+    def release(self):
+        self._service.release()
+
+    def submit(self, fn, args, reserved=False):
+        return self._threads.submit(self._service.render, fn, args, reserved)
+
+    def close(self):
+        self._threads.shutdown(wait=True)
@@ -0,0 +1,124 @@
+import io
+import math
+import threading
+from collections import OrderedDict
+
+from PIL import Image, ImageDraw, ImageFont
+
+# Стандартные ширины превью: запрошенная ширина округляется вверх до ближайшей из них
+ROUTE_WIDTHS = (320, 640, 1024, 1600)
+OWN_COLOR = (255, 0, 0)
+ALIEN_COLOR = (0, 102, 255)
+PATH_COLOR = (255, 51, 102)
+FINISH = "Ф1"
+
+
+def snap_width(width, map_width):
+    widths = [w for w in ROUTE_WIDTHS if w <= map_width] or [map_width]
+    return next((w for w in widths if w >= width), widths[-1])
+
+
+class RouteRenderer:
+    # Маршрут участника в PNG: уменьшенная копия map.png, КП группы и путь поверх.
+    # Копии карты под каждую стандартную ширину делаются один раз, готовые картинки — в LRU.
+    def __init__(self, image_path, font_file=None, memory_images=64):
+        self.image_path = image_path
+        self.font_file = font_file
+        self.memory_images = memory_images
+        with Image.open(image_path) as im:
+            self.width, self.height = im.size
+        self._bases = {}
+        self._fonts = {}
+        self._images = OrderedDict()
+        self._lock = threading.Lock()
+        self._base_lock = threading.Lock()
+
+    def nbytes(self):
+        with self._lock:
+            size = sum(len(data) for data in self._images.values())
+        return size + sum(im.width * im.height * 3 for im in list(self._bases.values()))
+
+    def base(self, width):
+        im = self._bases.get(width)
+        if im is None:
+            with self._base_lock:
+                im = self._bases.get(width)
+                if im is None:
+                    # Уменьшаем от ближайшей большей готовой копии, а не каждый раз от исходника
+                    larger = [w for w in self._bases if w > width]
+                    if larger:
+                        source = self._bases[min(larger)]
+                    else:
+                        source = Image.open(self.image_path).convert("RGB")
+                    height = max(1, round(self.height * width / self.width))
+                    im = source if source.width == width else source.resize((width, height), Image.LANCZOS)
+                    self._bases[width] = im
+        return im
+
+    def font(self, size):
+        font = self._fonts.get(size)
+        if font is None:
+            try:
+                font = ImageFont.truetype(self.font_file, size) if self.font_file else ImageFont.load_default()
+            except OSError:
+                font = ImageFont.load_default()
+            self._fonts[size] = font
+        return font
+
+    def draw_control(self, draw, kp, p, scale, color, origin=(0, 0)):
+        cx, cy, r = (p["cx"] - origin[0]) * scale, (p["cy"] - origin[1]) * scale, p.get("r", 20) * scale
+        if kp.startswith("С"):
+            size = r * 1.5
+            stroke = max(1, round(10 * scale))
+            draw.polygon([(cx, cy - size), (cx - size, cy + size), (cx + size, cy + size)], outline=color, width=stroke)
+            label, font_size = (cx + size + 15 * scale, cy + size + 15 * scale), 48
+        elif kp == FINISH:
+            stroke = max(1, round(10 * scale))
+            for k in (1.8, 1.0):
+                draw.ellipse((cx - r * k, cy - r * k, cx + r * k, cy + r * k), outline=color, width=stroke)
+            label, font_size = (cx + r * 1.8 + 15 * scale, cy + r * 1.8 + 15 * scale), 48
+        else:
+            stroke = max(1, round(8 * scale))
+            draw.ellipse((cx - r * 1.2, cy - r * 1.2, cx + r * 1.2, cy + r * 1.2), outline=color, width=stroke)
+            label, font_size = (cx + r * 1.2 + 12 * scale, cy + r * 1.2 + 12 * scale), 42
+        draw.text(label, kp, fill=color, font=self.font(max(8, round(font_size * scale))))
+
+    def render(self, width, path, marks, points, bbox=None):
+        # bbox — область карты в пикселях исходника; без неё вся карта
+        x0, y0, x1, y1 = bbox or (0, 0, self.width, self.height)
+        scale = width / (x1 - x0)
+        # Подложка — ближайшая стандартная копия не меньше нужного масштаба, для мелкой области — исходник
+        need = math.ceil(scale * self.width)
+        base = self.base(next((w for w in ROUTE_WIDTHS if need <= w < self.width), self.width))
+        k = base.width / self.width
+        size = (width, max(1, round((y1 - y0) * scale)))
+        im = base.crop((round(x0 * k), round(y0 * k), round(x1 * k), round(y1 * k)))
+        if im.size != size:
+            im = im.resize(size, Image.LANCZOS)
+        draw = ImageDraw.Draw(im)
+
+        origin = (x0, y0)
+        for kp, own in marks:
+            self.draw_control(draw, kp, points[kp], scale, OWN_COLOR if own else ALIEN_COLOR, origin)
+
+        line = [((points[kp]["cx"] - x0) * scale, (points[kp]["cy"] - y0) * scale) for kp in path if kp in points]
+        if len(line) > 1:
+            draw.line(line, fill=PATH_COLOR, width=max(2, round(16 * scale)), joint="curve")
+
+        buf = io.BytesIO()
+        im.save(buf, format="PNG")
+        return buf.getvalue()
+
+    def route(self, key, width, path, marks, points, bbox=None):
+        with self._lock:
+            data = self._images.get(key)
+            if data is not None:
+                self._images.move_to_end(key)
+                return data, True
+        data = self.render(width, path, marks, points, bbox)
+        with self._lock:
+            self._images[key] = data
+            self._images.move_to_end(key)
+            while len(self._images) > self.memory_images:
+                self._images.popitem(last=False)
+        return data, False
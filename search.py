@@ -0,0 +1,115 @@
+import bisect
+import heapq
+import re
+
+from store import split_place
+
+WORD_RE = re.compile(r"[0-9a-zа-я]+")
+NO_PLACE = 1 << 30
+
+# Поля, по которым ищем, и их вес: фамилия важнее имени, имя — клуба
+SURNAME, NAME, CLUB = 0, 1, 2
+FIELD_WEIGHT = (3, 2, 1)
+EXACT, PREFIX = 10, 5
+MAX_WORD_SCORE = EXACT + FIELD_WEIGHT[SURNAME]
+
+
+def normalize(text):
+    return (text or "").lower().replace("ё", "е")
+
+
+def words(text):
+    return WORD_RE.findall(normalize(text))
+
+
+def word_score(token, field, word):
+    return (EXACT if token == word else PREFIX) + FIELD_WEIGHT[field]
+
+
+class GroupTokens:
+    # Токены одной группы: строятся один раз на GroupColumns и переиспользуются, пока группа не изменится
+    __slots__ = ("group", "places", "runner_tokens", "postings")
+
+    def __init__(self, group, cols):
+        self.group = group
+        self.places = []
+        self.runner_tokens = []
+        self.postings = {}
+        clubs = cols.extras.get("club")
+        for i, full_name in enumerate(cols.names):
+            place, name = split_place(full_name)
+            place = int(place) if place else NO_PLACE
+            parts = words(name)
+            tokens = [(t, SURNAME if j == 0 else NAME) for j, t in enumerate(parts)]
+            if clubs is not None and clubs[i]:
+                tokens.extend((t, CLUB) for t in words(clubs[i]))
+            self.places.append(place)
+            self.runner_tokens.append(tokens)
+            for t, field in tokens:
+                self.postings.setdefault(t, []).append((field, place, group, i))
+
+
+class SearchIndex:
+    # Отсортированный словарь токенов всех групп: префикс — bisect, у каждого токена
+    # список участников по убыванию веса поля и по месту, поэтому лучшие идут первыми
+    def __init__(self, group_tokens):
+        self.groups = {gt.group: gt for gt in group_tokens}
+        postings = {}
+        for gt in self.groups.values():
+            for t, items in gt.postings.items():
+                postings.setdefault(t, []).extend(items)
+        self.tokens = sorted(postings)
+        self.postings = [sorted(postings[t]) for t in self.tokens]
+
+    def prefix_range(self, prefix):
+        lo = bisect.bisect_left(self.tokens, prefix)
+        hi = bisect.bisect_left(self.tokens, prefix + "￿", lo)
+        return lo, hi
+
+    def stream(self, k, word):
+        base = EXACT if self.tokens[k] == word else PREFIX
+        for field, place, group, i in self.postings[k]:
+            yield -(base + FIELD_WEIGHT[field]), place, group, i, field
+
+    def word_bound(self, word, surname_taken):
+        # Больше всего слово может дать совпадением целиком; фамилия у участника одна
+        k = bisect.bisect_left(self.tokens, word)
+        exact = k < len(self.tokens) and self.tokens[k] == word
+        return (EXACT if exact else PREFIX) + FIELD_WEIGHT[NAME if surname_taken else SURNAME]
+
+    def search(self, query, limit=20):
+        query_words = words(query)
+        if not query_words:
+            return []
+        # Кандидатов берём по самому длинному слову, остальные слова проверяем у кандидата
+        first = max(query_words, key=len)
+        rest = list(query_words)
+        rest.remove(first)
+        bounds = {taken: sum(self.word_bound(w, taken) for w in rest) for taken in (False, True)}
+        lo, hi = self.prefix_range(first)
+
+        seen = set()
+        best = []
+        candidates = heapq.merge(*(self.stream(k, first) for k in range(lo, hi)))
+        for n, (neg_score, place, group, i, field) in enumerate(candidates):
+            # Поток идёт по убыванию очков первого слова и по месту: дальше лучших уже не будет
+            if len(best) >= limit and (-neg_score + bounds[field == SURNAME], -place) <= best[0][:2]:
+                break
+            if (group, i) in seen:
+                continue
+            seen.add((group, i))
+            score = -neg_score
+            runner_tokens = self.groups[group].runner_tokens[i]
+            for word in rest:
+                matched = [word_score(t, f, word) for t, f in runner_tokens if t.startswith(word)]
+                if not matched:
+                    break
+                score += max(matched)
+            else:
+                # При равенстве очков и места выше тот, кто раньше пришёл из потока
+                item = (score, -place, -n, group, i)
+                if len(best) < limit:
+                    heapq.heappush(best, item)
+                elif item > best[0]:
+                    heapq.heapreplace(best, item)
+        return [(score, group, i) for score, _, _, group, i in sorted(best, reverse=True)]
@@ -0,0 +1,336 @@
+import gc
+import json
+import multiprocessing
+import os
+import pickle
+import re
+import shutil
+import signal
+import socket
+import threading
+import time
+
+from werkzeug.serving import make_server
+
+HOST = os.environ.get("HOST", "0.0.0.0")
+PORT = int(os.environ.get("PORT", "5000"))
+WORKERS = int(os.environ.get("WORKERS", str(os.cpu_count() or 1)))
+WORKER_GRACE = float(os.environ.get("WORKER_GRACE", "30"))
+SPOOL_SWEEP_INTERVAL = 60
+METRICS_FLUSH_INTERVAL = 5
+
+# Задания печати должны быть видны всем процессам — по умолчанию складываем их на диск
+os.environ.setdefault("PDF_SPOOL_DIR", "cache_pdf")
+# Метрики тоже: запросы одного скрейпа Prometheus попадают в разные воркеры
+os.environ.setdefault("METRICS_DIR", "cache_metrics")
+
+import main
+from events import install
+from live import StreamServer
+from metrics import retire_process
+from pdf_service import start_service, stop_service
+
+events = install(main.app)
+EVENT_STREAM_RE = re.compile(r"/e/([A-Za-z0-9_-]+)/api/stream")
+
+workers = set()
+retiring = {}
+# pid воркера -> конец канала, по которому родитель шлёт ему изменения участников
+channels = {}
+reload_requested = False
+stopping = False
+
+
+def on_reload(signum, frame):
+    global reload_requested
+    reload_requested = True
+
+
+def on_stop(signum, frame):
+    global stopping
+    stopping = True
+
+
+# Всё, что читают воркеры, готовим в родителе: после fork эти страницы памяти общие (copy-on-write)
+def warm_up():
+    start_time = time.time()
+    main.load_data()
+    with main.app.app_context():
+        main.get_index_page()
+    participants = main.load_participants()
+    for group in participants:
+        main.get_group_shard(group)
+    # Замороженные объекты сборщик мусора не трогает и не пишет в их заголовки
+    gc.unfreeze()
+    gc.collect()
+    gc.freeze()
+    main.flush_metrics(gauges=False)
+    print(f"[INFO] Данные подготовлены за {time.time() - start_time:.2f} с "
+          f"(версия {main.current().data_version}, участников {participants.total()})")
+
+
+# Пока родитель готовит данные, воркеров ещё нет — на пробы отвечает он сам
+def loading_app(environ, start_response):
+    if environ.get("PATH_INFO") == "/healthz":
+        status, body = "200 OK", {"status": "ok"}
+    else:
+        status, body = "503 Service Unavailable", {"ready": False, "timings": main.startup_timings}
+    data = json.dumps(body).encode("utf-8")
+    start_response(status, [("Content-Type", "application/json"), ("Content-Length", str(len(data))),
+                            ("Retry-After", "1")])
+    return [data]
+
+
+def warm_up_serving(sock):
+    server = make_server(HOST, PORT, loading_app, threaded=True, fd=sock.fileno())
+    # Перед fork дожидаемся начатых ответов: потоки в воркеры не переходят
+    server.daemon_threads = False
+    server.block_on_close = True
+    thread = threading.Thread(target=server.serve_forever, name="warm-up-probes", daemon=True)
+    thread.start()
+    try:
+        warm_up()
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+def reload_data():
+    start_time = time.time()
+    # groups.txt и участники публикуются одним снимком: между ними запросы ничего не увидят
+    changed = main.reload_data()
+    print(f"[INFO] Перезагрузка данных за {time.time() - start_time:.2f} с, "
+          f"изменены группы: {', '.join(sorted(changed)) or '—'}")
+    return changed
+
+
+# Чей /api/stream: основного соревнования или одного из events/<id>
+def stream_hub(path):
+    if path == "/api/stream":
+        return main.live_hub
+    m = EVENT_STREAM_RE.fullmatch(path)
+    if m is None:
+        return None
+    module = events.get(m.group(1))
+    return module.live_hub if module is not None else None
+
+
+def metric_modules():
+    return [main] + events.modules()
+
+
+def flush_metrics():
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        for module in metric_modules():
+            module.flush_metrics()
+
+
+def receive_updates(conn):
+    while True:
+        try:
+            update = pickle.loads(conn.recv_bytes())
+        except (EOFError, OSError):
+            return
+        try:
+            main.apply_update(update)
+        except Exception as e:
+            # Пропущенное изменение не догнать — воркер уходит, родитель поднимет новый со свежими данными
+            print(f"[ERROR] Воркер {os.getpid()} не применил обновление данных: {e}")
+            os.kill(os.getpid(), signal.SIGTERM)
+            return
+
+
+def send_update(update):
+    data = pickle.dumps(update, protocol=pickle.HIGHEST_PROTOCOL)
+    for pid, conn in list(channels.items()):
+        try:
+            conn.send_bytes(data)
+        except OSError:
+            print(f"[WARNING] Воркер {pid} не принял обновление данных, перезапуск")
+            channels.pop(pid).close()
+            signal_worker(pid, signal.SIGTERM)
+
+
+def close_channel(pid):
+    conn = channels.pop(pid, None)
+    if conn is not None:
+        conn.close()
+
+
+def run_worker(sock, updates):
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Счётчики родителя лежат в его файле метрик — воркер начинает со своих
+    for module in metric_modules():
+        module.registry.reset()
+        module.metrics_spool = None
+    threading.Thread(target=flush_metrics, name="metrics-flush", daemon=True).start()
+    threading.Thread(target=receive_updates, args=(updates,), name="data-updates", daemon=True).start()
+    server = make_server(HOST, PORT, main.app, threaded=True, fd=sock.fileno())
+    # При остановке дожидаемся начатых запросов: новые соединения уже принимают другие воркеры
+    server.daemon_threads = False
+    server.block_on_close = True
+
+    # SSE-клиенты висят часами: их держит один asyncio-поток, а не поток на соединение.
+    # Буфер изменений воркер унаследовал от родителя, так что переподключение после
+    # смены поколения отдаёт ровно пропущенное
+    streams = StreamServer(stream_hub).start()
+    process_request = server.process_request
+    server.process_request = lambda request, client_address: streams.dispatch(request, client_address, process_request)
+
+    def stop(signum, frame):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        server.serve_forever()
+    finally:
+        streams.close()
+        server.server_close()
+        for module in metric_modules():
+            module.flush_metrics()
+        if main.pdf_pool is not None:
+            main.pdf_pool.shutdown(wait=True)
+        if main.pdf_service is not None:
+            main.pdf_service.close()
+
+
+def spawn_worker(sock, report=False):
+    updates, sender = multiprocessing.Pipe(duplex=False)
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        sender.close()
+        for conn in channels.values():
+            conn.close()
+        channels.clear()
+        if not report:
+            # О времени первого ответа после старта отчитывается один воркер первого поколения
+            main.startup_timings["first_byte"] = None
+        try:
+            run_worker(sock, updates)
+        except BaseException as e:
+            print(f"[ERROR] Воркер {os.getpid()} упал: {e}")
+            code = 1
+        finally:
+            os._exit(code)
+    updates.close()
+    channels[pid] = sender
+    workers.add(pid)
+    return pid
+
+
+def spawn_generation(sock, first=False):
+    for i in range(WORKERS):
+        spawn_worker(sock, report=first and i == 0)
+    print(f"[INFO] Запущено воркеров: {WORKERS} ({', '.join(str(pid) for pid in sorted(workers))})")
+
+
+def retire_workers():
+    # Старое поколение получает SIGTERM и доделывает свои запросы; по истечении WORKER_GRACE — SIGKILL
+    deadline = time.time() + WORKER_GRACE
+    for pid in workers:
+        close_channel(pid)
+        signal_worker(pid, signal.SIGTERM)
+        retiring[pid] = deadline
+    workers.clear()
+
+
+def signal_worker(pid, signum):
+    try:
+        os.kill(pid, signum)
+    except ProcessLookupError:
+        pass
+
+
+def reap_workers(sock):
+    while True:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+        retiring.pop(pid, None)
+        close_channel(pid)
+        retire_process(main.METRICS_DIR, pid)
+        if pid in workers:
+            workers.discard(pid)
+            if not stopping:
+                print(f"[WARNING] Воркер {pid} завершился (код {os.waitstatus_to_exitcode(status)}), перезапуск")
+                spawn_worker(sock)
+
+
+def kill_overdue():
+    now = time.time()
+    for pid, deadline in list(retiring.items()):
+        if now > deadline:
+            print(f"[WARNING] Воркер {pid} не завершился за {WORKER_GRACE:.0f} с, SIGKILL")
+            signal_worker(pid, signal.SIGKILL)
+            retiring[pid] = now + WORKER_GRACE
+
+
+def serve():
+    global reload_requested
+
+    # Печать — до сокета и до потоков: процесс сервиса не должен держать ни то, ни другое
+    pdf_manager, main.PDF_SERVICE = start_service(main)
+    sock = socket.create_server((HOST, PORT), backlog=1024)
+    sock.set_inheritable(True)
+    print(f"[INFO] Слушаем http://{HOST}:{PORT}")
+    # Метрики прошлого запуска не продолжаем: pid воркеров у них чужие
+    shutil.rmtree(main.METRICS_DIR, ignore_errors=True)
+
+    warm_up_serving(sock)
+    signal.signal(signal.SIGHUP, on_reload)
+    signal.signal(signal.SIGTERM, on_stop)
+    signal.signal(signal.SIGINT, on_stop)
+    spawn_generation(sock, first=True)
+
+    watch = os.environ.get("SPLITS_WATCH") == "1"
+    next_watch = time.time() + main.SPLITS_WATCH_INTERVAL
+    next_sweep = time.time() + SPOOL_SWEEP_INTERVAL
+    while not stopping:
+        if reload_requested:
+            reload_requested = False
+            try:
+                reload_data()
+                warm_up()
+            except Exception as e:
+                print(f"[ERROR] Ошибка перезагрузки данных, воркеры продолжают со старыми: {e}")
+            else:
+                retire_workers()
+                spawn_generation(sock)
+        elif watch and time.time() >= next_watch:
+            next_watch = time.time() + main.SPLITS_WATCH_INTERVAL
+            try:
+                # Разбирает протокол только родитель; воркеры получают готовые изменившиеся группы
+                before = main.snapshots.current
+                main.refresh_participants()
+                if main.snapshots.current is not before:
+                    send_update(main.export_update(before))
+                main.flush_metrics(gauges=False)
+            except Exception as e:
+                print(f"[ERROR] Ошибка обновления участников: {e}")
+        if time.time() >= next_sweep:
+            next_sweep = time.time() + SPOOL_SWEEP_INTERVAL
+            main.sweep_pdf_spool()
+        reap_workers(sock)
+        kill_overdue()
+        time.sleep(0.2)
+
+    print("[INFO] Остановка сервера...")
+    retire_workers()
+    while retiring:
+        reap_workers(sock)
+        kill_overdue()
+        time.sleep(0.1)
+    sock.close()
+    stop_service(pdf_manager)
+    print("[SUCCESS] Сервер остановлен")
+
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,47 @@
+import threading
+import weakref
+
+
+class Snapshot:
+    # Одна версия всех производных данных: точки, матрица расстояний, дистанции групп, участники.
+    # После публикации не меняется — ни сам снимок, ни словари в нём: следующая версия строит свои.
+    __slots__ = ("version", "points_data", "distance_data", "group_kps", "group_starts", "courses_version",
+                 "participants", "data_version", "group_versions", "__weakref__")
+    FIELDS = __slots__[1:-1]
+
+    def __init__(self, version=0, points_data=None, distance_data=None, group_kps=None, group_starts=None,
+                 courses_version=0, participants=None, data_version=0, group_versions=None):
+        init = object.__setattr__
+        init(self, "version", version)
+        init(self, "points_data", points_data)
+        init(self, "distance_data", distance_data)
+        init(self, "group_kps", {} if group_kps is None else group_kps)
+        init(self, "group_starts", {} if group_starts is None else group_starts)
+        init(self, "courses_version", courses_version)
+        init(self, "participants", participants)
+        init(self, "data_version", data_version)
+        init(self, "group_versions", {} if group_versions is None else group_versions)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"Снимок данных не меняется: {name}")
+
+    def replace(self, **changes):
+        values = {name: getattr(self, name) for name in self.FIELDS}
+        values.update(changes)
+        return Snapshot(self.version + 1, **values)
+
+
+class SnapshotCell:
+    # Текущий снимок: читатели берут self.current без блокировок, писатель публикует новый
+    # одной заменой ссылки. Старый освобождается, когда его не держит ни один запрос.
+    def __init__(self):
+        self.current = Snapshot()
+        self.alive = weakref.WeakSet([self.current])
+        self._lock = threading.Lock()
+
+    def publish(self, **changes):
+        with self._lock:
+            snapshot = self.current.replace(**changes)
+            self.alive.add(snapshot)
+            self.current = snapshot
+        return snapshot
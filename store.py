@@ -0,0 +1,196 @@
+import re
+import sys
+import threading
+from array import array
+from collections.abc import Mapping, Sequence
+
+MISSING = -1
+# Имя участника хранится с порядковым номером из протокола: "12. ИВАНОВ ИВАН"
+PLACE_RE = re.compile(r"^\s*(\d*)\.\s*")
+
+
+class CodeTable:
+    # Коды КП ("С1", "57", "Ф1") -> небольшие целые id, общие для всех групп
+    def __init__(self):
+        self.codes = []
+        self.ids = {}
+        self._lock = threading.Lock()
+
+    def id(self, code):
+        kp_id = self.ids.get(code)
+        if kp_id is None:
+            with self._lock:
+                kp_id = self.ids.get(code)
+                if kp_id is None:
+                    kp_id = len(self.codes)
+                    self.codes.append(sys.intern(code))
+                    self.ids[self.codes[kp_id]] = kp_id
+        return kp_id
+
+    def code(self, kp_id):
+        return self.codes[kp_id]
+
+
+codes = CodeTable()
+
+
+def time_to_sec(t):
+    if not t or ":" not in t:
+        return MISSING
+    try:
+        parts = [int(x) for x in t.split(":")]
+    except ValueError:
+        return MISSING
+    if len(parts) == 3:
+        return parts[0] * 3600 + parts[1] * 60 + parts[2]
+    if len(parts) == 2:
+        return parts[0] * 60 + parts[1]
+    return MISSING
+
+
+def split_place(full_name):
+    m = PLACE_RE.match(full_name)
+    if m is None:
+        return "", full_name
+    return m.group(1), full_name[m.end():]
+
+
+def sec_to_time(s):
+    if s == MISSING:
+        return "-"
+    return f"{s // 60}:{s % 60:02d}"
+
+
+class GroupColumns(Sequence):
+    # Участники одной группы по столбцам: пути и перегоны — плоские массивы со смещениями
+    __slots__ = ("name", "names", "results", "path_offsets", "path_ids",
+                 "leg_offsets", "leg_secs", "cum_secs", "raw_times", "extras")
+
+    def __init__(self, name):
+        self.name = name
+        self.names = []
+        self.results = []
+        self.path_offsets = array("I", [0])
+        self.path_ids = array("H")
+        self.leg_offsets = array("I", [0])
+        self.leg_secs = array("i")
+        self.cum_secs = array("i")
+        # Время, которое не восстанавливается из секунд один в один ("05:07", "1:02:03")
+        self.raw_times = {}
+        # Необязательные поля участника (distance, club...) — по списку на поле
+        self.extras = {}
+
+    @classmethod
+    def from_runners(cls, name, runners):
+        cols = cls(name)
+        for runner in runners:
+            cols.append(runner)
+        return cols
+
+    @classmethod
+    def from_paths(cls, name, names, paths, extras, result="-"):
+        # Участники без отметок (заявка): пути — готовые массивы id КП, перегонов нет
+        cols = cls(name)
+        cols.names = list(names)
+        cols.results = [sys.intern(result)] * len(cols.names)
+        for ids in paths:
+            cols.path_ids.extend(ids)
+            cols.path_offsets.append(len(cols.path_ids))
+        cols.leg_offsets = array("I", [0]) * (len(cols.names) + 1)
+        cols.extras = {key: list(column) for key, column in extras.items()}
+        return cols
+
+    def append(self, runner):
+        idx = len(self.names)
+        self.names.append(runner["name"])
+        self.results.append(sys.intern(runner.get("result", "-")))
+        self.path_ids.extend(codes.id(kp) for kp in runner["path"])
+        self.path_offsets.append(len(self.path_ids))
+
+        total = 0
+        for t in runner.get("leg_times", []):
+            sec = time_to_sec(t)
+            if sec_to_time(sec) != t:
+                self.raw_times[len(self.leg_secs)] = t
+            self.leg_secs.append(sec)
+            if sec != MISSING:
+                total += sec
+            self.cum_secs.append(total)
+        self.leg_offsets.append(len(self.leg_secs))
+
+        for key, value in runner.items():
+            if key not in ("name", "group", "path", "leg_times", "result"):
+                column = self.extras.setdefault(key, [None] * idx)
+                column.append(value)
+        for column in self.extras.values():
+            if len(column) <= idx:
+                column.append(None)
+
+    def __len__(self):
+        return len(self.names)
+
+    def path_codes(self, i):
+        return [codes.codes[k] for k in self.path_ids[self.path_offsets[i]:self.path_offsets[i + 1]]]
+
+    def leg_times(self, i):
+        start, end = self.leg_offsets[i], self.leg_offsets[i + 1]
+        raw = self.raw_times
+        return [raw[j] if j in raw else sec_to_time(self.leg_secs[j]) for j in range(start, end)]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        runner = {
+            "name": self.names[i],
+            "group": self.name,
+            "path": self.path_codes(i),
+            "leg_times": self.leg_times(i),
+            "result": self.results[i],
+        }
+        for key, column in self.extras.items():
+            if column[i] is not None:
+                runner[key] = column[i]
+        return runner
+
+    def to_list(self):
+        return [self[i] for i in range(len(self))]
+
+    def nbytes(self):
+        # Оценка снизу: буферы массивов, строки имён и значения дополнительных полей
+        arrays = (self.path_offsets, self.path_ids, self.leg_offsets, self.leg_secs, self.cum_secs)
+        size = sum(len(a) * a.itemsize for a in arrays)
+        size += sum(sys.getsizeof(name) for name in self.names) + 8 * (len(self.names) + len(self.results))
+        size += sum(64 * len(column) for column in self.extras.values())
+        return size + 100 * len(self.raw_times)
+
+
+class ParticipantStore(Mapping):
+    # Группа -> GroupColumns; неизменные группы переиспользуются между версиями
+    def __init__(self, groups=None):
+        self.groups = dict(groups or {})
+
+    @classmethod
+    def from_dict(cls, participants):
+        return cls({g: GroupColumns.from_runners(g, runners) for g, runners in participants.items()})
+
+    def __getitem__(self, group):
+        return self.groups[group]
+
+    def __iter__(self):
+        return iter(self.groups)
+
+    def __len__(self):
+        return len(self.groups)
+
+    def total(self):
+        return sum(len(cols) for cols in self.groups.values())
+
+    def to_dict(self):
+        return {g: cols.to_list() for g, cols in self.groups.items()}
+
+    def nbytes(self):
+        return sum(cols.nbytes() for cols in self.groups.values())
@@ -0,0 +1,40 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA = os.path.join(ROOT, "tests", "data")
+sys.path.insert(0, ROOT)
+
+import main
+from live import LiveHub
+from snapshot import SnapshotCell
+
+
+# Соревнование из tests/data во временной папке: у main свои пустые снимок, кеши и состояние разбора
+@pytest.fixture
+def event(tmp_path, monkeypatch):
+    for name in ("splits.htm", "groups.txt"):
+        shutil.copyfile(os.path.join(DATA, name), tmp_path / name)
+    monkeypatch.setattr(main, "SPLITS_FILE", str(tmp_path / "splits.htm"))
+    monkeypatch.setattr(main, "GROUPS_FILE", str(tmp_path / "groups.txt"))
+    monkeypatch.setattr(main, "RESULTS_XML", str(tmp_path / "results.xml"))
+    monkeypatch.setattr(main, "PARTICIPANTS_FILE", str(tmp_path / "participants.txt"))
+    monkeypatch.setattr(main, "CACHE_FILE", str(tmp_path / "cache_participants.json"))
+    monkeypatch.setattr(main, "CACHE_POINTS", str(tmp_path / "cache_points.json"))
+    monkeypatch.setattr(main, "COORDS_FILE", os.path.join(ROOT, "coordinates.txt"))
+    monkeypatch.setattr(main, "MAP_IMAGE", os.path.join(ROOT, "static", "map.png"))
+    monkeypatch.setattr(main, "snapshots", SnapshotCell())
+    monkeypatch.setattr(main, "live_hub", LiveHub())
+    monkeypatch.setattr(main, "splits_signature", None)
+    monkeypatch.setattr(main, "splits_blocks", {})
+    monkeypatch.setattr(main, "planned_groups", {})
+    monkeypatch.setattr(main, "planned_courses", {})
+    monkeypatch.setattr(main, "planned_signature", None)
+    monkeypatch.setattr(main, "planned_added", {})
+    monkeypatch.setattr(main, "search_index", None)
+    monkeypatch.setattr(main, "search_tokens", {})
+    main.load_group_kps()
+    return tmp_path
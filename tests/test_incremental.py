@@ -0,0 +1,51 @@
+import os
+
+import main
+
+
+def edit_splits(path, old, new):
+    with open(path, encoding="utf-8") as f:
+        content = f.read()
+    assert content.count(old) == 1
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content.replace(old, new))
+    # Та же длина файла: изменение должна заметить подпись по времени, а не по размеру
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+
+
+def test_edited_block_reparsed_alone(event, monkeypatch):
+    assert main.refresh_participants(force=True) == {"Ж09", "Ж10", "Ж11"}
+    before = main.current().participants
+
+    parsed = []
+    iter_tables = main.iter_rezult_tables
+
+    def spy(content, header=None, **kwargs):
+        for group, runners in iter_tables(content, header, **kwargs):
+            parsed.append(group)
+            yield group, runners
+
+    monkeypatch.setattr(main, "iter_rezult_tables", spy)
+    edit_splits(main.SPLITS_FILE, "<nobr>00:05:51</td>", "<nobr>00:05:52</td>")
+    assert main.refresh_participants() == {"Ж10"}
+    assert parsed == ["Ж10"]
+
+    after = main.current().participants
+    assert after["Ж09"] is before["Ж09"]
+    assert after["Ж11"] is before["Ж11"]
+    assert after["Ж10"] is not before["Ж10"]
+    assert after["Ж10"][1]["result"] == "00:05:52"
+    assert main.current().group_versions == {"Ж09": 1, "Ж10": 2, "Ж11": 1}
+
+    monkeypatch.setattr(main, "iter_rezult_tables", iter_tables)
+    full = main.parse_splits_html()
+    assert {g: cols.to_list() for g, cols in after.items()} == \
+           {g: main.group_columns(g, runners).to_list() for g, runners in full.items()}
+
+
+def test_unchanged_file_not_reparsed(event):
+    main.refresh_participants(force=True)
+    snapshot = main.current()
+    assert main.refresh_participants() == set()
+    assert main.current() is snapshot
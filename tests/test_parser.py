@@ -0,0 +1,17 @@
+import main
+
+
+def test_streaming_parser_matches_soup(event):
+    streamed = main.parse_splits_html()
+    soup = main.parse_splits_html_soup()
+    assert list(streamed) == ["Ж09", "Ж10", "Ж11"]
+    assert all(streamed.values())
+    assert streamed == soup
+
+
+def test_streaming_parser_chunk_boundaries(event):
+    # Таблицы и ячейки режутся между кусками как угодно — итог тот же, что и целиком
+    content = main.read_splits_content()
+    whole = list(main.iter_rezult_tables(content))
+    assert list(main.iter_rezult_tables(content, chunk_size=97)) == whole
+    assert dict(whole) == main.parse_splits_html_soup()
@@ -0,0 +1,58 @@
+import collections
+from concurrent.futures import Future
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def pdf(event, monkeypatch):
+    # Рендеринг без WeasyPrint: задание сразу готово, «PDF» — номер рендера
+    def submit_render(fn, html, reserved=False):
+        future = Future()
+        future.set_result((b"%%PDF-%d" % len(renders), 0.01))
+        renders.append(html)
+        return future
+
+    renders = []
+    monkeypatch.setattr(main, "submit_render", submit_render)
+    monkeypatch.setattr(main, "PDF_SPOOL_DIR", None)
+    monkeypatch.setattr(main, "PDF_CACHE_SIZE", 1)
+    monkeypatch.setattr(main, "pdf_jobs", collections.OrderedDict())
+    monkeypatch.setattr(main, "pdf_results", collections.OrderedDict())
+    monkeypatch.setattr(main, "pdf_inflight", {})
+    return renders
+
+
+def submit(client, name, **extra):
+    body = {"name": name, "group": "Ж09", "result": "00:06:23", "path": ["С2", "93", "85", "Ф1"], **extra}
+    response = client.post("/export-pdf", json=body)
+    assert response.status_code == 202
+    return response.get_json()["job_id"]
+
+
+def test_same_runner_shares_render(pdf):
+    client = main.app.test_client()
+    first = submit(client, "1. ИВАНОВА АННА", timestamp="17.10.2026, 10:00:00")
+    second = submit(client, "1. ИВАНОВА АННА", timestamp="17.10.2026, 10:00:05")
+    assert len(pdf) == 1
+    assert "Распечатано" not in pdf[0]
+    assert client.get(f"/export-pdf/{first}/download").data == client.get(f"/export-pdf/{second}/download").data
+
+
+def test_evicted_cache_hit_expires(pdf):
+    client = main.app.test_client()
+    rendered = submit(client, "1. ИВАНОВА АННА")
+    cached = submit(client, "1. ИВАНОВА АННА")
+    assert client.get(f"/export-pdf/{cached}").get_json()["status"] == "done"
+
+    submit(client, "2. ПЕТРОВА ОЛЬГА")
+    response = client.get(f"/export-pdf/{cached}")
+    assert response.status_code == 410
+    assert response.get_json()["status"] == "expired"
+    assert client.get(f"/export-pdf/{cached}/download").status_code == 410
+
+    # Задание, которое само рендерило, держит свой PDF до истечения срока задания
+    assert client.get(f"/export-pdf/{rendered}").get_json()["status"] == "done"
+    assert client.get(f"/export-pdf/{rendered}/download").data == b"%PDF-0"
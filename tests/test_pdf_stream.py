@@ -0,0 +1,43 @@
+import io
+import re
+
+from PIL import Image
+from pypdf import PdfReader
+
+from main import PdfStream
+
+
+def image_pdf(*widths):
+    # Документ как из рендерера: страница на участника, на каждой своя картинка — узнаём её по ширине
+    images = [Image.new("RGB", (width, 30), "red") for width in widths]
+    out = io.BytesIO()
+    images[0].save(out, "PDF", save_all=True, append_images=images[1:])
+    return out.getvalue()
+
+
+def test_pages_of_all_documents_in_order():
+    documents = [image_pdf(10, 20), image_pdf(30), image_pdf(40, 50, 60)]
+    stream = PdfStream()
+    chunks = [stream.header()] + [stream.append(pdf) for pdf in documents] + [stream.close()]
+    # Каждый документ уходит отдельным куском, как только он готов
+    assert all(chunks)
+    data = b"".join(chunks)
+
+    reader = PdfReader(io.BytesIO(data), strict=True)
+    widths = [page.images[0].image.size[0] for page in reader.pages]
+    assert widths == [10, 20, 30, 40, 50, 60]
+
+
+def test_xref_points_at_objects():
+    stream = PdfStream()
+    data = b"".join([stream.header(), stream.append(image_pdf(10)), stream.append(image_pdf(20, 30)),
+                     stream.close()])
+    start = int(re.search(rb"startxref\n(\d+)\n%%EOF\n$", data).group(1))
+    table = data[start:].split(b"trailer")[0].splitlines()
+    assert table[0] == b"xref"
+    count = int(table[1].split()[1])
+    for number, entry in enumerate(table[2:2 + count]):
+        assert len(entry) == 19
+        if number:
+            offset = int(entry[:10])
+            assert data[offset:].startswith(b"%d 0 obj\n" % number)
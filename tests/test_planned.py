@@ -0,0 +1,53 @@
+import os
+import shutil
+
+import main
+from entries import read_entries
+
+ENTRIES = (
+    "М12\t1\tСмирнов\tИван\t2013\tВымпел\tС2 93 85 Ф1\n"
+    "М12\t2\tКозлов\tПётр\t2013\tВымпел\tС2 93 137 85 Ф1\n"
+    "Классика\t3\tОрлов\tОлег\t1990\tДинамо\tС1 94 92 Ф1\n"
+)
+
+
+def write_entries(event):
+    with open(event / "participants.txt", "w", encoding="utf-8") as f:
+        f.write(ENTRIES)
+    # Группа из groups.txt, которой нет в протоколе: её покажет заявка
+    with open(event / "groups.txt", "a", encoding="utf-8") as f:
+        f.write("М12: С2 93 85 Ф1\n")
+    main.load_group_kps()
+
+
+def test_route_with_unknown_control_rejected(event):
+    write_entries(event)
+    points, _ = main.load_all_points()
+    courses, unknown, skipped = read_entries(main.PARTICIPANTS_FILE, points)
+    assert courses["М12"].names == ["Смирнов Иван"]
+    assert unknown == {"137": 2}
+    assert skipped == [2]
+
+
+def test_planned_courses_only_without_timing(event):
+    write_entries(event)
+    main.refresh_participants(force=True)
+    snapshot = main.current()
+    assert "Классика" not in snapshot.group_kps
+    assert "Классика" not in snapshot.participants
+    assert snapshot.participants["М12"] is main.planned_groups["М12"]
+    assert len(snapshot.participants["Ж09"]) == len(main.parse_splits_html()["Ж09"])
+
+    splits = main.SPLITS_FILE
+    shutil.move(splits, splits + ".bak")
+    main.refresh_participants()
+    assert main.current().group_kps["Классика"] == ["94", "92"]
+    assert len(main.current().participants["Классика"]) == 1
+
+    shutil.move(splits + ".bak", splits)
+    os.utime(splits)
+    main.refresh_participants()
+    snapshot = main.current()
+    assert "Классика" not in snapshot.group_kps
+    assert "Классика" not in snapshot.participants
+    assert len(snapshot.participants["Ж09"]) == len(main.parse_splits_html()["Ж09"])
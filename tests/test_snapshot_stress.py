@@ -0,0 +1,90 @@
+import os
+import shutil
+import threading
+import time
+
+import main
+from bench.stress_snapshot import torn_groups
+
+SECONDS = 1.0
+READERS = 4
+
+
+def swapped_event(event):
+    # Второе соревнование: у Ж09 и Ж10 дистанции и протоколы поменялись местами. Участники одной
+    # версии с дистанциями другой сразу дают путь мимо КП своей группы
+    variant = event / "swapped"
+    variant.mkdir()
+    for name in ("groups.txt", "splits.htm"):
+        with open(event / name, encoding="utf-8") as f:
+            content = f.read()
+        content = content.replace("Ж09", "\0").replace("Ж10", "Ж09").replace("\0", "Ж10")
+        with open(variant / name, "w", encoding="utf-8") as f:
+            f.write(content)
+    original = event / "original"
+    original.mkdir()
+    for name in ("groups.txt", "splits.htm"):
+        shutil.copyfile(event / name, original / name)
+    return [original, variant]
+
+
+def test_readers_never_see_torn_snapshot(event, monkeypatch):
+    sources = swapped_event(event)
+    ready = threading.Event()
+    ready.set()
+    monkeypatch.setattr(main, "data_ready", ready)
+    main.refresh_participants(force=True)
+    groups = list(main.current().group_kps)
+
+    # Проверка что-то доказывает, только если разрыв виден: участники одной версии, дистанции другой
+    first = main.current()
+    for name in ("groups.txt", "splits.htm"):
+        shutil.copyfile(sources[1] / name, event / name)
+    main.reload_data()
+    assert torn_groups(first.participants, main.current().group_kps, groups) == 2
+
+    counts = {"reads": 0, "torn": 0, "swaps": 0}
+    lock = threading.Lock()
+    stop = threading.Event()
+    errors = []
+
+    def reader():
+        try:
+            while not stop.is_set():
+                # Как запрос: снимок закреплён в before_request, а писатель тем временем публикует следующий
+                with main.app.test_request_context("/"):
+                    main.wait_for_data()
+                    participants = main.current().participants
+                    time.sleep(0.001)
+                    torn = torn_groups(participants, main.current().group_kps, groups)
+                with lock:
+                    counts["reads"] += 1
+                    counts["torn"] += torn
+        except Exception as e:
+            errors.append(e)
+
+    def writer():
+        try:
+            turn = 0
+            while not stop.is_set():
+                turn += 1
+                for name in ("groups.txt", "splits.htm"):
+                    shutil.copyfile(sources[turn % 2] / name, event / (name + ".tmp"))
+                    os.replace(event / (name + ".tmp"), event / name)
+                main.reload_data()
+                counts["swaps"] += 1
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(READERS)]
+    for thread in threads:
+        thread.start()
+    time.sleep(SECONDS)
+    stop.set()
+    for thread in threads:
+        thread.join(timeout=10)
+
+    assert not errors
+    assert counts["swaps"] >= 2 and counts["reads"] > 0
+    assert counts["torn"] == 0
+
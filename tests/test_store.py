@@ -0,0 +1,46 @@
+import copy
+
+from store import GroupColumns, ParticipantStore, sec_to_time, time_to_sec
+
+RUNNERS = {
+    "Ж10": [
+        {"name": "1. КУПРИЕНКО ЮЛИЯ", "group": "Ж10", "path": ["С2", "94", "92", "Ф1"],
+         "leg_times": ["0:27", "05:07"], "result": "00:05:44", "distance": 1520},
+        # Поле club есть только у части участников, у первых его нет вовсе
+        {"name": "2. ИВАНОВА АННА", "group": "Ж10", "path": ["С2", "94", "Ф1"],
+         "leg_times": ["1:02:03"], "result": "01:02:03", "distance": 830, "club": "Вымпел"},
+        {"name": "3. ПЕТРОВА ОЛЬГА", "group": "Ж10", "path": ["С2", "94", "92", "Ф1"],
+         "leg_times": ["-", ""], "result": "cнят", "distance": 1520},
+    ],
+    "М21": [
+        {"name": "1. СИДОРОВ ПЁТР", "group": "М21", "path": ["С1", "31", "Ф1"],
+         "leg_times": ["12:00"], "result": "00:12:00", "distance": 2100},
+    ],
+    "М80": [],
+}
+
+
+def test_group_columns_round_trip():
+    runners = copy.deepcopy(RUNNERS["Ж10"])
+    cols = GroupColumns.from_runners("Ж10", runners)
+    assert cols.to_list() == RUNNERS["Ж10"]
+    assert [cols[i] for i in range(-len(cols), 0)] == RUNNERS["Ж10"]
+    assert cols.path_codes(1) == ["С2", "94", "Ф1"]
+
+
+def test_raw_times_kept_verbatim():
+    # Эти строки не восстанавливаются из секунд — они хранятся как есть
+    for t in ("05:07", "1:02:03", ""):
+        assert sec_to_time(time_to_sec(t)) != t
+    cols = GroupColumns.from_runners("Ж10", RUNNERS["Ж10"])
+    assert sorted(cols.raw_times.values()) == ["", "05:07", "1:02:03"]
+    assert cols.leg_times(0) == ["0:27", "05:07"]
+    assert cols.leg_times(2) == ["-", ""]
+
+
+def test_participant_store_round_trip():
+    store = ParticipantStore.from_dict(copy.deepcopy(RUNNERS))
+    assert list(store) == ["Ж10", "М21", "М80"]
+    assert store.total() == 4
+    assert store.to_dict() == RUNNERS
+    assert ParticipantStore.from_dict(store.to_dict()).to_dict() == RUNNERS
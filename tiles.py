@@ -0,0 +1,118 @@
+import io
+import math
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+TILE_SIZE = 256
+
+
+class TilePyramid:
+    # Пирамида тайлов поверх map.png: уровень max_zoom — исходное разрешение,
+    # каждый уровень ниже вдвое меньше. Тайлы режутся лениво, держатся в LRU и на диске.
+    def __init__(self, image_path, cache_dir, memory_tiles=512, tile_size=TILE_SIZE):
+        self.image_path = image_path
+        self.tile_size = tile_size
+        self.memory_tiles = memory_tiles
+        st = os.stat(image_path)
+        self.version = f"{st.st_mtime_ns:x}{st.st_size:x}"
+        self.cache_dir = os.path.join(cache_dir, self.version)
+        with Image.open(image_path) as im:
+            self.width, self.height = im.size
+        self.max_zoom = max(0, math.ceil(math.log2(max(self.width, self.height) / tile_size)))
+        self._levels = {}
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+        self._level_lock = threading.Lock()
+
+    def meta(self):
+        return {
+            "width": self.width,
+            "height": self.height,
+            "tile_size": self.tile_size,
+            "max_zoom": self.max_zoom,
+            "version": self.version,
+        }
+
+    def nbytes(self):
+        with self._lock:
+            size = sum(len(data) for data in self._tiles.values())
+        return size + sum(level.width * level.height * len(level.getbands()) for level in list(self._levels.values()))
+
+    def level_size(self, z):
+        factor = 2 ** (self.max_zoom - z)
+        return max(1, round(self.width / factor)), max(1, round(self.height / factor))
+
+    def grid_size(self, z):
+        w, h = self.level_size(z)
+        return math.ceil(w / self.tile_size), math.ceil(h / self.tile_size)
+
+    def _level(self, z):
+        level = self._levels.get(z)
+        if level is None:
+            with self._level_lock:
+                level = self._level_unlocked(z)
+        return level
+
+    def _level_unlocked(self, z):
+        level = self._levels.get(z)
+        if level is None:
+            if z == self.max_zoom:
+                level = Image.open(self.image_path)
+                level.load()
+            else:
+                level = self._level_unlocked(z + 1).resize(self.level_size(z), Image.LANCZOS)
+            self._levels[z] = level
+        return level
+
+    def _render(self, z, x, y):
+        level = self._level(z)
+        ts = self.tile_size
+        box = (x * ts, y * ts, min((x + 1) * ts, level.width), min((y + 1) * ts, level.height))
+        tile = level.crop(box)
+        if tile.size != (ts, ts):
+            # Краевой тайл добиваем прозрачностью, чтобы все тайлы уровня были одного размера
+            padded = Image.new("RGBA", (ts, ts), (0, 0, 0, 0))
+            padded.paste(tile.convert("RGBA"), (0, 0))
+            tile = padded
+        buf = io.BytesIO()
+        tile.save(buf, format="PNG")
+        return buf.getvalue()
+
+    def tile(self, z, x, y):
+        if not 0 <= z <= self.max_zoom:
+            return None
+        cols, rows = self.grid_size(z)
+        if not (0 <= x < cols and 0 <= y < rows):
+            return None
+
+        key = (z, x, y)
+        with self._lock:
+            data = self._tiles.get(key)
+            if data is not None:
+                self._tiles.move_to_end(key)
+                return data
+
+        path = os.path.join(self.cache_dir, str(z), str(x), f"{y}.png")
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            data = self._render(z, x, y)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, path)
+            except OSError as e:
+                print(f"[WARNING] Не удалось сохранить тайл {z}/{x}/{y}: {e}")
+
+        with self._lock:
+            self._tiles[key] = data
+            self._tiles.move_to_end(key)
+            while len(self._tiles) > self.memory_tiles:
+                self._tiles.popitem(last=False)
+        return data